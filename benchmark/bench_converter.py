@@ -0,0 +1,190 @@
+"""
+Encode/decode throughput and peak memory of every codec of the converter, over scalars, lists of dataclasses, nested
+dataclasses and DataFrames of several sizes. The results are printed and written to a json file which can be compared
+with the one of a previous run.
+
+    python benchmark/bench_converter.py [--sizes 1 1000 100000] [--codecs json msgpack ...]
+                                        [--output bench_converter.json] [--compare previous.json]
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import List
+
+from pyrolysis.common import errors  # noqa: F401, import order of pyrolysis.common
+from pyrolysis.common import pandas_df_type
+from pyrolysis.common.converter import Converter, registry
+
+
+@dataclass
+class User:
+    id: int = field()
+    name: str = field()
+    score: float = field()
+
+
+@dataclass
+class Item:
+    id: int = field()
+    name: str = field()
+    created: date = field()
+    user: User = field()
+    tags: List[str] = field()
+
+
+def scalars():
+    return [('int', 42, int), ('str', 'pyrolysis', str), ('datetime', datetime(2020, 1, 1, 12, 30), datetime)]
+
+
+def payloads(sizes):
+    """
+    :return: the tuples (name, value, class, number of items) to benchmark
+    """
+    res = [('scalar_' + name, val, cls, 1) for name, val, cls in scalars()]
+    for n in sizes:
+        res.append(('objects_%d' % n, [User(id=i, name='user %d' % i, score=i / 2) for i in range(n)], User, n))
+    for n in sizes:
+        res.append(('nested_%d' % n, [Item(id=i, name='item %d' % i, created=date(2020, 1, 1 + i % 28),
+                                           user=User(id=i, name='user', score=1.5), tags=['a', 'b'])
+                                      for i in range(n)], Item, n))
+    if pandas_df_type is not type(None):
+        import numpy
+        for n in sizes:
+            df = pandas_df_type({'id': numpy.arange(n), 'value': numpy.linspace(0, 1, n),
+                                 'name': ['row %d' % i for i in range(n)]})
+            res.append(('dataframe_%d' % n, df, pandas_df_type, n))
+    return res
+
+
+def codecs(names=None):
+    """
+    :return: the couples (codec name, mimetype), one mimetype per codec
+    """
+    res = {}
+    for mimetype, codec in registry.codecs.items():
+        if codec.name not in res and (not names or codec.name in names):
+            res[codec.name] = mimetype
+    return list(res.items())
+
+
+def same(a, b):
+    if isinstance(a, pandas_df_type):
+        return isinstance(b, pandas_df_type) and a.equals(b)
+    return a == b
+
+
+def timed(f, min_time):
+    """
+    :return: the result of f and its best execution time, f being called until min_time is elapsed
+    """
+    best = None
+    total = 0.0
+    while best is None or total < min_time:
+        time_start = time.perf_counter()
+        res = f()
+        t = time.perf_counter() - time_start
+        total += t
+        best = t if best is None else min(best, t)
+    return res, best
+
+
+def peak_memory(f):
+    tracemalloc.start()
+    try:
+        f()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(conv, mimetype, val, cls, n, min_time):
+    many = isinstance(val, list)
+    encode = lambda: conv.convert(mimetype, val)
+    try:
+        data, t_encode = timed(encode, min_time)
+        decode = lambda: conv.revert(mimetype, data, cls=cls, many=many)
+        back, t_decode = timed(decode, min_time)
+    except Exception as e:
+        return {'error': type(e).__name__ + ': ' + (str(e) or str(getattr(e, 'data', '')))[:200]}
+    size = len(data)
+    return {
+        'items': n,
+        'bytes': size,
+        'roundtrip': same(val, back),
+        'encode': {'time': t_encode, 'items_per_s': n / t_encode, 'mb_per_s': size / t_encode / 1e6,
+                   'peak_memory': peak_memory(encode)},
+        'decode': {'time': t_decode, 'items_per_s': n / t_decode, 'mb_per_s': size / t_decode / 1e6,
+                   'peak_memory': peak_memory(decode)},
+    }
+
+
+def run(sizes, names=None, min_time=0.2):
+    conv = Converter()
+    conv.register(User)
+    conv.register(Item)
+    results = []
+    for payload, val, cls, n in payloads(sizes):
+        for name, mimetype in codecs(names):
+            res = measure(conv, mimetype, val, cls, n, min_time)
+            res.update(codec=name, mimetype=mimetype, payload=payload)
+            results.append(res)
+            report(res)
+    return {
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'json_backend': conv.json.name,
+        'date': datetime.now().isoformat(),
+        'results': results,
+    }
+
+
+def report(res):
+    if 'error' in res:
+        print('{:>18} {:>22}  {}'.format(res['payload'], res['codec'], res['error'][:80]))
+        return
+    print('{:>18} {:>22} {:>12} {:>14.0f} {:>14.0f} {:>12} {:>12} {}'.format(
+        res['payload'], res['codec'], res['bytes'], res['encode']['items_per_s'], res['decode']['items_per_s'],
+        res['encode']['peak_memory'], res['decode']['peak_memory'], '' if res['roundtrip'] else 'MISMATCH'))
+
+
+def compare(previous, current):
+    """
+    Print the speedups of current over previous, per payload and codec.
+    """
+    key = lambda r: (r['payload'], r['codec'])
+    before = dict((key(r), r) for r in previous['results'] if 'error' not in r)
+    print('{:>18} {:>22} {:>10} {:>10} {:>10}'.format('payload', 'codec', 'encode', 'decode', 'size'))
+    for r in current['results']:
+        old = before.get(key(r))
+        if old is None or 'error' in r:
+            continue
+        print('{:>18} {:>22} {:>9.2f}x {:>9.2f}x {:>9.2f}x'.format(
+            r['payload'], r['codec'], old['encode']['time'] / r['encode']['time'],
+            old['decode']['time'] / r['decode']['time'], r['bytes'] / old['bytes'] if old['bytes'] else 1.0))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark of the codecs of the converter')
+    parser.add_argument('--sizes', type=int, nargs='*', default=[1, 1000, 100000])
+    parser.add_argument('--codecs', nargs='*', help='names of the codecs, all by default')
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimum time spent per measure, in seconds')
+    parser.add_argument('--output', default='bench_converter.json')
+    parser.add_argument('--compare', help='results of a previous run')
+    args = parser.parse_args(argv)
+    print('{:>18} {:>22} {:>12} {:>14} {:>14} {:>12} {:>12}'.format(
+        'payload', 'codec', 'bytes', 'encode (it/s)', 'decode (it/s)', 'encode mem', 'decode mem'))
+    res = run(args.sizes, args.codecs, args.min_time)
+    with open(args.output, 'w') as f:
+        json.dump(res, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), res)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Compare the generated dataclass serializers with the marshmallow schemas.
+
+    python benchmark/bench_serializer.py [size ...]
+"""
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from typing import List
+
+from pyrolysis.common import errors  # noqa: F401, import order of pyrolysis.common
+from pyrolysis.common.converter import Converter
+
+
+@dataclass
+class User:
+    id: int = field()
+    name: str = field()
+    roles: List[str] = field()
+
+
+@dataclass
+class Item:
+    id: int = field()
+    name: str = field()
+    created: date = field()
+    user: User = field()
+
+
+def measure(f, *args):
+    time_start = time.perf_counter()
+    res = f(*args)
+    return res, time.perf_counter() - time_start
+
+
+def run(size):
+    conv = Converter()
+    conv.register(Item)
+    items = [Item(id=i, name='item %d' % i, created=date(2020, 1, 1), user=User(id=i, name='user', roles=['a']))
+             for i in range(size)]
+    res = {}
+    for fast in [False, True]:
+        conv.fast_serializers = fast
+        data, t_dump = measure(conv.schema_convert, items)
+        back, t_load = measure(conv.schema_revert, data, Item)
+        assert back == items
+        res['compiled' if fast else 'marshmallow'] = (t_dump, t_load)
+    return res
+
+
+def main(sizes):
+    print('{:>8} {:>12} {:>10} {:>10} {:>8}'.format('size', 'path', 'dump (s)', 'load (s)', 'speedup'))
+    for size in sizes:
+        res = run(size)
+        ref = sum(res['marshmallow'])
+        for k, (t_dump, t_load) in res.items():
+            print('{:>8} {:>12} {:>10.4f} {:>10.4f} {:>7.1f}x'.format(size, k, t_dump, t_load, ref / (t_dump + t_load)))
+
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [1000, 100000])
@@ -5,4 +5,4 @@ serv = service.ClientService('http://localhost:4000', username='myuser', passwor
                                  api_key='azerty').build()
 
 serv.create_item(Item(name='item 1'))
-items = serv.get_all_items()
+items = list(serv.get_all_items())
@@ -1,4 +1,3 @@
-from datetime import datetime
 from typing import List
 import flask
 from flask import g
@@ -42,7 +41,6 @@ class MyJWTSecurity(JWTHeader):
 
 app = ServerService(flsk)
 app.register(Item)
-modification_date = None
 
 basic = BasicSecurity(name='test_sec1')
 authenticated = basic.add_role("authenticated")
@@ -50,19 +48,17 @@ apikey = ApiKeySecurity(name='test_sec2', header='x-api-key')
 admin = apikey.add_role("admin")
 
 
-@app.get('/items', roles=authenticated and admin)
+@app.get('/items', roles=authenticated and admin, collection='items', page_size=100, page_key='id')
 def get_all_items() -> List[Item]:
     """
     Example 1 for a unit test
 
     :return: return data
     """
-    global modification_date
-    app.check_if_modified_since(modification_date)
-    return db.session.query(Item).all()
+    return db.session.query(Item)
 
 
-@app.post('/items', roles=authenticated)
+@app.post('/items', roles=authenticated, collection='items')
 @transaction(db.session)
 def create_item(e: Item) -> int:
     """
@@ -72,8 +68,6 @@ def create_item(e: Item) -> int:
     :return: return data
     """
     e.userid = g.user.id
-    global modification_date
-    modification_date = datetime.now()
     return db.session.query(Item).add(e)
 
 
@@ -88,7 +82,7 @@ def get_item(id: int) -> Item:
     return db.session.query(Item).get(id)
 
 
-@app.delete('/items/<p>', roles=authenticated)
+@app.delete('/items/<p>', roles=authenticated, collection='items')
 @transaction(db.session)
 def delete_item(id: int) -> int:
     """
@@ -97,12 +91,10 @@ def delete_item(id: int) -> int:
     :param id: example of description
     :return: return data
     """
-    global modification_date
-    modification_date = datetime.now()
     return db.session.query(Item).delete(id)
 
 
-@app.put('/items/<p>', roles=authenticated)
+@app.put('/items/<p>', roles=authenticated, collection='items')
 @transaction(db.session)
 def put_item(e: Item) -> int:
     """
@@ -111,6 +103,4 @@ def put_item(e: Item) -> int:
     :param e: example of description
     :return: return data
     """
-    global modification_date
-    modification_date = datetime.now()
     return db.session.query(Item).update(e)
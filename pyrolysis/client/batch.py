@@ -0,0 +1,105 @@
+from concurrent.futures import Future
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from pyrolysis.common import errors
+from pyrolysis.common.converter import application
+
+
+def as_response(res, url):
+    """
+    :param res: the {status, headers, body} of a call of a batch
+    :return: a response of requests, decoded like the response of a single call
+    """
+    response = requests.Response()
+    response.status_code = res['status']
+    response.headers = CaseInsensitiveDict(res.get('headers') or {})
+    body = res.get('body') or b''
+    response._content = body.encode() if isinstance(body, str) else body
+    response.encoding = 'utf-8'
+    response.url = url
+    return response
+
+
+class Batch:
+    """
+    Context manager in which the calls of the methods of a service are queued and return futures. The calls are sent
+    in one request to the /batch route of the service when it exits, or as soon as max_calls calls are queued.
+
+        with service.batch():
+            futures = [api.get_item(i) for i in ids]
+        items = [f.result() for f in futures]
+
+    The batch request is sent with the authentication of the method of its first call.
+    """
+
+    def __init__(self, service, max_calls=1000):
+        self.service = service
+        self.max_calls = max_calls
+        self.calls = []
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = self.service.current_batch()
+        self.service.batches.current = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.service.batches.current = self.previous
+        if exc_type is None:
+            self.send()
+        else:
+            for call in self.calls:
+                call[-1].cancel()
+            self.calls = []
+
+    def resolved(self, res):
+        future = Future()
+        future.set_result(res)
+        return future
+
+    def submit(self, method, args, kwargs, key=None):
+        """
+        Queue a call.
+
+        :return: the future of its result
+        """
+        headers, path, query, cookies, body = method.prepare(args, kwargs)
+        arguments = dict(path, **query)
+        arguments.update(cookies)
+        if method.body_parameter and body is not None:
+            arguments[method.body_parameter.name] = body.encode() if isinstance(body, str) else body
+        future = Future()
+        self.calls.append((method, [method.name, arguments, headers], kwargs, key, future))
+        if len(self.calls) >= self.max_calls:
+            self.send()
+        return future
+
+    def send(self):
+        """
+        Send the queued calls, and set the results or the exceptions of their futures.
+        """
+        calls, self.calls = self.calls, []
+        if not calls:
+            return
+        import msgpack
+        try:
+            response = self.service.session.post(self.service.batch_url,
+                                                 data=msgpack.packb([c[1] for c in calls], use_bin_type=True),
+                                                 headers={'Content-Type': application.msgpack,
+                                                          'Accept': application.msgpack},
+                                                 **calls[0][0].request_args)
+            errors.check(response)
+            results = msgpack.unpackb(response.content, raw=False)
+            if len(results) != len(calls):
+                raise errors.ServerError(calls=len(calls), results=len(results), status='conflict')
+        except Exception as e:
+            for call in calls:
+                call[-1].set_exception(e)
+            raise
+        for (method, _, kwargs, key, future), res in zip(calls, results):
+            try:
+                future.set_result(method.decode(as_response(res, method.url), kwargs, key))
+            except Exception as e:
+                future.set_exception(e)
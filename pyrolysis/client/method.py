@@ -1,10 +1,12 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 import time
 import requests.utils
 
+from pyrolysis import common
 from pyrolysis.client import parameter
-from pyrolysis.common import swagger, support, converter
+from pyrolysis.common import swagger, support, converter, compression
 from pyrolysis.common import errors
 from pyrolysis.client.parameter import create_parameter
 from http import HTTPStatus as status
@@ -14,6 +16,9 @@ from pyrolysis.common.resource import Resource
 
 
 logger = logging.getLogger(__name__)
+stream_accept = ', '.join(([converter.application.arrow] if common.has_arrow else []) +
+                          [converter.application.msgpack_ext, converter.application.ndjson, converter.application.msgpack, converter.application.csv,
+                           converter.text.csv, converter.application.json + ';q=0.5'])
 
 
 class SwaggerMethod:
@@ -33,9 +38,12 @@ class SwaggerMethod:
         self.auth_methods = []
         self.responses = {}
         self.array = False
+        self.paged = False
         self.pos = 0
         self.__doc__ = doc
         self.encoding = converter.application.json
+        self.content_encoding = None
+        self.accept = None
         self.with_checks = parent.with_checks
         self.statsd = parent.statsd
         self.request_args = {'verify': False, 'timeout': parent.timeout}
@@ -45,19 +53,51 @@ class SwaggerMethod:
             self.request_args['cert'] = (self.parent.key, self.parent.cert)
 
     def __call__(self, *args, **kwargs):
-        if self.parent.cache and self.http_method == 'GET':
+        stream = kwargs.get('_stream', False)
+        batch = None if stream else self.parent.current_batch()
+        if self.parent.cache and self.http_method == 'GET' and not stream:
             key = call_signature(self.name, args, kwargs)
             if key in self.parent.cache:
                 logger.debug(dict(status="Caching", function=self.name))
+                if batch is not None:
+                    return batch.resolved(self.parent.cache[key])
                 return self.parent.cache[key]
         else:
             key = None
+        if batch is not None:
+            return batch.submit(self, args, kwargs, key)
 
         logger.debug(dict(status="Calling", function=self.name))
         if self.statsd:
-            time_start = time.clock()
+            time_start = time.perf_counter()
+        request_header, request_path, request_parameters, request_cookies, request_payload = \
+            self.prepare(args, kwargs)
+        if self.statsd:
+            time_prepare = time.perf_counter()
+            self.statsd.timing(self.name + '.encoding', time_prepare - time_start)
+        url = self.url.format(**dict((k, requests.utils.quote(v)) for k, v in request_path.items()))
+        response = self.parent.session.request(self.http_method, url,
+                                               params=request_parameters,
+                                               data=request_payload,
+                                               headers=request_header,
+                                               cookies=request_cookies,
+                                               stream=stream,
+                                               **self.request_args)
+        if self.statsd:
+            self.statsd.timing(self.name + '.request', time.perf_counter() - time_prepare)
+        if self.paged and not stream:
+            return self.pages(response, kwargs, request_header, request_cookies)
+        return self.decode(response, kwargs, key)
+
+    def prepare(self, args, kwargs):
+        """
+        Encode the arguments of a call.
+
+        :return: the tuple (headers, path parameters, query parameters, cookies, body) of its request
+        """
+        stream = kwargs.get('_stream', False)
         request_header = dict((p.name, p.extract(*args, **kwargs)) for p in self.header_parameters)
-        request_path = dict((p.name, requests.utils.quote(p.extract(*args, **kwargs))) for p in self.path_parameters)
+        request_path = dict((p.name, p.extract(*args, **kwargs)) for p in self.path_parameters)
         request_payload = self.body_parameter.extract(*args, **kwargs) if self.body_parameter else None
         request_parameters = dict((p.name, p.extract(*args, **kwargs)) for p in self.query_parameters)
         request_cookies = dict((p.name, p.extract(*args, **kwargs)) for p in self.cookie_parameters)
@@ -66,35 +106,44 @@ class SwaggerMethod:
             request_header['X-SESSION-REQUEST'] = str(self.parent.call_nb)
         if request_payload:
             request_header['Content-Type'] = self.encoding
-        if self.statsd:
-            time_prepare = time.clock()
-            self.statsd.timing(self.name + '.encoding', time_prepare - time_start)
-        response = self.parent.session.request(self.http_method, self.url.format(**request_path),
-                                        params=request_parameters,
-                                        data=request_payload,
-                                        headers=request_header,
-                                        cookies=request_cookies,
-                                        **self.request_args)
-        if self.statsd:
-            time_req = time.clock()
-            self.statsd.timing(self.name + '.request', time_req - time_prepare)
+            if self.content_encoding and len(request_payload) >= self.parent.compress_threshold:
+                if isinstance(request_payload, str):
+                    request_payload = request_payload.encode()
+                request_payload = self.content_encoding.compress(request_payload, self.parent.compress_level)
+                request_header['Content-Encoding'] = self.content_encoding.name
+        if stream:
+            request_header['Accept'] = stream_accept
+        elif self.accept:
+            request_header['Accept'] = self.accept
+        return request_header, request_path, request_parameters, request_cookies, request_payload
 
+    def decode(self, response, kwargs, key=None):
+        """
+        Decode the response of a call, and cache it if key is not None.
+        """
+        stream = kwargs.get('_stream', False)
+        if self.statsd:
+            time_req = time.perf_counter()
         errors.check(response)
         logger.debug(dict(status="Valid", function=self.name))
         if response.status_code == status.ACCEPTED:
             loc = response.headers['location']
             return Resource(uri=loc)
+        if stream:
+            return self.iterate(response, kwargs.get('_return', self.return_type))
         if response.status_code == status.NO_CONTENT or len(response.content) == 0 or 'content-type' not in response.headers:
             return None
-        contenttype, encoding = support.decode_contenttype(response.headers['content-type'])
+        contenttype = response.headers['content-type']
+        encoding = support.decode_contenttype(contenttype)[1]
         contentclass = kwargs.get('_return', self.return_type)
         ctrl = response.headers.get('cache-control', 'public')
+        if self.parent.codec(contenttype).unsafe and not self.parent.trusted:
+            raise errors.BadRequest(mimetype=contenttype, status='unknown')
         res = self.parent.revert(contenttype, response, cls=contentclass, many=self.array, encoding=encoding, **self.parent.convert_options)
-        if self.parent.cache and self.http_method == 'GET' and ctrl not in ['no-cache', 'no-store']:
+        if self.parent.cache and key is not None and ctrl not in ['no-cache', 'no-store']:
             self.parent.cache[key] = res
         if self.statsd:
-            time_end = time.clock()
-            self.statsd.timing(self.name + '.decoding', time_end - time_req)
+            self.statsd.timing(self.name + '.decoding', time.perf_counter() - time_req)
         if contentclass == Resource.__name__:
             return Resource(uri=response.headers['location'],
                             output=res,
@@ -102,12 +151,77 @@ class SwaggerMethod:
                             expires=response.headers['expires'])
         return res
 
+    def pages(self, response, kwargs, headers, cookies):
+        """
+        Iterate the elements of the pages of a paged operation, following the next links. The next page is requested
+        while the elements of the current one are consumed.
+        """
+        executor = ThreadPoolExecutor(1, thread_name_prefix='pyrolysis-page')
+        future = None
+        try:
+            while True:
+                page = self.decode(response, kwargs)
+                link = response.links.get('next')
+                future = link and executor.submit(self.parent.session.request, 'GET', link['url'], headers=headers,
+                                                  cookies=cookies, **self.request_args)
+                for x in page or []:
+                    yield x
+                if not future:
+                    return
+                response = future.result()
+                future = None
+        finally:
+            if future and not future.cancel():
+                future.add_done_callback(lambda f: f.exception() is None and f.result().close())
+            executor.shutdown(wait=False)
+
+    def iterate(self, response, contentclass):
+        """
+        Decode the elements of a streamed response while it is being received.
+        """
+        try:
+            if response.status_code == status.NO_CONTENT or 'content-type' not in response.headers:
+                return
+            contenttype = response.headers['content-type']
+            encoding = support.decode_contenttype(contenttype)[1]
+            codec = self.parent.codec(contenttype)
+            if codec.unsafe and not self.parent.trusted:
+                raise errors.BadRequest(mimetype=contenttype, status='unknown')
+            for x in codec.iterdecode(self.parent, response, cls=contentclass, many=self.array, encoding=encoding,
+                                      **self.parent.convert_options):
+                yield x
+        finally:
+            response.close()
+
     def load(self, details):
-        self.encoding = details.get('consumes', [converter.application.text])[0]
+        consumes = details.get('consumes', [converter.application.text])
+        self.encoding = consumes[0]
+        if common.has_arrow and converter.application.arrow in consumes:
+            self.encoding = converter.application.arrow
+        elif converter.application.msgpack_ext in consumes:
+            self.encoding = converter.application.msgpack_ext
+        if self.parent.trusted:
+            if converter.application.pickle5 in consumes:
+                self.encoding = converter.application.pickle5
+            if converter.application.pickle5 in details.get('produces', []):
+                self.accept = converter.application.pickle5 + ', */*;q=0.5'
+        for name in details.get('x-content-encodings', []):
+            if name in compression.compressions:
+                self.content_encoding = compression.compressions[name]
+                break
         for name, detail3 in details.get('responses', {}).items():
             self.responses[name] = detail3.get('description', '')
             if name == '200':
-                self.return_type, self.array = swagger.get_type(detail3)
+                self.return_type, self.array = swagger.get_type(detail3.get('schema', detail3))
+                self.paged = 'Link' in detail3.get('headers', {}) and \
+                    any(p['in'] == 'query' and p['name'] == 'cursor' for p in details.get('parameters', []))
+        layout = self.parent.layout
+        if self.array and layout and self.accept is None:
+            preferred = [converter.layout_mimetype(m, layout)
+                         for m in [converter.application.msgpack, converter.application.json]]
+            preferred = [m for m in preferred if m in details.get('produces', [])]
+            if preferred:
+                self.accept = ', '.join(preferred[:1] + [m + ';q=0.9' for m in preferred[1:]]) + ', */*;q=0.5'
 
         for detail3 in details.get('parameters', []):
             k = detail3['in']
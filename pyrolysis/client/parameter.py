@@ -14,6 +14,7 @@ class SwaggerParameter:
         self.type = type
         self.parent = parent
         self.enum = enum and set(enum)
+        self.codec = parent.parent.codecs.get(encoding)
 
     def extract(self, *args, **kwargs):
         res = None
@@ -25,9 +26,11 @@ class SwaggerParameter:
             raise errors.BadRequest(name=self.name, status='missing')
         if res is None:
             return None
+        if self.codec is None:
+            raise errors.BadRequest(name=self.name, mimetype=self.encoding, status='unknown')
         try:
             srv = self.parent.parent
-            return srv.convert(self.encoding, res, checker=self.checker, **srv.convert_options)
+            return self.codec.encode(srv, res, checker=self.checker, **srv.convert_options)
         except errors.ClientError as e:
             e.put(name=self.name)
             raise e
@@ -2,12 +2,14 @@ import json
 import datetime
 import logging
 import platform
+import threading
 
 import requests
 import requests_auth.authentication
 from pyrolysis import common, client
 from requests.adapters import HTTPAdapter
 
+from pyrolysis.client.batch import Batch
 from pyrolysis.client.checker import create_checker
 from pyrolysis.common import converter
 from pyrolysis.common.dict_object import DictObject
@@ -17,10 +19,14 @@ logger = logging.getLogger(__name__)
 
 
 class ClientService(converter.Converter):
+    compress_threshold = 65536
+    compress_level = None
+    layout = 'columns'
+
     def __init__(self, base='http://localhost', track=False, agent=None,
                  username=None, password=None, api_key=None, proxies=(), port=8000, success_display_time=60,
                  failure_display_time=60, timeout=60, cache=None, max_retries=5, with_checks=True, statsd=None,
-                 key=None, cert=None, headers={}, no_oauth2=False):
+                 key=None, cert=None, headers={}, no_oauth2=False, trusted=False):
         self.methods = {}
         self.base = base
         self.cache = None
@@ -42,14 +48,19 @@ class ClientService(converter.Converter):
         self.cert = cert
         self.with_checks = with_checks
         self.no_oauth2 = no_oauth2
+        self.trusted = trusted
         self.session = self.create_session(agent, headers, max_retries, track, username)
         self.convert_options = {}
+        self.batch_url = base + '/batch'
+        self.batches = threading.local()
 
     def create_session(self, agent, headers, max_retries, track, username):
         session = requests.Session()
         session.mount(self.base, HTTPAdapter(max_retries=max_retries))
         session.headers['User-Agent'] = agent or 'Pyrolysis-v' + client.__version__
-        session.headers['Accept'] = ' '.join(converter.mimetypes)
+        session.headers['Accept'] = ', '.join([converter.application.msgpack_ext] +
+                                              [m + ';q=0.9' for m in converter.mimetypes
+                                               if m != converter.application.msgpack_ext])
         session.headers.update(headers)
         if track:
             session.headers['X-SESSION-LOGIN'] = username
@@ -98,6 +109,8 @@ class ClientService(converter.Converter):
         for path, detail1 in swagger.get('paths', {}).items():
             for method, detail2 in detail1.items():
                 method_name = detail2['operationId']
+                if method_name == 'batch' and detail2.get('tags') == ['batch']:
+                    self.batch_url = self.base + path
                 m = SwaggerMethod(self, method_name, method, self.base + path, detail2['summary'], detail2['tags'])
                 for security_items in detail2.get('security', []):
                     lst = [self.auth[security] for security in security_items.keys()]
@@ -109,6 +122,19 @@ class ClientService(converter.Converter):
                 self.methods[method_name] = m
                 m.load(detail2)
 
+    def batch(self, max_calls=1000):
+        """
+        :return: a context manager in which the calls of the methods return futures, the calls being sent in one
+        request, see Batch
+        """
+        return Batch(self, max_calls)
+
+    def current_batch(self):
+        """
+        :return: the batch of the current thread, None if its calls are not batched
+        """
+        return getattr(self.batches, 'current', None)
+
     def add_auth(self, name, auth):
         self.auth[name] = auth
 
@@ -6,12 +6,30 @@ try:
 except ImportError:
     pandas_df_type = type(None)
 
+try:
+    import numpy
+    has_numpy = True
+except ImportError:
+    has_numpy = False
+
 try:
     import msgpack
     has_msgpack = True
 except ImportError:
     has_msgpack = False
 
+try:
+    import pyarrow
+    has_arrow = True
+except ImportError:
+    has_arrow = False
+
+try:
+    import xxhash
+    has_xxhash = True
+except ImportError:
+    has_xxhash = False
+
 try:
     import os
     login = os.getlogin()
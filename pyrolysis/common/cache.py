@@ -1,12 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
 
 from pyrolysis.common.support import call_signature
 
 
+class Flight:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalescing of concurrent identical calls: the first caller of a key (the leader) runs the function, the callers
+    of the same key arriving while it runs (the followers) wait for its result instead of running it again. The
+    exception of a leader is raised to its followers, a follower waiting more than timeout seconds runs the function
+    itself.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self.flights = {}
+        self.lock = threading.Lock()
+        self.counters = {'leaders': 0, 'followers': 0, 'timeouts': 0}
+
+    def do(self, key, func, timeout=None):
+        """
+        :param func: a function without arguments
+        :param timeout: the maximal wait of the followers in seconds, the timeout of the SingleFlight by default
+        :return: the result of func, run by this call or by the leader of the key
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+                self.counters['leaders'] += 1
+            else:
+                self.counters['followers'] += 1
+        if not leader:
+            if flight.done.wait(self.timeout if timeout is None else timeout):
+                if flight.error is not None:
+                    raise flight.error
+                return flight.result
+            with self.lock:
+                self.counters['timeouts'] += 1
+            return func()
+        try:
+            flight.result = func()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, flights=len(self.flights))
+
+
 class CacheObject:
-    def __init__(self, proxy, cache):
+    """
+    Proxy caching the results of the methods of an object by arguments. With coalesce, concurrent calls missing the
+    same key wait for the first one instead of calling the object, see SingleFlight.
+    """
+
+    def __init__(self, proxy, cache, coalesce=False, timeout=None):
         self.proxy = proxy
         self.cache = cache
+        self.flights = SingleFlight(timeout) if coalesce else None
 
     def __getattr__(self, item):
         def f(*args, **kwargs):
@@ -14,11 +84,16 @@ class CacheObject:
             if key in self.cache:
                 return self.cache[key]
             func = getattr(self.proxy, item)
-            res = func(*args, **kwargs)
-            self.cache[key] = res
-            return res
+            if self.flights is not None:
+                return self.flights.do(key, lambda: self.fill(key, func, args, kwargs))
+            return self.fill(key, func, args, kwargs)
         return f
 
+    def fill(self, key, func, args, kwargs):
+        res = func(*args, **kwargs)
+        self.cache[key] = res
+        return res
+
 
 def caching(cache=None):
     if cache is None:
@@ -37,16 +112,91 @@ def caching(cache=None):
     return decorator
 
 
-def memory_cache(proxy, size, ttl):
+def memory_cache(proxy, size, ttl, coalesce=False):
     import cachetools
-    return CacheObject(proxy, cachetools.TTLCache(size, ttl))
+    return CacheObject(proxy, cachetools.TTLCache(size, ttl), coalesce)
 
 
-def disk_cache(proxy, filename):
+def disk_cache(proxy, filename, coalesce=False):
     import shelve
-    return CacheObject(proxy, shelve.open(filename))
+    return CacheObject(proxy, shelve.open(filename), coalesce)
 
 
-def redis_cache(proxy, host='localhost', port=6379, db=0):
+def redis_cache(proxy, host='localhost', port=6379, db=0, coalesce=False):
     import redis
-    return CacheObject(proxy, redis.Redis(host=host, port=port, db=db))
+    return CacheObject(proxy, redis.Redis(host=host, port=port, db=db), coalesce)
+
+
+class ResponseCache:
+    """
+    In-process cache of encoded responses: least recently used entries are evicted first so that the total size of
+    the bodies stays under max_bytes, and each entry expires after its ttl. The entries are tagged with the path of
+    the request, invalidate removes the ones below a path prefix.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=60):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def get(self, key):
+        """
+        :return: the value of the key, None if it is missing or expired
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            if entry[0] < time.monotonic():
+                self.remove(key)
+                self.counters['expirations'] += 1
+                self.counters['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return entry[3]
+
+    def put(self, key, value, size, path='', ttl=None):
+        """
+        :param size: the size of the value in bytes, values larger than max_bytes are not stored
+        :param path: the path of the request, used by invalidate
+        """
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            while self.size + size > self.max_bytes:
+                self.remove(next(iter(self.entries)))
+                self.counters['evictions'] += 1
+            self.entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), size, path, value)
+            self.size += size
+
+    def remove(self, key):
+        entry = self.entries.pop(key)
+        self.size -= entry[1]
+
+    def invalidate(self, prefix=''):
+        """
+        Remove the entries of the requests whose path is prefix or below it (whole segments: /items does not match
+        /items_archive), all of them by default.
+
+        :return: the number of entries removed
+        """
+        base = prefix.rstrip('/')
+        parent = base + '/'
+        with self.lock:
+            keys = [k for k, v in self.entries.items()
+                    if not prefix or v[2] in (prefix, base) or v[2].startswith(parent)]
+            for k in keys:
+                self.remove(k)
+            self.counters['invalidations'] += len(keys)
+            return len(keys)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, entries=len(self.entries), bytes=self.size)
@@ -0,0 +1,210 @@
+import time
+
+from pyrolysis.common import errors
+
+
+class Codec:
+    """
+    Encoder/decoder for a family of mimetypes.
+
+    Subclasses implement convert (python -> wire) and revert (wire -> python); callers go through encode and decode,
+    which keep the per codec timing counters up to date. Codecs with streaming set also implement stream, a generator
+    of chunks used for sequences too large to be encoded in one go. stream_revert is the decoding counterpart: it
+    yields the elements of a sequence as they are decoded. Codecs with unsafe set (pickle) can execute code when they
+    decode: the servers only accept them for the operations which opted in.
+    """
+    binary = False
+    streaming = False
+    unsafe = False
+
+    def __init__(self, name):
+        self.name = name
+        self.counters = {'convert': [0, 0.0], 'revert': [0, 0.0]}
+
+    def convert(self, converter, val, **kw):
+        raise NotImplementedError()
+
+    def revert(self, converter, val, **kw):
+        raise NotImplementedError()
+
+    def stream(self, converter, val, **kw):
+        yield self.convert(converter, val, **kw)
+
+    def stream_revert(self, converter, val, **kw):
+        res = self.revert(converter, val, **kw)
+        return iter(res if isinstance(res, list) else [res])
+
+    def encode(self, converter, val, **kw):
+        time_start = time.perf_counter()
+        try:
+            return self.convert(converter, val, **kw)
+        finally:
+            c = self.counters['convert']
+            c[0] += 1
+            c[1] += time.perf_counter() - time_start
+
+    def iterencode(self, converter, val, **kw):
+        return self.timed('convert', self.stream(converter, val, **kw))
+
+    def iterdecode(self, converter, val, **kw):
+        return self.timed('revert', self.stream_revert(converter, val, **kw))
+
+    def timed(self, kind, it):
+        c = self.counters[kind]
+        c[0] += 1
+        it = iter(it)
+        while True:
+            time_start = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                c[1] += time.perf_counter() - time_start
+            yield item
+
+    def decode(self, converter, val, **kw):
+        time_start = time.perf_counter()
+        try:
+            return self.revert(converter, val, **kw)
+        finally:
+            c = self.counters['revert']
+            c[0] += 1
+            c[1] += time.perf_counter() - time_start
+
+    def stats(self):
+        return dict((k, {'count': v[0], 'time': v[1]}) for k, v in self.counters.items())
+
+    def __repr__(self):
+        return 'Codec(' + self.name + ')'
+
+
+class MethodCodec(Codec):
+    """Codec delegating to the <name>_convert / <name>_revert methods of the converter"""
+
+    def __init__(self, name, binary=False, streaming=False, unsafe=False):
+        super().__init__(name)
+        self.binary = binary
+        self.streaming = streaming
+        self.unsafe = unsafe
+        self.convert_method = name + '_convert'
+        self.revert_method = name + '_revert'
+        self.stream_method = name + '_stream'
+        self.stream_revert_method = name + '_stream_revert'
+
+    def convert(self, converter, val, **kw):
+        return getattr(converter, self.convert_method)(val, **kw)
+
+    def revert(self, converter, val, **kw):
+        return getattr(converter, self.revert_method)(val, **kw)
+
+    def stream(self, converter, val, **kw):
+        return getattr(converter, self.stream_method)(val, **kw)
+
+    def stream_revert(self, converter, val, **kw):
+        f = getattr(converter, self.stream_revert_method, None)
+        if f is None:
+            return super().stream_revert(converter, val, **kw)
+        return f(val, **kw)
+
+
+class FunctionCodec(Codec):
+    """Codec built from two plain functions: convert(converter, val, **kw) and revert(converter, val, **kw)"""
+
+    def __init__(self, name, convert, revert, binary=False):
+        super().__init__(name)
+        self.binary = binary
+        self.convert_function = convert
+        self.revert_function = revert
+
+    def convert(self, converter, val, **kw):
+        return self.convert_function(converter, val, **kw)
+
+    def revert(self, converter, val, **kw):
+        return self.revert_function(converter, val, **kw)
+
+
+class LayoutCodec(Codec):
+    """
+    Codec of a compact layout of a sequence of records, the names of the fields being sent once: 'rows'
+    ({"fields": [...], "rows": [[...], ...]}) or 'columns' ({"field": [...], ...}), on top of the codec of the
+    underlying mimetype.
+    """
+
+    def __init__(self, codec, layout):
+        super().__init__(codec.name + ';layout=' + layout)
+        self.codec = codec
+        self.layout = layout
+        self.binary = codec.binary
+
+    def convert(self, converter, val, **kw):
+        return self.codec.convert(converter, converter.layout_convert(val, self.layout), **kw)
+
+    def revert(self, converter, val, cls=dict, checker=None, **kw):
+        val = self.codec.revert(converter, val, **kw)
+        return converter.layout_revert(val, self.layout, cls, checker=checker)
+
+
+class CodecRegistry:
+    """Mapping mimetype -> codec"""
+
+    def __init__(self):
+        self.codecs = {}
+
+    def register(self, codec, *mimetypes):
+        for m in mimetypes:
+            self.codecs[m.lower()] = codec
+        return codec
+
+    def unregister(self, *mimetypes):
+        for m in mimetypes:
+            self.codecs.pop(m.lower(), None)
+
+    def get(self, mimetype):
+        """
+        Find the codec of a mimetype, ignoring its parameters but the layout.
+
+        :param mimetype: a mimetype like 'application/json', 'text/csv; charset=latin-1' or
+        'application/json; layout=columns'
+        :return: the codec or None if the mimetype is unknown
+        """
+        if mimetype is None:
+            return None
+        res = self.codecs.get(mimetype)
+        if res is None:
+            base, _, params = mimetype.partition(';')
+            base = base.strip().lower()
+            for part in params.split(';'):
+                k, _, v = part.partition('=')
+                if k.strip().lower() == 'layout':
+                    return self.codecs.get(base + '; layout=' + v.strip().strip('"').lower())
+            res = self.codecs.get(base)
+        return res
+
+    def lookup(self, content_type):
+        """
+        Find the codec and the charset of a Content-Type header.
+
+        :param content_type: the value of the header
+        :return: a tuple (codec, charset)
+        :raise BadRequest: if the mimetype is unknown
+        """
+        codec = self.get(content_type)
+        if codec is None:
+            raise errors.BadRequest(mimetype=content_type, status='unknown')
+        charset = 'UTF-8'
+        if content_type and ';' in content_type:
+            for part in content_type.split(';')[1:]:
+                k, _, v = part.partition('=')
+                if k.strip().lower() == 'charset' and v:
+                    charset = v.strip().strip('"')
+        return codec, charset
+
+    def mimetypes(self):
+        return list(self.codecs.keys())
+
+    def stats(self):
+        return dict((c.name, c.stats()) for c in set(self.codecs.values()))
+
+    def __contains__(self, mimetype):
+        return self.get(mimetype) is not None
@@ -0,0 +1,201 @@
+import zlib
+
+from pyrolysis.common import errors
+
+
+class Compression:
+    """
+    A Content-Encoding. compress and decompress work on whole bodies, stream compresses an iterable of chunks
+    incrementally, each chunk being flushed so that the client can decode it as soon as it is received.
+
+    decompress stops as soon as the output exceeds max_size bytes, raising PayloadTooLarge, so that a small body
+    cannot expand to an arbitrary size.
+    """
+    name = None
+    level = None
+
+    def compress(self, data, level=None):
+        raise NotImplementedError()
+
+    def decompress(self, data, max_size=None):
+        raise NotImplementedError()
+
+    def stream(self, chunks, level=None):
+        raise NotImplementedError()
+
+    def __repr__(self):
+        return 'Compression(' + self.name + ')'
+
+
+def check_size(data, max_size):
+    if len(data) > max_size:
+        raise errors.PayloadTooLarge(max_size=max_size, status='conflict')
+    return data
+
+
+def read_limited(read, max_size, chunk_size=65536):
+    """
+    :return: the bytes of a reader, at most max_size + 1 of them
+    """
+    parts = []
+    size = 0
+    while size <= max_size:
+        part = read(min(chunk_size, max_size + 1 - size))
+        if not part:
+            break
+        parts.append(part)
+        size += len(part)
+    return b''.join(parts)
+
+
+class ZlibCompression(Compression):
+    level = 6
+
+    def __init__(self, name, wbits):
+        self.name = name
+        self.wbits = wbits
+
+    def compress(self, data, level=None):
+        c = zlib.compressobj(self.level if level is None else level, zlib.DEFLATED, self.wbits)
+        return c.compress(data) + c.flush()
+
+    def decompress(self, data, max_size=None):
+        if max_size is None:
+            return zlib.decompress(data, self.wbits)
+        d = zlib.decompressobj(self.wbits)
+        res = d.decompress(data, max_size + 1)
+        if len(res) <= max_size:
+            res += d.flush()
+        return check_size(res, max_size)
+
+    def stream(self, chunks, level=None):
+        c = zlib.compressobj(self.level if level is None else level, zlib.DEFLATED, self.wbits)
+        for chunk in chunks:
+            yield c.compress(chunk) + c.flush(zlib.Z_SYNC_FLUSH)
+        yield c.flush()
+
+
+class ZstdCompression(Compression):
+    name = 'zstd'
+    level = 3
+
+    def __init__(self):
+        import zstandard
+        self.zstandard = zstandard
+
+    def compress(self, data, level=None):
+        return self.zstandard.ZstdCompressor(level=self.level if level is None else level).compress(data)
+
+    def decompress(self, data, max_size=None):
+        if max_size is None:
+            return self.zstandard.ZstdDecompressor().decompressobj().decompress(data)
+        with self.zstandard.ZstdDecompressor().stream_reader(data, read_across_frames=True) as reader:
+            return check_size(read_limited(reader.read, max_size), max_size)
+
+    def stream(self, chunks, level=None):
+        c = self.zstandard.ZstdCompressor(level=self.level if level is None else level).compressobj()
+        for chunk in chunks:
+            yield c.compress(chunk) + c.flush(self.zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        yield c.flush()
+
+
+class BrotliCompression(Compression):
+    name = 'br'
+    level = 4
+
+    def __init__(self):
+        import brotli
+        self.brotli = brotli
+
+    def compress(self, data, level=None):
+        return self.brotli.compress(data, quality=self.level if level is None else level)
+
+    def decompress(self, data, max_size=None):
+        if max_size is None:
+            return self.brotli.decompress(data)
+        d = self.brotli.Decompressor()
+        parts = [d.process(data, output_buffer_limit=max_size + 1)]
+        size = len(parts[0])
+        while size <= max_size and not d.is_finished():
+            part = d.process(b'', output_buffer_limit=max_size + 1 - size)
+            if not part:
+                break
+            parts.append(part)
+            size += len(part)
+        return check_size(b''.join(parts), max_size)
+
+    def stream(self, chunks, level=None):
+        c = self.brotli.Compressor(quality=self.level if level is None else level)
+        for chunk in chunks:
+            yield c.process(chunk) + c.flush()
+        yield c.finish()
+
+
+class Lz4Compression(Compression):
+    name = 'lz4'
+    level = 0
+
+    def __init__(self):
+        import lz4.frame
+        self.lz4 = lz4.frame
+
+    def compress(self, data, level=None):
+        return self.lz4.compress(data, compression_level=self.level if level is None else level)
+
+    def decompress(self, data, max_size=None):
+        if max_size is None:
+            return self.lz4.decompress(data)
+        return check_size(self.lz4.LZ4FrameDecompressor().decompress(data, max_length=max_size + 1), max_size)
+
+    def stream(self, chunks, level=None):
+        c = self.lz4.LZ4FrameCompressor(compression_level=self.level if level is None else level, auto_flush=True)
+        yield c.begin()
+        for chunk in chunks:
+            yield c.compress(chunk)
+        yield c.flush()
+
+
+def available():
+    """
+    :return: the compressions which can be used here, by order of preference
+    """
+    res = {}
+    for f in [ZstdCompression, BrotliCompression]:
+        try:
+            c = f()
+            res[c.name] = c
+        except ImportError:
+            pass
+    res['gzip'] = ZlibCompression('gzip', 31)
+    res['deflate'] = ZlibCompression('deflate', 15)
+    try:
+        res['lz4'] = Lz4Compression()
+    except ImportError:
+        pass
+    return res
+
+
+compressions = available()
+
+
+def get(name):
+    """
+    :param name: the value of a Content-Encoding header
+    :return: the compression, None for the identity
+    :raise BadRequest: if the encoding is not supported
+    """
+    if not name or name == 'identity':
+        return None
+    res = compressions.get(name.strip().lower())
+    if res is None:
+        raise errors.BadRequest(encoding=name, status='unknown')
+    return res
+
+
+def decompress(name, data, max_size=None):
+    """
+    :param max_size: the maximal size of the decompressed data, unlimited if None
+    :raise PayloadTooLarge: if the decompressed data is larger
+    """
+    c = get(name)
+    return data if c is None or not data else c.decompress(data, max_size)
@@ -1,6 +1,5 @@
 import io, sys
 from collections import namedtuple, Mapping, Iterable
-from json import JSONEncoder
 
 import marshmallow
 import marshmallow_dataclass
@@ -10,15 +9,24 @@ from datetime import date, datetime
 from enum import Enum
 
 from pyrolysis.common.support import keep
+from pyrolysis.common.codec import CodecRegistry, LayoutCodec, MethodCodec
+from pyrolysis.common.serializer import compile_serializer, dump_errors, load_errors
+from pyrolysis.common.json_backend import JSONEncoder2, enum_names, get_backend
+from pyrolysis.common.msgpack_ext import ExtTypes
 
 
-application = namedtuple('mimetype', ['pickle', 'msgpack', 'json', 'csv', 'xml', 'text'])(
+application = namedtuple('mimetype', ['pickle', 'msgpack', 'json', 'ndjson', 'csv', 'xml', 'text', 'arrow',
+                                      'pickle5', 'msgpack_ext'])(
     text="application/text",
+    arrow="application/vnd.apache.arrow.stream",
     json="application/json",
+    ndjson="application/x-ndjson",
     csv="application/csv",
     xml="application/xml",
     msgpack="application/msgpack",
-    pickle="application/pickle"
+    msgpack_ext="application/vnd.pyrolysis.msgpack",
+    pickle="application/pickle",
+    pickle5="application/x-pickle5"
 )
 
 text = namedtuple('mimetype', ['csv', 'xml', 'plain'])(
@@ -27,61 +35,303 @@ text = namedtuple('mimetype', ['csv', 'xml', 'plain'])(
     xml="text/xml"
 )
 
-mimetypes = list(application) + list(text)
-from pyrolysis.common import pandas_df_type
+from pyrolysis.common import pandas_df_type, has_arrow
+mimetypes = [m for m in list(application) + list(text)
+             if (has_arrow or m != application.arrow) and m not in (application.pickle, application.pickle5)]
 from pyrolysis.common import errors
 
+registry = CodecRegistry()
+registry.register(MethodCodec('json', streaming=True), application.json)
+registry.register(MethodCodec('ndjson', streaming=True), application.ndjson)
+registry.register(MethodCodec('xml', streaming=True), application.xml, text.xml)
+registry.register(MethodCodec('pickle', binary=True, unsafe=True), application.pickle)
+registry.register(MethodCodec('pickle5', binary=True, streaming=True, unsafe=True), application.pickle5)
+registry.register(MethodCodec('msgpack', binary=True), application.msgpack)
+registry.register(MethodCodec('msgpack_ext', binary=True), application.msgpack_ext)
+registry.register(MethodCodec('csv', streaming=True), application.csv, text.csv)
+registry.register(MethodCodec('str'), application.text, text.plain)
+registry.register(MethodCodec('arrow', binary=True, streaming=True), application.arrow)
 
-class JSONEncoder2(JSONEncoder):
-    def default(self, o):
-        if isinstance(o, datetime):
-            return o.isoformat()
-        if isinstance(o, date):
-            return o.isoformat()
-        if isinstance(o, set):
-            return list(o)
-        if isinstance(o, type):
-            return o.__module__ + '.' + o.__name__
-        if isinstance(o, Enum):
-            return o.name
-        return JSONEncoder.default(self, o)
+layouts = ['columns', 'rows']
+
+
+def layout_mimetype(mimetype, layout):
+    return mimetype + '; layout=' + layout
+
+
+layout_mimetypes = [layout_mimetype(m, layout) for m in [application.json, application.msgpack] for layout in layouts]
+for m in layout_mimetypes:
+    base, _, layout = m.partition('; layout=')
+    registry.register(LayoutCodec(registry.get(base), layout), m)
+
+
+def parse_type(val):
+    p = val.rindex('.')
+    return getattr(sys.modules[val[:p]], val[p+1:])
+
+
+def parse_bool(val):
+    val = val.lower()
+    if val in ['true', 'false']:
+        return val == 'true'
+    raise ValueError(val)
+
+
+def parse_bytearray(val):
+    return bytearray(base64.b64decode(val))
+
+
+str_parsers = {date: date.fromisoformat, datetime: datetime.fromisoformat, int: int, float: float, str: str,
+               type: parse_type, bytes: base64.b64decode, bytearray: parse_bytearray, bool: parse_bool}
+str_types = dict((k.__name__, k) for k in str_parsers)
+array_typecodes = {int: 'q', float: 'd'}
+
+
+def numeric_array(cls, kind):
+    """
+    :param cls: int or float
+    :param kind: 'list', 'array' (array.array) or 'numpy'
+    :return: a function parsing comma separated numbers in one go, a list with None for the empty items (1,,3) as
+    str_parser does
+    """
+    if kind == 'numpy':
+        import numpy
+        import warnings
+        dtype = numpy.int64 if cls == int else numpy.float64
+
+        def bulk(val):
+            with warnings.catch_warnings():
+                warnings.simplefilter('error', DeprecationWarning)
+                res = numpy.fromstring(val, dtype=dtype, sep=',')
+            if len(res) != val.count(',') + 1:
+                raise ValueError(val)
+            return res
+    elif kind == 'array':
+        import array
+        typecode = array_typecodes[cls]
+        bulk = lambda val: array.array(typecode, map(cls, val.split(',')))
+    else:
+        bulk = lambda val: list(map(cls, val.split(',')))
+
+    def parse(val):
+        try:
+            return bulk(val)
+        except (ValueError, DeprecationWarning):
+            return [cls(x) if x else None for x in val.split(',')]
+    return parse
+
+
+def align(n, alignment=64):
+    return (n + alignment - 1) & ~(alignment - 1)
+
+
+def is_array(val):
+    return isinstance(val, pandas_df_type) or hasattr(val, '__array_interface__')
+
+
+def is_sequence(val):
+    return isinstance(val, Iterable) and not isinstance(val, (str, bytes, bytearray, Mapping, pandas_df_type))
+
+
+def is_streamable(val):
+    return is_sequence(val) or isinstance(val, pandas_df_type)
+
+
+def is_sequence_type(tp):
+    return issubclass(tp, Iterable) and not issubclass(tp, (str, bytes, bytearray, Mapping))
+
+
+def homogeneous(lst):
+    """
+    :return: the type of the elements of the list if they all have the same one, None otherwise
+    """
+    if not lst:
+        return None
+    tp = type(lst[0])
+    for x in lst:
+        if type(x) is not tp:
+            return None
+    return tp
+
+
+def drain(buf):
+    res = buf.getvalue()
+    buf.seek(0)
+    buf.truncate()
+    return res
+
+
+def chunked(parts, chunk_size=65536):
+    """
+    Group strings in chunks of about chunk_size characters, the first one is sent as soon as it is produced.
+    """
+    buf = []
+    size = 0
+    first = True
+    for p in parts:
+        buf.append(p)
+        size += len(p)
+        if first or size >= chunk_size:
+            yield ''.join(buf)
+            buf = []
+            size = 0
+            first = False
+    if buf:
+        yield ''.join(buf)
+
+
+def text_lines(response, encoding=None, chunk_size=65536):
+    """
+    Decode the body of a streamed response line by line, line endings included (unlike iter_lines).
+    """
+    import codecs
+    decoder = codecs.getincrementaldecoder(encoding or response.encoding or 'UTF-8')(errors='replace')
+    rest = ''
+    for chunk in response.iter_content(chunk_size):
+        lines = (rest + decoder.decode(chunk)).splitlines(True)
+        rest = lines.pop() if lines and lines[-1][-1] not in '\r\n' else ''
+        for line in lines:
+            yield line
+    rest += decoder.decode(b'', final=True)
+    if rest:
+        yield rest
 
 
 class Converter:
     schemas = {}
+    serializers = {}
+    names = {}
+    parsers = {}
+    numeric_arrays = 'list'
+    compiled = {}
+    codecs = registry
+    fast_serializers = True
+    stream_batch = 1000
+    json = get_backend()
+    msgpack_ext = ExtTypes()
+
+    def set_json_backend(self, name='auto'):
+        """
+        :param name: 'orjson', 'ujson', 'json' (standard library) or 'auto' for the fastest one installed
+        """
+        self.json = get_backend(name)
+
+    def json_dumps(self, val, **kw):
+        if self.json.needs_names:
+            val = enum_names(val)
+        return self.json.dumps(val, **kw)
 
     def register(self, cls):
-        self.schemas[cls.__name__] = marshmallow_dataclass.class_schema(cls)()
+        self.schemas[cls] = marshmallow_dataclass.class_schema(cls)()
+        self.serializers[cls] = compile_serializer(cls, self.compiled)
+        self.names[cls.__name__] = cls
+        self.msgpack_ext.register(cls)
+
+    def schema_class(self, cls):
+        """
+        :param cls: a class or the name of a class
+        :return: the registered class, None if it is not registered
+        """
+        if isinstance(cls, str):
+            return self.names.get(cls)
+        return cls if cls in self.schemas else None
+
+    def is_registered(self, cls):
+        return self.schema_class(cls) is not None
+
+    def schema_dump(self, data, cls, many=False):
+        serializer = self.serializers.get(cls) if self.fast_serializers else None
+        if serializer:
+            try:
+                return serializer.dump_many(data) if many else serializer.dump(data)
+            except dump_errors:
+                pass
+        try:
+            return self.schemas[cls].dump(data, many=many)
+        except marshmallow.exceptions.ValidationError as e:
+            raise errors.BadRequest(errors=e.data, status='conflict')
 
-    def schema_convert(self, data, checker=None):
-        if isinstance(data, Iterable) and not isinstance(data, Mapping) and not isinstance(data, str):
-            return [self.schema_convert(x) for x in data]
-        cls = type(data).__name__
-        if cls in self.schemas:
+    def schema_load(self, data, cls, many=False):
+        serializer = self.serializers.get(cls) if self.fast_serializers else None
+        if serializer:
             try:
-                data = self.schemas[cls].dump(data)
-            except marshmallow.exceptions.ValidationError as e:
-                raise errors.BadRequest(errors=e.data, status='conflict')
+                return serializer.load_many(data) if many else serializer.load(data)
+            except load_errors:
+                pass
+        try:
+            return self.schemas[cls].load(data, many=many)
+        except marshmallow.exceptions.ValidationError as e:
+            raise errors.BadRequest(errors=e.data, status='conflict')
+
+    def schema_convert(self, data, checker=None, names=False):
+        if isinstance(data, Iterable) and not isinstance(data, Mapping) and not isinstance(data, str):
+            if not isinstance(data, list):
+                data = list(data)
+            tp = homogeneous(data)
+            if tp is None or is_sequence_type(tp):
+                return [self.schema_convert(x, names=names) for x in data]
+            if tp in self.schemas:
+                return self.schema_dump(data, tp, many=True)
+            return enum_names(data) if names else data
+        tp = type(data)
+        if tp in self.schemas:
+            data = self.schema_dump(data, tp)
+        elif names:
+            data = enum_names(data)
         if checker:
             checker(data)
         return data
 
     def schema_revert(self, data, cls, checker=None):
         if isinstance(data, Iterable) and not isinstance(data, Mapping) and not isinstance(data, str):
+            if not isinstance(data, list):
+                data = list(data)
+            tp = self.schema_class(cls)
+            if tp is not None:
+                item_type = homogeneous(data)
+                if item_type is tp:
+                    return data
+                if item_type is dict and checker is None:
+                    return self.schema_load(data, tp, many=True)
             return [self.schema_revert(x, cls, checker) for x in data]
+        tp = self.schema_class(cls)
+        if tp is not None and type(data) is tp:
+            return data
         if isinstance(data, str) and cls != 'str' and cls != str:
             data = self.str_revert(data, cls)
         if checker:
             checker(data)
-        if isinstance(cls, type):
-            cls = cls.__name__
-        if cls in self.schemas:
-            try:
-                data = self.schemas[cls].load(data)
-            except marshmallow.exceptions.ValidationError as e:
-                raise errors.BadRequest(errors=e.data, status='conflict')
+        if tp is not None:
+            data = self.schema_load(data, tp)
         return data
 
+    def layout_convert(self, val, layout):
+        """
+        :param val: a sequence of records (registered dataclasses or dictionaries)
+        :param layout: 'rows' or 'columns'
+        :return: the records in the layout, the names of the fields being taken from the first one; sequences of
+        other values are returned as lists
+        """
+        if not is_sequence(val):
+            return self.schema_convert(val)
+        records = self.schema_convert(val)
+        if records and not isinstance(records[0], Mapping):
+            return records
+        fields = list(records[0]) if records else []
+        if layout == 'rows':
+            return {'fields': fields, 'rows': [[r.get(f) for f in fields] for r in records]}
+        return dict((f, [r.get(f) for r in records]) for f in fields)
+
+    def layout_revert(self, val, layout, cls=dict, checker=None):
+        if isinstance(val, Mapping):
+            if layout == 'rows':
+                fields = val.get('fields', [])
+                val = [dict(zip(fields, r)) for r in val.get('rows', [])]
+            else:
+                fields = list(val)
+                val = [dict(zip(fields, r)) for r in zip(*val.values())]
+        return self.schema_revert(val, cls, checker=checker)
+
     def str_convert(self, val, **kw):
         if val is None:
             return ''
@@ -111,46 +361,58 @@ class Converter:
             return ','.join(self.str_convert(x) for x in val)
         raise errors.BadRequest(type=type(val), status='unknown')
 
-    def str_revert(self, val, cls, many=False, **kw):
-        if val is None:
-            return val
-        if type(val) == cls:
-            return val
-        if isinstance(val, requests.Response):
-            val = val.text
-        if isinstance(val, bytes):
-            val = val.decode(**kw)
-        if len(val) == 0:
-            return None
+    def str_parser(self, cls, many=False):
+        """
+        Resolve once the function parsing the strings of a type, str_revert being the same function resolved at each
+        call.
+
+        :param cls: a class or its name
+        :param many: if True, the function parses comma separated values to a list (or to an array.array / a numpy
+        array for the numbers, depending on numeric_arrays)
+        :return: a function (val, **kw) -> value
+        """
+        key = (cls, many, self.numeric_arrays)
+        res = self.parsers.get(key)
+        if res is None:
+            res = self.parsers[key] = self.build_str_parser(cls, many)
+        return res
+
+    def build_str_parser(self, cls, many):
+        tp = str_types.get(cls, cls) if isinstance(cls, str) else cls
+        parse = str_parsers.get(tp)
+        if parse is None and isinstance(tp, type) and issubclass(tp, Enum):
+            parse = tp.__getitem__
+        if parse is None:
+            def parse(val):
+                raise errors.BadRequest(val=val, type=cls, status='unknown')
         if many:
-            return [self.str_revert(x, cls, False, **kw) for x in val.split(',')]
-        try:
-            if cls == 'date' or cls == date:
-                return datetime.strptime(val, '%Y-%m-%d').date()
-            elif cls == 'datetime' or cls == datetime:
-                return datetime.strptime(val, '%Y-%m-%dT%H:%M:%S')
-            elif cls == 'int' or cls == int:
-                return int(val)
-            elif cls == 'float' or cls == float:
-                return float(val)
-            elif cls == 'str' or cls == str:
+            if tp in array_typecodes:
+                parse = numeric_array(tp, self.numeric_arrays)
+            else:
+                item = parse
+                parse = lambda val: [item(x) if x else None for x in val.split(',')]
+
+        done = list if many else tp
+
+        def parser(val, **kw):
+            if val is None or type(val) == done:
                 return val
-            elif cls == 'type' or cls == type:
-                p = val.rindex('.')
-                return getattr(sys.modules[val[:p]], val[p+1:])
-            elif cls == 'bytes' or cls == bytes:
-                return base64.b64decode(val)
-            elif cls == 'bytearray' or cls == bytearray:
-                return bytearray(base64.b64decode(val))
-            elif cls == 'bool' or cls == bool:
-                val = val.lower()
-                if val in ['true', 'false']:
-                    return val == 'true'
-            elif issubclass(cls, Enum):
-                return cls[val]
-        except Exception:
-            raise errors.BadRequest(val=val, type=cls, status='conflict')
-        raise errors.BadRequest(val=val, type=cls, status='unknown')
+            if isinstance(val, requests.Response):
+                val = val.text
+            if isinstance(val, bytes):
+                val = val.decode(**kw)
+            if len(val) == 0:
+                return None
+            try:
+                return parse(val)
+            except errors.PyrolysisException:
+                raise
+            except Exception:
+                raise errors.BadRequest(val=val, type=cls, status='conflict')
+        return parser
+
+    def str_revert(self, val, cls, many=False, **kw):
+        return self.str_parser(cls, many)(val, **keep(kw, ['encoding']))
 
     def csv_convert(self, val, checker=None, **kw):
         if type(val) != list:
@@ -179,6 +441,42 @@ class Converter:
                 raise errors.BadRequest(type=t.__name__, status='unknown')
         return buf.getvalue()
 
+    def csv_stream(self, val, chunk_size=65536, **kw):
+        """
+        Same output as csv_convert, produced row by row: the header comes from the first element.
+
+        :param val: a list, an iterator or a generator
+        :param chunk_size: number of characters buffered before a chunk is yielded
+        """
+        import csv
+        if isinstance(val, pandas_df_type):
+            n = max(1, chunk_size // 64)
+            for i in range(0, len(val), n):
+                yield val.iloc[i:i + n].to_csv(header=i == 0, **keep(kw, []))
+            return
+        if not is_sequence(val):
+            val = [val]
+        buf = io.StringIO()
+        it = iter(val)
+        for first in it:
+            break
+        else:
+            return
+        t = self.schema_convert(first)
+        if isinstance(t, Mapping):
+            w = csv.DictWriter(buf, sorted(t.keys()), lineterminator='\n', **keep(kw, []))
+            w.writeheader()
+        elif isinstance(t, Iterable):
+            w = csv.writer(buf, lineterminator='\n', **keep(kw, []))
+        else:
+            raise errors.BadRequest(type=type(t).__name__, status='unknown')
+        w.writerow(t)
+        for x in it:
+            w.writerow(self.schema_convert(x))
+            if buf.tell() >= chunk_size:
+                yield drain(buf)
+        yield buf.getvalue()
+
     def csv_revert(self, val, cls=dict, checker=None, **kw):
         if cls == pandas_df_type or cls == pandas_df_type.__name__:
             import pandas
@@ -188,89 +486,140 @@ class Converter:
                 return pandas.read_csv(io.BytesIO(val), **keep(kw, []))
             else:
                 return pandas.read_csv(io.StringIO(val), **keep(kw, []))
+        return list(self.csv_stream_revert(val, cls, checker, **kw))
+
+    def csv_stream_revert(self, val, cls=dict, checker=None, **kw):
+        if cls == pandas_df_type or cls == pandas_df_type.__name__:
+            yield self.csv_revert(val, cls, checker, **kw)
+            return
         import csv
         if isinstance(val, requests.Response):
-            inp = val.iter_content()
+            inp = text_lines(val, kw.get('encoding'))
         elif isinstance(val, bytes):
-            inp = io.StringIO(val.decode(**keep(kw, [])))
+            inp = io.StringIO(val.decode(**keep(kw, ['encoding'])))
         else:
             inp = io.StringIO(val)
-        data = list(dict(x) for x in csv.DictReader(inp, delimiter=',', **kw))
-        data = self.schema_revert(data, cls, checker=checker)
-        return data
+        for x in csv.DictReader(inp, delimiter=','):
+            yield self.schema_revert(dict(x), cls, checker=checker)
+
+    def xml_element(self, tag, val, typed=False):
+        """
+        :param tag: the name of the element
+        :param val: a converted value (dictionary, list or scalar)
+        :param typed: if True, the type attribute is set on scalars which are not strings
+        :return: the ElementTree element of the value
+        """
+        from xml.etree import ElementTree
+        e = ElementTree.Element(tag)
+        if typed and type(val) not in [str, dict]:
+            e.set('type', type(val).__name__)
+        if isinstance(val, Mapping):
+            for k, v in val.items():
+                if isinstance(v, list):
+                    for v2 in v:
+                        e.append(self.xml_element(k, v2, True))
+                else:
+                    e.append(self.xml_element(k, v, True))
+        else:
+            e.text = self.str_convert(val)
+        return e
 
     def xml_convert(self, val, checker=None, **kw):
-        from xml.dom import minidom
-        doc = minidom.getDOMImplementation().createDocument(None, "some_tag", None)
-
-        def convert_node(n, e):
-            if isinstance(n, Mapping):
-                for k, v in n.items():
-                    convert_node(v, doc.createElement(k))
-                    if isinstance(v, list):
-                        for v2 in v:
-                            e2 = doc.createElement(k)
-                            if type(v2) not in [str,dict]:
-                                e2.setAttribute('type', type(v2).__name__)
-                            convert_node(v2, e2)
-                            e.appendChild(e2)
-                    else:
-                        e2 = doc.createElement(k)
-                        if type(v) not in [str, dict]:
-                            e2.setAttribute('type', type(v).__name__)
-                        convert_node(v, e2)
-                        e.appendChild(e2)
-            else:
-                e.appendChild(doc.createTextNode(self.str_convert(n)))
-
+        if is_sequence(val):
+            if checker:
+                val = list(val)
+                checker(self.schema_convert(val))
+            return ''.join(self.xml_stream(val, **kw))
+        from xml.etree import ElementTree
         clname = type(val).__name__
         val = self.schema_convert(val, checker=checker)
-
-        e = doc.createElement(clname)
-        if val is list:
-            for v2 in val:
-                e2 = doc.createElement(type(v2).__name__)
-                convert_node(v2, e2)
-                e.appendChild(e2)
-        else:
-            convert_node(val, e)
-        return e.toxml()
-
-    def xml_revert(self, val, cls, checker=None, **kw):
-        from xml.dom import minidom
-
-        def revert_node(n):
-            res = {}
-            txt = ''
-            for c in n.childNodes:
-                if c.nodeType == c.TEXT_NODE:
-                    txt += c.data
+        return ElementTree.tostring(self.xml_element(clname, val), encoding='unicode')
+
+    def xml_stream(self, val, chunk_size=65536, **kw):
+        """
+        Same output as xml_convert, a sequence being written element by element inside a <list> element.
+        """
+        if not is_sequence(val):
+            return iter([self.xml_convert(val, **kw)])
+        from xml.etree import ElementTree
+
+        def parts():
+            yield '<list>'
+            for x in val:
+                e = self.xml_element(type(x).__name__, self.schema_convert(x), True)
+                yield ElementTree.tostring(e, encoding='unicode')
+            yield '</list>'
+        return chunked(parts(), chunk_size)
+
+    def xml_revert_element(self, e):
+        res = {}
+        for c in e:
+            v = self.xml_revert_element(c)
+            t = c.get('type')
+            if t:
+                v = self.str_revert(v, t, False)
+            if c.tag in res:
+                if type(res[c.tag]) == list:
+                    res[c.tag].append(v)
                 else:
-                    e = revert_node(c)
-                    if c.hasAttribute('type'):
-                        e = self.str_revert(e, c.getAttribute('type'), False)
-                    if c.nodeName in res:
-                        v = res[c.nodeName]
-                        if type(v) == list:
-                            v.append(e)
-                        else:
-                            res[c.nodeName] = [v, e]
-                    else:
-                        res[c.nodeName] = e
-            if len(res) > 0:
-                return res
-            return txt
-
+                    res[c.tag] = [res[c.tag], v]
+            else:
+                res[c.tag] = v
+        if len(res) > 0:
+            return res
+        return e.text or ''
+
+    def xml_items(self, val, cls, checker=None, **kw):
+        """
+        Parse a document incrementally: the first item is the tag of the root element, then come the reverted
+        children of a <list> root, or the reverted root itself. The children are freed once they are reverted.
+        """
+        from xml.etree import ElementTree
         if isinstance(val, requests.Response):
-            val = val.text
-        elif isinstance(val, bytes):
-            val = val.decode(**keep(kw, []))
-        elif not isinstance(val, str):
+            chunks = val.iter_content(65536)
+        elif isinstance(val, (bytes, str)):
+            chunks = [val]
+        else:
             raise errors.BadRequest(type=type(val).__name__, status='unknown')
-
-        res = revert_node(minidom.parse(io.StringIO(val)).firstChild)
-
-        return self.schema_revert(res, cls, checker=checker)
+        parser = ElementTree.XMLPullParser(events=('start', 'end'))
+        root = None
+        depth = 0
+        for chunk in chunks:
+            parser.feed(chunk)
+            for event, e in parser.read_events():
+                if root is None:
+                    root = e
+                    yield root.tag
+                elif event == 'start':
+                    depth += 1
+                elif e is not root:
+                    depth -= 1
+                    if depth == 0 and root.tag == 'list':
+                        v = self.xml_revert_element(e)
+                        if e.get('type'):
+                            v = self.str_revert(v, e.get('type'), False)
+                        root.clear()
+                        yield self.schema_revert(v, cls, checker=checker)
+        try:
+            parser.close()
+        except ElementTree.ParseError:
+            if root is not None:
+                raise errors.BadRequest(type='xml', status='conflict')
+        if root is None:
+            raise errors.BadRequest(type='xml', status='missing')
+        if root.tag != 'list':
+            yield self.schema_revert(self.xml_revert_element(root), cls, checker=checker)
+
+    def xml_revert(self, val, cls=dict, checker=None, **kw):
+        it = self.xml_items(val, cls, checker, **kw)
+        if next(it) == 'list':
+            return list(it)
+        return next(it)
+
+    def xml_stream_revert(self, val, cls=dict, checker=None, **kw):
+        it = self.xml_items(val, cls, checker, **kw)
+        next(it)
+        return it
 
     def msgpack_convert(self, val, checker=None, **kw):
         if pandas_df_type and isinstance(val, pandas_df_type):
@@ -296,15 +645,62 @@ class Converter:
         val = self.schema_revert(val, cls, checker=checker)
         return val
 
+    def msgpack_ext_convert(self, val, checker=None, **kw):
+        """
+        msgpack with the extension types of ExtTypes: native dates, Enums, and dataclasses encoded by position.
+        """
+        if checker:
+            val = list(val) if is_sequence(val) else val
+            checker(self.schema_convert(val))
+        elif is_sequence(val) and not isinstance(val, list):
+            val = list(val)
+        return self.msgpack_ext.packb(val)
+
+    def msgpack_ext_revert(self, val, cls=dict, checker=None, **kw):
+        if isinstance(val, requests.Response):
+            val = val.content
+        return self.schema_revert(self.msgpack_ext.unpackb(val), cls, checker=checker)
+
+    def msgpack_ext_stream_revert(self, val, cls=dict, checker=None, **kw):
+        return self.msgpack_stream_revert(val, cls, checker, ext_hook=self.msgpack_ext.ext_hook(), raw=False)
+
+    def msgpack_stream_revert(self, val, cls=dict, checker=None, **kw):
+        """
+        Decode a msgpack array element by element, feeding the unpacker with the chunks of the response.
+        """
+        if cls == pandas_df_type.__name__ or cls == pandas_df_type:
+            yield self.msgpack_revert(val, cls, checker, **kw)
+            return
+        import msgpack
+        chunks = val.iter_content(65536) if isinstance(val, requests.Response) else iter([val])
+        unpacker = msgpack.Unpacker(**keep(kw, ['ext_hook', 'raw']))
+
+        def read(f):
+            while True:
+                try:
+                    return f()
+                except msgpack.OutOfData:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        raise errors.BadRequest(status='truncated')
+                    unpacker.feed(chunk)
+
+        try:
+            n = read(unpacker.read_array_header)
+        except ValueError:
+            yield self.schema_revert(read(unpacker.unpack), cls, checker=checker)
+            return
+        for i in range(n):
+            yield self.schema_revert(read(unpacker.unpack), cls, checker=checker)
+
     def json_convert(self, val, checker=None, **kw):
-        import json
         if pandas_df_type and isinstance(val, pandas_df_type):
             buf = io.StringIO()
             val.to_json(buf, **keep(kw, []))
             res = buf.getvalue()
             return res
-        val = self.schema_convert(val, checker=checker)
-        return json.dumps(val, cls=JSONEncoder2, **keep(kw, []))
+        val = self.schema_convert(val, checker=checker, names=self.json.needs_names)
+        return self.json.dumps(val, **keep(kw, []))
 
     def json_revert(self, val, cls=dict, checker=None, **kw):
         if cls == pandas_df_type.__name__ or cls == pandas_df_type:
@@ -318,51 +714,202 @@ class Converter:
             else:
                 raise errors.BadRequest(type=type(val).__name__, status='unknown')
         if isinstance(val, requests.Response):
-            val = val.text
-        import json
-        val = json.loads(val, **keep(kw, ['encoding']))
+            val = val.content if self.json.binary and val.encoding in [None, 'utf-8', 'UTF-8'] else val.text
+        val = self.json.loads(val, **keep(kw, ['encoding']))
         val = self.schema_revert(val, cls, checker=checker)
         return val
 
+    def json_stream(self, val, chunk_size=65536, **kw):
+        """
+        Same output as json_convert, a sequence being encoded element by element, a list or a tuple by slices of
+        stream_batch elements.
+        """
+        if not is_sequence(val):
+            return iter([self.json_convert(val, **kw)])
+        dumps = self.json.dumps
+        names = self.json.needs_names
+        options = keep(kw, [])
+        separator = ', ' if self.json.name == 'json' else ','
+
+        def parts():
+            sep = '['
+            if isinstance(val, (list, tuple)):
+                for i in range(0, len(val), self.stream_batch):
+                    yield sep + self.json_convert(val[i:i + self.stream_batch], **kw)[1:-1]
+                    sep = separator
+            else:
+                for x in val:
+                    yield sep + dumps(self.schema_convert(x, names=names), **options)
+                    sep = separator
+            yield '[]' if sep == '[' else ']'
+        return chunked(parts(), chunk_size)
+
+    def ndjson_convert(self, val, checker=None, **kw):
+        if checker:
+            checker(self.schema_convert(val))
+        return ''.join(self.ndjson_stream(val, **kw))
+
+    def ndjson_stream(self, val, chunk_size=65536, **kw):
+        """
+        Newline delimited json: one line per element of the sequence.
+        """
+        if isinstance(val, pandas_df_type):
+            n = max(1, chunk_size // 64)
+            lines = (val.iloc[i:i + n].to_json(orient='records', lines=True) for i in range(0, len(val), n))
+            return (x if x.endswith('\n') else x + '\n' for x in lines)
+        if not is_sequence(val):
+            val = [val]
+        dumps = self.json.dumps
+        names = self.json.needs_names
+        options = keep(kw, [])
+        return chunked((dumps(self.schema_convert(x, names=names), **options) + '\n' for x in val), chunk_size)
+
+    def ndjson_revert(self, val, cls=dict, checker=None, **kw):
+        return list(self.ndjson_stream_revert(val, cls, checker, **kw))
+
+    def ndjson_stream_revert(self, val, cls=dict, checker=None, **kw):
+        if cls == pandas_df_type.__name__ or cls == pandas_df_type:
+            import pandas
+            if isinstance(val, requests.Response):
+                val = val.content
+            yield pandas.read_json(io.BytesIO(val) if isinstance(val, bytes) else io.StringIO(val), orient='records',
+                                   lines=True)
+            return
+        if isinstance(val, requests.Response):
+            lines = val.iter_lines()
+        elif isinstance(val, (bytes, str)):
+            lines = val.splitlines()
+        else:
+            lines = val
+        for line in lines:
+            if line:
+                yield self.schema_revert(self.json.loads(line), cls, checker=checker)
+
+    def arrow_convert(self, val, checker=None, **kw):
+        return b''.join(self.arrow_stream(val, **kw))
+
+    def arrow_stream(self, val, chunk_rows=65536, **kw):
+        """
+        Apache Arrow IPC stream of a DataFrame, one record batch every chunk_rows rows. The pandas metadata (index,
+        dtypes) is kept in the schema.
+        """
+        import pyarrow
+        if not isinstance(val, pandas_df_type):
+            raise errors.BadRequest(type=type(val).__name__, status='unknown')
+        table = pyarrow.Table.from_pandas(val)
+        sink = io.BytesIO()
+        writer = pyarrow.ipc.new_stream(sink, table.schema)
+        for batch in table.to_batches(max_chunksize=chunk_rows):
+            writer.write_batch(batch)
+            yield drain(sink)
+        writer.close()
+        yield drain(sink)
+
+    def arrow_revert(self, val, cls=pandas_df_type, checker=None, **kw):
+        import pyarrow
+        if isinstance(val, requests.Response):
+            val = val.content
+        table = pyarrow.ipc.open_stream(pyarrow.py_buffer(val)).read_all()
+        return table.to_pandas(split_blocks=True, self_destruct=True)
+
+    def arrow_stream_revert(self, val, cls=pandas_df_type, checker=None, **kw):
+        """
+        Decode an Arrow IPC stream as it is received, one DataFrame per record batch.
+        """
+        import pyarrow
+        if isinstance(val, requests.Response):
+            val.raw.decode_content = True
+            source = val.raw
+        else:
+            source = pyarrow.py_buffer(val)
+        for batch in pyarrow.ipc.open_stream(source):
+            yield batch.to_pandas()
+
     def pickle_convert(self, val, checker=None, **kw):
-        val = self.schema_convert(val, checker)
+        if not is_array(val):
+            val = self.schema_convert(val, checker)
         import pickle
         return pickle.dumps(val, **keep(kw, []))
 
     def pickle_revert(self, val, cls=dict, checker=None, **kw):
         if isinstance(val, requests.Response):
-            val = val.text
+            val = val.content
         import pickle
         val = pickle.loads(val, **keep(kw, []))
+        if is_array(val):
+            return val
         val = self.schema_revert(val, cls, checker=checker)
         return val
 
+    def pickle5_convert(self, val, checker=None, **kw):
+        return b''.join(self.pickle5_stream(val, checker, **kw))
+
+    def pickle5_stream(self, val, checker=None, **kw):
+        """
+        Pickle protocol 5, the large buffers (numpy arrays, pandas blocks) being sent out-of-band after the pickle:
+
+            'PYR5' | number of buffers n (uint32) | size of the pickle and of the n buffers (n + 1 uint64) |
+            pickle | buffer 1 | ... | buffer n
+
+        all little endian, the pickle and the buffers starting on 64 bytes boundaries. The buffers are yielded as
+        memoryviews of the arrays, without copy.
+        """
+        import pickle
+        import struct
+        if not is_array(val):
+            val = self.schema_convert(val, checker)
+        buffers = []
+        data = pickle.dumps(val, protocol=5, buffer_callback=buffers.append)
+        raws = [b.raw() for b in buffers]
+        sizes = [len(data)] + [r.nbytes for r in raws]
+        header = struct.pack('<4sI%dQ' % len(sizes), b'PYR5', len(raws), *sizes)
+        pos = align(len(header))
+        yield header + bytes(pos - len(header)) + data
+        pos += len(data)
+        for r in raws:
+            padding = align(pos) - pos
+            if padding:
+                yield bytes(padding)
+            yield memoryview(r)
+            pos += padding + r.nbytes
+
+    def pickle5_revert(self, val, cls=dict, checker=None, **kw):
+        """
+        Rebuild a pickle5_stream body, the out-of-band buffers being read-only views of the body, without copy: the
+        numpy arrays and pandas blocks decoded are read-only, copy them (arr.copy(), df.copy()) to modify them.
+        """
+        import pickle
+        import struct
+        if isinstance(val, requests.Response):
+            val = val.content
+        mv = memoryview(val)
+        magic, n = struct.unpack_from('<4sI', mv)
+        if magic != b'PYR5':
+            raise errors.BadRequest(type='pickle5', status='conflict')
+        sizes = struct.unpack_from('<%dQ' % (n + 1), mv, 8)
+        pos = align(8 + 8 * (n + 1))
+        data = mv[pos:pos + sizes[0]]
+        pos += sizes[0]
+        buffers = []
+        for size in sizes[1:]:
+            pos = align(pos)
+            buffers.append(mv[pos:pos + size])
+            pos += size
+        if pos > len(mv):
+            raise errors.BadRequest(status='truncated')
+        val = pickle.loads(data, buffers=buffers)
+        if is_array(val):
+            return val
+        return self.schema_revert(val, cls, checker=checker)
+
+    def codec(self, ct):
+        res = self.codecs.get(ct)
+        if res is None:
+            raise errors.BadRequest(mimetype=ct, status='unknown')
+        return res
+
     def convert(self, ct, val, **kw):
-        if ct == application.json:
-            return self.json_convert(val, **kw)
-        if ct == application.xml or ct == text.xml:
-            return self.xml_convert(val, **kw)
-        if ct == application.pickle:
-            return self.pickle_convert(val, **kw)
-        if ct == application.msgpack:
-            return self.msgpack_convert(val, **kw)
-        if ct == application.csv or ct == text.csv:
-            return self.csv_convert(val, **kw)
-        if ct == application.text or ct == text.plain:
-            return self.str_convert(val, **kw)
-        raise errors.BadRequest()
+        return self.codec(ct).encode(self, val, **kw)
 
     def revert(self, ct, val, **kw):
-        if ct == application.json:
-            return self.json_revert(val, **kw)
-        if ct == application.xml or ct == text.xml:
-            return self.xml_revert(val, **kw)
-        if ct == application.pickle:
-            return self.pickle_revert(val, **kw)
-        if ct == application.msgpack:
-            return self.msgpack_revert(val, **kw)
-        if ct == application.csv or ct == text.csv:
-            return self.csv_revert(val, **kw)
-        if ct == application.text or ct == text.plain:
-            return self.str_revert(val, **kw)
-        raise errors.BadRequest()
+        return self.codec(ct).decode(self, val, **kw)
@@ -54,6 +54,14 @@ class Gone(ClientError):
     code = status.GONE
 
 
+class PayloadTooLarge(ClientError):
+    code = status.REQUEST_ENTITY_TOO_LARGE
+
+
+class UnsupportedMediaType(ClientError):
+    code = status.UNSUPPORTED_MEDIA_TYPE
+
+
 class InternalServerError(ServerError):
     code = status.INTERNAL_SERVER_ERROR
 
@@ -90,6 +98,8 @@ def check(resp):
             raise Unauthorized(remote=True, **data)
         if code == status.GONE:
             raise Gone(remote=True, **data)
+        if code == status.UNSUPPORTED_MEDIA_TYPE:
+            raise UnsupportedMediaType(remote=True, **data)
         if code == status.INTERNAL_SERVER_ERROR:
             raise InternalServerError(remote=True, **data)
         if 400 <= code < 500:
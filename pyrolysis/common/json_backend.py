@@ -0,0 +1,145 @@
+import json
+from collections.abc import Mapping
+from datetime import date, datetime, time
+from enum import Enum
+from json import JSONEncoder
+
+
+class JSONEncoder2(JSONEncoder):
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        if isinstance(o, date):
+            return o.isoformat()
+        if isinstance(o, set):
+            return list(o)
+        if isinstance(o, type):
+            return o.__module__ + '.' + o.__name__
+        if isinstance(o, Enum):
+            return o.name
+        return JSONEncoder.default(self, o)
+
+
+def default(o):
+    if isinstance(o, (datetime, date, time)):
+        return o.isoformat()
+    if isinstance(o, set):
+        return list(o)
+    if isinstance(o, type):
+        return o.__module__ + '.' + o.__name__
+    if isinstance(o, Enum):
+        return o.name
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(o).__name__))
+
+
+def enum_names(val):
+    """
+    Replace the Enums by their names in nested dictionaries, lists and sets (the sets becoming lists), as JSONEncoder2
+    writes them. The Enums mixed with int, float or str (IntEnum, ...) are written by value by the json module and are
+    kept.
+    """
+    if isinstance(val, Enum):
+        return val if isinstance(val, (int, float, str)) else val.name
+    if isinstance(val, Mapping):
+        return dict((k, enum_names(v)) for k, v in val.items())
+    if isinstance(val, (list, tuple, set, frozenset)):
+        return [enum_names(x) for x in val]
+    return val
+
+
+def stdlib_dumps(val, **kw):
+    """
+    The compact output of the fast backends, with the json module.
+    """
+    options = dict(separators=(',', ':'), ensure_ascii=False)
+    options.update(kw)
+    return json.dumps(val, cls=JSONEncoder2, **options)
+
+
+class StdlibBackend:
+    """
+    The json module of the standard library, with JSONEncoder2.
+    """
+    name = 'json'
+    binary = False
+    needs_names = False
+
+    def dumps(self, val, **kw):
+        return json.dumps(val, cls=JSONEncoder2, **kw)
+
+    def loads(self, val, **kw):
+        return json.loads(val, **kw)
+
+
+class OrjsonBackend(StdlibBackend):
+    """
+    orjson, compact output. orjson writes the Enums by value, so the Enums of plain containers are replaced by their
+    names beforehand (needs_names). Values orjson does not support (very large integers, ...) and the calls with
+    options of json.dumps (allow_nan=False, indent, ...) go through the json module.
+    """
+    name = 'orjson'
+    binary = True
+    needs_names = True
+
+    def __init__(self):
+        import orjson
+        self.orjson = orjson
+        self.option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    def dumps(self, val, **kw):
+        if kw:
+            return stdlib_dumps(val, **kw)
+        try:
+            return self.orjson.dumps(val, default=default, option=self.option).decode()
+        except TypeError:
+            return stdlib_dumps(val)
+
+    def loads(self, val, **kw):
+        try:
+            return self.orjson.loads(val)
+        except ValueError:
+            return json.loads(val, **kw)
+
+
+class UjsonBackend(StdlibBackend):
+    """
+    ujson, compact output. The calls with options of json.dumps go through the json module.
+    """
+    name = 'ujson'
+    binary = True
+
+    def __init__(self):
+        import ujson
+        self.ujson = ujson
+
+    def dumps(self, val, **kw):
+        if kw:
+            return stdlib_dumps(val, **kw)
+        try:
+            return self.ujson.dumps(val, default=default, escape_forward_slashes=False)
+        except (TypeError, OverflowError):
+            return stdlib_dumps(val)
+
+    def loads(self, val, **kw):
+        try:
+            return self.ujson.loads(val)
+        except ValueError:
+            return json.loads(val, **kw)
+
+
+backends = {'orjson': OrjsonBackend, 'ujson': UjsonBackend, 'json': StdlibBackend}
+
+
+def get_backend(name='auto'):
+    """
+    :param name: 'orjson', 'ujson', 'json' or 'auto' for the fastest one installed
+    :return: a json backend
+    """
+    if name != 'auto':
+        return backends[name]()
+    for k in ['orjson', 'ujson']:
+        try:
+            return backends[k]()
+        except ImportError:
+            pass
+    return StdlibBackend()
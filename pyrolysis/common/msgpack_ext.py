@@ -0,0 +1,185 @@
+import dataclasses
+import operator
+import struct
+import typing
+import zlib
+from datetime import date, datetime, timedelta, timezone
+from enum import Enum
+
+DATETIME = 1
+DATETIME_TZ = 2
+DATE = 3
+ENUM_DEF = 4
+ENUM = 5
+DATACLASS_DEF = 6
+DATACLASS = 7
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_TZ = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+uint16 = struct.Struct('<H')
+int32 = struct.Struct('<i')
+int64 = struct.Struct('<q')
+
+
+def fingerprint(cls, fields):
+    """
+    :return: the schema id of a dataclass, which changes with its name and the order of its fields
+    """
+    return zlib.crc32((cls.__name__ + ':' + ','.join(fields)).encode())
+
+
+class ExtTypes:
+    """
+    msgpack extension types:
+
+    * datetime: microseconds since the epoch (int64), followed by the utc offset in seconds (int32) if it is aware
+    * date: ordinal (int32)
+    * Enum: id (uint16), member name (utf-8)
+    * dataclass: [id, fields by position]
+
+    The first occurrence of an Enum or a dataclass in a message defines its id (a small integer, the number of classes
+    already defined in the message) and carries the name of the class, and for a dataclass its schema id and the
+    names of its fields. The following occurrences only carry the id.
+
+    The dataclasses and the Enums of the registered classes are rebuilt when decoding, the other dataclasses become
+    dictionaries and the other Enums their names.
+    """
+
+    def __init__(self):
+        self.classes = {}
+        self.enums = {}
+        self.fields = {}
+        self.registered = set()
+
+    def register(self, cls):
+        if cls in self.registered:
+            return
+        self.registered.add(cls)
+        fields = self.positional(cls)
+        if fields is not None:
+            self.classes[fingerprint(cls, fields)] = cls
+        for tp in typing.get_type_hints(cls).values():
+            self.register_type(tp)
+
+    def register_type(self, tp):
+        for arg in getattr(tp, '__args__', None) or ():
+            self.register_type(arg)
+        if isinstance(tp, type) and issubclass(tp, Enum):
+            self.enums[tp.__name__] = tp
+        elif dataclasses.is_dataclass(tp):
+            self.register(tp)
+
+    def positional(self, cls):
+        """
+        :return: the names of the fields of a dataclass in the order of its constructor, None if it is not a
+        dataclass or if it has fields which are not in its constructor
+        """
+        try:
+            return self.fields[cls]
+        except KeyError:
+            pass
+        res = None
+        if dataclasses.is_dataclass(cls):
+            fields = dataclasses.fields(cls)
+            if all(f.init for f in fields):
+                res = tuple(f.name for f in fields)
+        self.fields[cls] = res
+        return res
+
+    def packb(self, val):
+        import msgpack
+        ExtType = msgpack.ExtType
+        ids = {}
+
+        def pack(v):
+            return msgpack.packb(v, default=default, use_bin_type=True)
+
+        def pack_datetime(o):
+            if o.tzinfo is None:
+                return ExtType(DATETIME, int64.pack((o - EPOCH) // MICROSECOND))
+            return ExtType(DATETIME_TZ, struct.pack('<qi', (o - EPOCH_TZ) // MICROSECOND,
+                                                    int(o.utcoffset().total_seconds())))
+
+        def pack_date(o):
+            return ExtType(DATE, int32.pack(o.toordinal()))
+
+        def enum_packer(i):
+            prefix = uint16.pack(i)
+            return lambda o: ExtType(ENUM, prefix + o.name.encode())
+
+        def dataclass_packer(i, fields):
+            getters = [operator.attrgetter(f) for f in fields]
+            return lambda o: ExtType(DATACLASS, pack([i] + [g(o) for g in getters]))
+
+        packers = {datetime: pack_datetime, date: pack_date}
+
+        def default(o):
+            t = type(o)
+            f = packers.get(t)
+            if f is not None:
+                return f(o)
+            if isinstance(o, datetime):
+                return pack_datetime(o)
+            if isinstance(o, date):
+                return pack_date(o)
+            if isinstance(o, Enum):
+                i = ids[t] = len(ids)
+                packers[t] = enum_packer(i)
+                return ExtType(ENUM_DEF, msgpack.packb(i) + msgpack.packb(t.__name__) + msgpack.packb(o.name))
+            fields = self.positional(t)
+            if fields is not None:
+                i = ids[t] = len(ids)
+                packers[t] = dataclass_packer(i, fields)
+                return ExtType(DATACLASS_DEF, msgpack.packb(i) + msgpack.packb(fingerprint(t, fields)) +
+                               msgpack.packb(t.__name__) + msgpack.packb(fields) +
+                               pack([getattr(o, f) for f in fields]))
+            if isinstance(o, (set, frozenset)):
+                return list(o)
+            raise TypeError('Object of type {} is not msgpack serializable'.format(t.__name__))
+
+        return pack(val)
+
+    def ext_hook(self):
+        """
+        :return: a new ext_hook for msgpack.unpackb or msgpack.Unpacker, one per message
+        """
+        import msgpack
+        unpackb = msgpack.unpackb
+        fromordinal = date.fromordinal
+        builders = {}
+
+        def hook(code, data):
+            if code == DATACLASS:
+                values = unpackb(data, ext_hook=hook, raw=False)
+                return builders[values[0]](*values[1:])
+            if code == DATE:
+                return fromordinal(int32.unpack(data)[0])
+            if code == DATETIME:
+                return EPOCH + timedelta(microseconds=int64.unpack(data)[0])
+            if code == ENUM:
+                return builders[uint16.unpack_from(data)[0]](data[2:].decode())
+            if code == DATETIME_TZ:
+                micro, offset = struct.unpack('<qi', data)
+                return (EPOCH_TZ + timedelta(microseconds=micro)).astimezone(timezone(timedelta(seconds=offset)))
+            if code == DATACLASS_DEF or code == ENUM_DEF:
+                unpacker = msgpack.Unpacker(ext_hook=hook, raw=False)
+                unpacker.feed(data)
+                i = unpacker.unpack()
+                if code == ENUM_DEF:
+                    e = self.enums.get(unpacker.unpack())
+                    builder = builders[i] = e.__getitem__ if e else str
+                    return builder(unpacker.unpack())
+                builder = self.classes.get(unpacker.unpack())
+                unpacker.unpack()
+                fields = unpacker.unpack()
+                if builder is None:
+                    builder = lambda *values: dict(zip(fields, values))
+                builders[i] = builder
+                return builder(*unpacker.unpack())
+            return msgpack.ExtType(code, data)
+        return hook
+
+    def unpackb(self, val):
+        import msgpack
+        return msgpack.unpackb(val, ext_hook=self.ext_hook(), raw=False)
@@ -0,0 +1,233 @@
+import dataclasses
+import typing
+from datetime import date, datetime
+from enum import Enum
+
+
+class Unsupported(Exception):
+    pass
+
+
+# the exceptions raised by a generated load on input it does not accept, the caller then falls back on marshmallow
+load_errors = (TypeError, ValueError, KeyError)
+
+# the exceptions raised by a generated dump on a value whose fields do not have the declared types (a str for a date,
+# a value for an Enum, ...), the caller then falls back on marshmallow
+dump_errors = (AttributeError, TypeError, ValueError)
+
+# the field metadata handled by marshmallow (validation, defaults, renaming), the fields having one are left to it
+marshmallow_metadata = {'validate', 'required', 'allow_none', 'load_default', 'missing', 'dump_default', 'default',
+                        'data_key', 'attribute', 'load_only', 'dump_only', 'error_messages', 'marshmallow_field'}
+
+
+class Serializer:
+    """
+    Specialised encoder/decoder of a dataclass, generated from its fields.
+
+    dump returns the same dictionary as the marshmallow schema, load builds the dataclass back. load only accepts
+    well formed input: any surprise (missing or unknown key, unexpected type) raises one of load_errors and the caller
+    falls back on the marshmallow schema, which does the full validation. The dataclasses having fields with
+    marshmallow metadata (validate, required, ...) have no serializer.
+    """
+
+    def __init__(self, cls, dump, load):
+        self.cls = cls
+        self.dump = dump
+        self.load = load
+
+    def dump_many(self, lst):
+        dump = self.dump
+        return [dump(x) for x in lst]
+
+    def load_many(self, lst):
+        load = self.load
+        return [load(x) for x in lst]
+
+
+def _fail(v):
+    raise TypeError(type(v).__name__)
+
+
+def load_str(v):
+    if type(v) is str:
+        return v
+    _fail(v)
+
+
+def load_int(v):
+    t = type(v)
+    if t is int:
+        return v
+    if t is str:
+        return int(v)
+    _fail(v)
+
+
+def load_float(v):
+    t = type(v)
+    if t is float:
+        return v
+    if t is int or t is str:
+        return float(v)
+    _fail(v)
+
+
+def load_bool(v):
+    if type(v) is bool:
+        return v
+    _fail(v)
+
+
+def load_date(v):
+    t = type(v)
+    if t is str:
+        return date.fromisoformat(v)
+    if t is date:
+        return v
+    _fail(v)
+
+
+def load_datetime(v):
+    t = type(v)
+    if t is str:
+        return datetime.fromisoformat(v)
+    if t is datetime:
+        return v
+    _fail(v)
+
+
+def dump_iso(v):
+    return v.isoformat()
+
+
+def dump_name(v):
+    return v.name
+
+
+scalar_loaders = {str: load_str, int: load_int, float: load_float, bool: load_bool, date: load_date,
+                  datetime: load_datetime}
+scalar_dumpers = {str: None, int: None, float: float, bool: None, date: dump_iso, datetime: dump_iso}
+
+
+def optional(f):
+    def g(v):
+        return None if v is None else f(v)
+    return g
+
+
+def enum_loader(cls):
+    def load(v):
+        if type(v) is str:
+            return cls[v]
+        if type(v) is cls:
+            return v
+        _fail(v)
+    return load
+
+
+def list_loader(f):
+    def load(v):
+        if type(v) is not list:
+            _fail(v)
+        return [f(x) for x in v]
+    return load
+
+
+def list_dumper(f):
+    if f is None:
+        return list
+    return lambda v: [f(x) for x in v]
+
+
+def nested_loader(compiled, cls):
+    def load(v):
+        if type(v) is not dict:
+            _fail(v)
+        return compiled[cls].load(v)
+    return load
+
+
+def nested_dumper(compiled, cls):
+    return lambda v: compiled[cls].dump(v)
+
+
+def resolve(tp, compiled):
+    """
+    :return: the couple (dumper, loader) of a type annotation, dumper is None when the value is kept as is
+    """
+    origin = getattr(tp, '__origin__', None)
+    args = getattr(tp, '__args__', None) or ()
+    if origin is typing.Union:
+        others = [a for a in args if a is not type(None)]
+        if len(others) != 1 or len(others) == len(args):
+            raise Unsupported(tp)
+        dumper, loader = resolve(others[0], compiled)
+        return dumper and optional(dumper), optional(loader)
+    if origin in (list, typing.List):
+        if len(args) != 1:
+            raise Unsupported(tp)
+        dumper, loader = resolve(args[0], compiled)
+        return list_dumper(dumper), list_loader(loader)
+    if tp in scalar_loaders:
+        return scalar_dumpers[tp], scalar_loaders[tp]
+    if isinstance(tp, type) and issubclass(tp, Enum):
+        return dump_name, enum_loader(tp)
+    if dataclasses.is_dataclass(tp):
+        build(tp, compiled)
+        return nested_dumper(compiled, tp), nested_loader(compiled, tp)
+    raise Unsupported(tp)
+
+
+def build(cls, compiled):
+    if cls in compiled:
+        return compiled[cls]
+    compiled[cls] = None
+    hints = typing.get_type_hints(cls)
+    fields = dataclasses.fields(cls)
+    env = {'_cls': cls, '_keys': frozenset(f.name for f in fields), '_fail': _fail}
+    dump_items = []
+    load_lines = []
+    load_args = []
+    for i, f in enumerate(fields):
+        if not f.init or marshmallow_metadata.intersection(f.metadata):
+            raise Unsupported(f.name)
+        dumper, loader = resolve(hints[f.name], compiled)
+        env['_d%d' % i] = dumper
+        env['_l%d' % i] = loader
+        if dumper is None:
+            dump_items.append('{0!r}: o.{1}'.format(f.name, f.name))
+        else:
+            dump_items.append('{0!r}: None if o.{1} is None else _d{2}(o.{1})'.format(f.name, f.name, i))
+        if f.default is dataclasses.MISSING and f.default_factory is dataclasses.MISSING:
+            load_args.append('{0}=_l{1}(d[{0!r}])'.format(f.name, i))
+        else:
+            load_lines.append('    if {0!r} in d:\n        kw[{0!r}] = _l{1}(d[{0!r}])'.format(f.name, i))
+    src = 'def dump(o):\n    return {' + ', '.join(dump_items) + '}\n\n'
+    src += 'def load(d):\n    if not _keys.issuperset(d):\n        _fail(d)\n'
+    if load_lines:
+        src += '    kw = {}\n' + '\n'.join(load_lines) + '\n'
+        load_args.append('**kw')
+    src += '    return _cls(' + ', '.join(load_args) + ')\n'
+    exec(compile(src, '<serializer ' + cls.__qualname__ + '>', 'exec'), env)
+    res = Serializer(cls, env['dump'], env['load'])
+    compiled[cls] = res
+    return res
+
+
+def compile_serializer(cls, compiled=None):
+    """
+    Generate the serializer of a dataclass (and of the dataclasses it contains).
+
+    :param cls: the dataclass
+    :param compiled: cache of the serializers already generated
+    :return: the serializer or None if a field has a type which is not supported
+    """
+    if compiled is None:
+        compiled = {}
+    try:
+        return build(cls, compiled)
+    except Unsupported:
+        for k in [k for k, v in compiled.items() if v is None]:
+            del compiled[k]
+        compiled.pop(cls, None)
+        return None
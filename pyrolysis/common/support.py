@@ -69,7 +69,7 @@ def extract_call_info(func, func_args, func_kwargs):
     kwargs = dict(func_kwargs)
     msg = {'name': func.__name__, 'module': func.__module__, 'args': args}
     nb = func.__code__.co_argcount
-    j = 0
+    first_default = nb - len(defaults)
     for i in range(nb):
         name = func.__code__.co_varnames[i]
         if i < len(func_args):
@@ -77,9 +77,8 @@ def extract_call_info(func, func_args, func_kwargs):
         elif name in kwargs:
             args[name] = repr(kwargs[name])
             del kwargs[name]
-        else:
-            args[name] = repr(defaults[j])
-            j += 1
+        elif i >= first_default:
+            args[name] = repr(defaults[i - first_default])
     if kwargs:
         args['kwargs'] = dict((k, repr(v)) for k, v in kwargs.items())
     if len(func_args) > nb:
@@ -1,3 +1,5 @@
+import collections.abc
+import typing
 from datetime import date, datetime
 from pyrolysis.common import pandas_df_type, converter
 
@@ -8,14 +10,27 @@ format_convert = {int: 'int32', date: 'date', datetime: 'date-time'}
 
 type_revert = {'integer': int, 'number': float, 'boolean': bool}
 str_revert = {'date': date, 'date-time': datetime}
+array_origins = [list, typing.List, typing.Iterable, typing.Iterator, typing.Generator,
+                 collections.abc.Iterable, collections.abc.Iterator, collections.abc.Generator,
+                 collections.abc.AsyncIterable, collections.abc.AsyncIterator, collections.abc.AsyncGenerator]
+
+
+def get_item_type(tp):
+    """
+    :return: (X, True) for annotations like List[X], Iterator[X], Generator[X, ...] or AsyncIterator[X], (tp, False)
+    otherwise
+    """
+    if getattr(tp, '__origin__', None) in array_origins and getattr(tp, '__args__', None):
+        return tp.__args__[0], True
+    return tp, False
 
 
 def get_type(data):
     r = data.get('$ref', None)
     if r:
-        if r[:14] != '#/definitions/' or r[14:] not in converter.schemas:
+        if r[:14] != '#/definitions/':
             raise Exception()
-        return r[14:], False
+        return converter.Converter.names.get(r[14:], r[14:]), False
     t = data.get('type', None)
     if t in type_revert:
         return type_revert[t], False
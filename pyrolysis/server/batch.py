@@ -0,0 +1,139 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.routing import BuildError
+from werkzeug.test import EnvironBuilder
+
+from pyrolysis.common import errors
+from pyrolysis.common.converter import application
+
+inherited_excluded = {'content-type', 'content-length', 'content-encoding', 'accept', 'accept-encoding',
+                      'if-none-match', 'if-modified-since', 'transfer-encoding'}
+
+
+class BatchPlan:
+    """
+    The /batch route of a service: a list of calls [operationId, arguments, headers] in one json or msgpack body,
+    answered by the list of their {status, headers, body}.
+
+    Each call is dispatched as a request to its operation, so that it goes through the same extraction, roles,
+    caching and encoding. The arguments are placed in the path, the query, the headers, the cookies or the body
+    according to the location of the parameters, the headers of the batch request (authentication) being those of
+    the calls. The bodies are bytes in msgpack and strings in json.
+    """
+
+    def __init__(self, service, threads=0, max_calls=1000):
+        self.service = service
+        self.max_calls = max_calls
+        self.adapter = service.flask.url_map.bind('localhost')
+        self.pool = ThreadPoolExecutor(threads, thread_name_prefix='pyrolysis-batch') if threads > 1 else None
+
+    def calls(self, req):
+        """
+        :return: the calls of a batch request
+        """
+        data = self.service.decompress(req.headers.get('Content-Encoding'), req.get_data())
+        if req.mimetype == application.json:
+            calls = self.service.json.loads(data)
+        elif req.mimetype in (application.msgpack, application.msgpack_ext):
+            calls = self.service.msgpack_ext.unpackb(data)
+        else:
+            raise errors.BadRequest(mimetype=req.content_type, status='unknown')
+        if not isinstance(calls, list):
+            raise errors.BadRequest(type=type(calls).__name__, status='conflict')
+        if len(calls) > self.max_calls:
+            raise errors.BadRequest(calls=len(calls), max_calls=self.max_calls, status='conflict')
+        return calls
+
+    def environ(self, call, base):
+        """
+        :param call: [operationId, arguments, headers], the headers being optional
+        :param base: the url root and the headers of the batch request, the mimetype of the bodies
+        :return: the WSGI environment of the request calling the operation
+        """
+        op, arguments, headers = (list(call) + [None, None])[:3]
+        operation = self.service.operations.get(op)
+        if operation is None:
+            raise errors.NotFound(operationId=op, status='unknown')
+        endpoint, method, parameters = operation
+        arguments = dict(arguments or {})
+        headers = dict(base['headers'], **(headers or {}))
+        headers.setdefault('Accept', base['accept'])
+        path = {}
+        cookies = []
+        data = None
+        for p in parameters:
+            if p.name not in arguments:
+                continue
+            val = arguments.pop(p.name)
+            if p.location == 'body':
+                if isinstance(val, (bytes, bytearray)):
+                    headers.setdefault('Content-Type', base['mimetype'])
+                else:
+                    val = self.service.convert(base['mimetype'], val)
+                    headers['Content-Type'] = base['mimetype']
+                data = val
+                continue
+            val = self.service.str_convert(val)
+            key = p.exposed_name or p.name
+            if p.location == 'path':
+                path[key] = val
+            elif p.location == 'header':
+                headers[key] = val
+            elif p.location == 'cookie':
+                cookies.append(key + '=' + val)
+            else:
+                arguments[key] = val
+        if cookies:
+            headers['Cookie'] = '; '.join(([headers['Cookie']] if headers.get('Cookie') else []) + cookies)
+        query = dict((k, self.service.str_convert(v)) for k, v in arguments.items())
+        try:
+            url = self.adapter.build(endpoint, path, method=method)
+        except BuildError:
+            raise errors.BadRequest(operationId=op, path=list(path), status='missing')
+        return EnvironBuilder(path=url, base_url=base['url'], method=method, headers=headers, data=data,
+                              query_string=query, environ_base=base['environ']).get_environ()
+
+    def call(self, call, base):
+        """
+        :return: the {status, headers, body} of a call
+        """
+        text = base['text']
+        app = self.service.flask
+        try:
+            environ = self.environ(call, base)
+            with app.request_context(environ):
+                response = app.full_dispatch_request()
+                try:
+                    body = response.get_data()
+                finally:
+                    response.close()
+            if text:
+                try:
+                    body = body.decode()
+                except UnicodeDecodeError:
+                    raise errors.BadRequest(mimetype=response.mimetype, status='unknown')
+            headers = dict((k, v) for k, v in response.headers.items() if k != 'Content-Length')
+            return {'status': response.status_code, 'headers': headers, 'body': body}
+        except errors.PyrolysisException as e:
+            body = self.service.json_dumps(e.data, allow_nan=False)
+            return {'status': int(e.code), 'headers': {'Content-Type': application.json},
+                    'body': body if text else body.encode()}
+
+    def run(self, req, kind):
+        """
+        :param req: the batch request
+        :param kind: the mimetype of the response, json or msgpack
+        :return: the results of its calls, in order
+        """
+        calls = self.calls(req)
+        base = {
+            'url': req.url_root,
+            'headers': dict((k, v) for k, v in req.headers.items() if k.lower() not in inherited_excluded),
+            'mimetype': application.json if req.mimetype == application.json else application.msgpack_ext,
+            'text': kind == application.json,
+            'accept': application.json if kind == application.json else application.msgpack_ext + ', */*;q=0.5',
+            'environ': {'REMOTE_ADDR': req.remote_addr},
+        }
+        if self.pool is None or len(calls) < 2:
+            return [self.call(c, base) for c in calls]
+        return list(self.pool.map(lambda c: self.call(c, base), calls))
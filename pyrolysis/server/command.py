@@ -1,7 +1,22 @@
+import argparse
+import errno
+import gc
+import importlib
+import logging
+import os
+import select
+import signal
+import socket
+import sys
 import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import flask
 import requests
 import time
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+logger = logging.getLogger(__name__)
 
 
 def start_server(app: flask.Flask, port=5000):
@@ -24,3 +39,304 @@ def start_server_background(app: flask.Flask, port=5000):
     server_thread = threading.Thread(target=start_server, args=(app, port))
     server_thread.start()
     time.sleep(0.1)
+
+
+def load_app(app):
+    """
+    :param app: a flask application, a ServerService or the name of one of them like 'module:attribute'
+    :return: the flask application
+    """
+    if isinstance(app, str):
+        module, _, name = app.partition(':')
+        app = getattr(importlib.import_module(module), name or 'app')
+    return getattr(app, 'flask', app)
+
+
+def listen(host, port, backlog=1024, reuse_port=False):
+    """
+    :return: a listening socket, several processes can listen on the same port with reuse_port (SO_REUSEPORT), the
+    kernel balancing the connections between them
+    """
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class PooledRequestHandler(WSGIRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    timeout = 30
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    WSGI server handling its requests on a fixed pool of threads. drain stops accepting connections and waits for the
+    requests in progress.
+    """
+    multithread = True
+
+    def __init__(self, host, port, app, threads=8, fd=None, handler=PooledRequestHandler):
+        super().__init__(host, port, app, handler=handler, fd=fd)
+        self.pool = ThreadPoolExecutor(threads, thread_name_prefix='pyrolysis')
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def drain(self):
+        threading.Thread(target=self.shutdown, daemon=True).start()
+
+    def serve_forever(self, poll_interval=0.5):
+        try:
+            super().serve_forever(poll_interval)
+        finally:
+            self.pool.shutdown(wait=True)
+
+
+def is_ready(app):
+    """
+    :return: False if the /health route of the application answers an error
+    """
+    return app.test_client().get('/health').status_code < 500
+
+
+class Launcher:
+    """
+    Pre-fork server: the application is imported once by the master process, which then forks the workers. Each
+    worker serves the requests with a pool of threads.
+
+    * the workers share a listening socket, or listen each on their own with SO_REUSEPORT where it is available
+    * gc.freeze is called before forking, so that the pages of the application stay shared between the workers
+    * a worker is ready when its /health route answers
+    * SIGHUP starts a new generation of workers, the previous one being drained when it is ready
+    * SIGTERM and SIGINT drain the workers and stop, a worker still busy after graceful_timeout is killed
+    * the workers which die are restarted
+
+    An application given by name is imported by the workers when preload is False, a reload then loads the new code.
+    """
+
+    def __init__(self, app, host='0.0.0.0', port=5000, workers=None, threads=8, backlog=1024, preload=True,
+                 reuse_port=None, graceful_timeout=30, timeout=30):
+        self.app = load_app(app) if preload or not isinstance(app, str) else app
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.threads = threads
+        self.backlog = backlog
+        self.reuse_port = hasattr(socket, 'SO_REUSEPORT') if reuse_port is None else reuse_port
+        self.graceful_timeout = graceful_timeout
+        self.handler = type('RequestHandler', (PooledRequestHandler,), {'timeout': timeout})
+        self.socket = None
+        self.children = {}
+        self.generation = 0
+        self.stopping = False
+        self.reloading = False
+        self.wakeup = None
+
+    def run(self):
+        if not self.reuse_port:
+            self.socket = listen(self.host, self.port, self.backlog)
+        elif self.port == 0:
+            self.socket = listen(self.host, self.port, self.backlog, reuse_port=True)
+            self.port = self.socket.getsockname()[1]
+            self.socket.close()
+            self.socket = None
+        if hasattr(gc, 'freeze'):
+            gc.collect()
+            gc.freeze()
+        self.wakeup = os.pipe()
+        for fd in self.wakeup:
+            os.set_blocking(fd, False)
+        for s in [signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD]:
+            signal.signal(s, self.on_signal)
+        self.spawn_generation()
+        while not self.stopping or self.children:
+            select.select([self.wakeup[0]], [], [], 1.0)
+            self.drain_pipe()
+            self.reap()
+            if self.stopping:
+                self.stop()
+            elif self.reloading:
+                self.reloading = False
+                self.reload()
+            else:
+                self.respawn()
+        if self.socket:
+            self.socket.close()
+
+    def on_signal(self, signum, frame):
+        if signum in (signal.SIGTERM, signal.SIGINT):
+            self.stopping = True
+        elif signum == signal.SIGHUP:
+            self.reloading = True
+        try:
+            os.write(self.wakeup[1], b'.')
+        except OSError:
+            pass
+
+    def drain_pipe(self):
+        try:
+            while os.read(self.wakeup[0], 4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def spawn_generation(self):
+        """
+        Start a new generation of workers.
+
+        :return: the pids of the workers of the generation which are ready
+        """
+        self.generation += 1
+        pipes = [self.spawn() for _ in range(self.workers)]
+        return self.wait_ready(pipes)
+
+    def spawn(self):
+        r, w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(r)
+            try:
+                self.worker(w)
+            except BaseException:
+                logger.exception('Worker failed')
+                os._exit(1)
+            os._exit(0)
+        os.close(w)
+        self.children[pid] = {'generation': self.generation, 'started': time.monotonic(), 'stopped': None}
+        return pid, r
+
+    def wait_ready(self, pipes):
+        ready = []
+        deadline = time.monotonic() + self.graceful_timeout
+        pending = dict((r, pid) for pid, r in pipes)
+        while pending and time.monotonic() < deadline:
+            try:
+                readable = select.select(list(pending), [], [], deadline - time.monotonic())[0]
+            except InterruptedError:
+                continue
+            for r in readable:
+                if os.read(r, 1):
+                    ready.append(pending[r])
+                os.close(r)
+                del pending[r]
+        for r in pending:
+            os.close(r)
+        return ready
+
+    def worker(self, ready):
+        for s in [signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD]:
+            signal.signal(s, signal.SIG_DFL)
+        os.close(self.wakeup[0])
+        os.close(self.wakeup[1])
+        app = load_app(self.app)
+        sock = self.socket or listen(self.host, self.port, self.backlog, reuse_port=True)
+        server = PooledWSGIServer(self.host, self.port, app, self.threads, fd=sock.fileno(), handler=self.handler)
+
+        def drain(signum, frame):
+            app.config['PYROLYSIS_DRAINING'] = True
+            server.drain()
+        signal.signal(signal.SIGTERM, drain)
+        signal.signal(signal.SIGINT, drain)
+        os.write(ready, b'1' if is_ready(app) else b'')
+        os.close(ready)
+        server.serve_forever()
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            child = self.children.pop(pid, None)
+            if child and child['stopped'] is None and not self.stopping:
+                logger.warning('Worker %d exited with status %d', pid, status)
+
+    def kill_late(self):
+        now = time.monotonic()
+        for pid, child in self.children.items():
+            if child['stopped'] is not None and now - child['stopped'] > self.graceful_timeout:
+                self.signal(pid, signal.SIGKILL)
+
+    def signal(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                raise
+
+    def terminate(self, pids):
+        now = time.monotonic()
+        for pid in pids:
+            child = self.children.get(pid)
+            if child and child['stopped'] is None:
+                child['stopped'] = now
+                self.signal(pid, signal.SIGTERM)
+
+    def stop(self):
+        self.terminate(list(self.children))
+        self.kill_late()
+
+    def reload(self):
+        old = [pid for pid, child in self.children.items() if child['generation'] == self.generation]
+        if self.spawn_generation():
+            self.terminate(old)
+        else:
+            logger.error('No worker of generation %d is ready, keeping the previous one', self.generation)
+            self.terminate([pid for pid, child in self.children.items() if child['generation'] == self.generation])
+            self.generation -= 1
+
+    def respawn(self):
+        self.kill_late()
+        current = [pid for pid, child in self.children.items()
+                   if child['generation'] == self.generation and child['stopped'] is None]
+        for _ in range(self.workers - len(current)):
+            self.wait_ready([self.spawn()])
+
+
+def serve(app, host='0.0.0.0', port=5000, workers=None, threads=8, **options):
+    """
+    Run a production server, see Launcher.
+
+    :param app: a flask application, a ServerService or its name like 'module:attribute'
+    :param workers: number of processes, the number of cpus by default
+    :param threads: number of threads per process
+    """
+    Launcher(app, host=host, port=port, workers=workers, threads=threads, **options).run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a pyrolysis service with several processes')
+    parser.add_argument('app', help='module:attribute of the flask application or of the ServerService')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=None, help='number of processes, one per cpu by default')
+    parser.add_argument('--threads', type=int, default=8, help='number of threads per process')
+    parser.add_argument('--backlog', type=int, default=1024)
+    parser.add_argument('--graceful-timeout', type=float, default=30)
+    parser.add_argument('--timeout', type=float, default=30, help='timeout of the idle connections')
+    parser.add_argument('--no-preload', dest='preload', action='store_false',
+                        help='import the application in the workers, SIGHUP then reloads its code')
+    args = parser.parse_args(argv)
+    sys.path.insert(0, os.getcwd())
+    logging.basicConfig(level=logging.INFO)
+    serve(args.app, host=args.host, port=args.port, workers=args.workers, threads=args.threads,
+          backlog=args.backlog, graceful_timeout=args.graceful_timeout, timeout=args.timeout, preload=args.preload)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+import base64
+import heapq
+import itertools
+import json
+from collections.abc import Mapping
+from datetime import date, datetime
+
+from pyrolysis import common
+from pyrolysis.common import errors
+from pyrolysis.common.converter import Converter
+
+
+def encode_cursor(state):
+    """
+    :param state: the position of a page, {'k': last key} ({'k': string, 't': type} for the dates) or {'o': offset}
+    :return: an opaque cursor
+    """
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(',', ':')).encode()).rstrip(b'=').decode()
+
+
+def decode_cursor(cursor):
+    """
+    :return: the position of a page, None for the first page
+    """
+    if not cursor:
+        return None
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise errors.BadRequest(parameter='cursor', status='conflict')
+    if not isinstance(state, dict) or not ('k' in state or isinstance(state.get('o'), int)):
+        raise errors.BadRequest(parameter='cursor', status='conflict')
+    return state
+
+
+cursor_types = {'date': date, 'datetime': datetime}
+
+
+def key_state(converter, key):
+    """
+    :param key: the last key of a page, a number, a string, a date or a datetime
+    :return: the state of the next cursor, the dates being written as strings with their type
+    """
+    if isinstance(key, datetime):
+        return {'k': converter.str_convert(key), 't': 'datetime'}
+    if isinstance(key, date):
+        return {'k': converter.str_convert(key), 't': 'date'}
+    return {'k': getattr(key, 'item', lambda: key)()}
+
+
+def state_key(converter, state):
+    """
+    :return: the last key of a cursor state
+    """
+    tp = state.get('t')
+    if tp is None:
+        return state['k']
+    if tp not in cursor_types or not isinstance(state['k'], str):
+        raise errors.BadRequest(parameter='cursor', status='conflict')
+    return converter.str_parser(cursor_types[tp])(state['k'])
+
+
+def is_query(res):
+    return hasattr(res, 'column_descriptions') and hasattr(res, 'limit')
+
+
+class Pager:
+    """
+    How an operation pages its results, computed when the operation is declared. The handler returns all of them,
+    as a list, a generator or a SQLAlchemy query, and the pager reads one page after the position of the cursor.
+
+    With a key (an attribute, a field or a column of the elements, a number or a string), the cursors are keysets: the
+    page holds the smallest keys above the last key of the previous one, whatever the order of the results. A query is
+    filtered and ordered by the key, the other results are scanned until the end keeping the limit + 1 smallest keys,
+    so that reading all the pages costs O(N²): handlers returning results sorted by key should declare it (ordered),
+    the results being then read only as far as the page needs. Without key the cursors are offsets.
+    """
+
+    def __init__(self, page_size, key=None, max_page_size=None, converter=None, ordered=False):
+        self.page_size = page_size
+        self.ordered = ordered
+        self.converter = converter or Converter()
+        self.key = key
+        self.max_page_size = max_page_size or 10 * page_size
+
+    def limit(self, limit):
+        if limit is None:
+            return self.page_size
+        if limit < 1:
+            raise errors.BadRequest(parameter='limit', value=limit, status='conflict')
+        return min(limit, self.max_page_size)
+
+    def get_key(self, x):
+        return x[self.key] if isinstance(x, Mapping) else getattr(x, self.key)
+
+    def page(self, res, cursor=None, limit=None):
+        """
+        :param res: the result of the handler
+        :return: the couple (elements of the page, cursor of the next page or None)
+        """
+        state = decode_cursor(cursor)
+        limit = self.limit(limit)
+        if self.key is not None and state is not None:
+            if 'k' not in state:
+                raise errors.BadRequest(parameter='cursor', status='conflict')
+            state['k'] = state_key(self.converter, state)
+        offset = state['o'] if state and 'o' in state else 0
+        if isinstance(res, common.pandas_df_type):
+            if self.key is not None:
+                if state is not None:
+                    res = res[res[self.key] > state['k']]
+                items = res.sort_values(self.key).iloc[:limit + 1]
+            else:
+                items = res.iloc[offset:offset + limit + 1]
+        elif is_query(res):
+            if self.key is not None:
+                column = getattr(res.column_descriptions[0]['entity'], self.key)
+                if state is not None:
+                    res = res.filter(column > state['k'])
+                items = res.order_by(None).order_by(column).limit(limit + 1).all()
+            else:
+                items = res.offset(offset).limit(limit + 1).all()
+        else:
+            it = iter(res)
+            try:
+                if self.key is not None and self.ordered:
+                    if state is not None:
+                        last = state['k']
+                        it = itertools.dropwhile(lambda x: self.get_key(x) <= last, it)
+                    items = list(itertools.islice(it, limit + 1))
+                elif self.key is not None:
+                    if state is not None:
+                        last = state['k']
+                        it = (x for x in it if self.get_key(x) > last)
+                    items = heapq.nsmallest(limit + 1, it, key=self.get_key)
+                else:
+                    items = list(itertools.islice(it, offset, offset + limit + 1))
+            finally:
+                if hasattr(res, 'close'):
+                    res.close()
+        if len(items) <= limit:
+            return items, None
+        items = items[:limit]
+        if self.key is None:
+            return items, encode_cursor({'o': offset + limit})
+        if isinstance(items, common.pandas_df_type):
+            return items, encode_cursor(key_state(self.converter, items[self.key].iloc[-1]))
+        return items, encode_cursor(key_state(self.converter, self.get_key(items[-1])))
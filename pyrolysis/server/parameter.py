@@ -1,3 +1,4 @@
+import inspect
 from abc import ABC
 from datetime import date, datetime
 from enum import Enum
@@ -33,6 +34,9 @@ class Parameter(ABC):
         self.array = array
         self.hidden = hidden
         self.exposed_name = exposed_name
+        self.codec = None
+        self.parser = None
+        self.trusted = False
 
     def set_default(self, v):
         if self.defaultValue is None:
@@ -60,35 +64,64 @@ class Parameter(ABC):
         elif self.type != v:
             raise errors.InvalidSwaggerDefinition(parameter=self.name, type=self.type, value=v, status='conflict')
 
+    def resolve_codec(self):
+        self.codec = self.service.codec(converter.application.text)
+        self.parser = self.service.str_parser(self.type, self.array)
+
     def get(self):
         raise NotImplementedError()
 
+    def getter(self):
+        """
+        :return: a function reading the raw value of the parameter from a request
+        """
+        return lambda req: self.get()
+
+    def revert(self, res):
+        return self.parser(res)
+
     def extract(self):
-        res = self.get()
-        if res is None:
-            if self.required:
-                raise errors.BadRequest(parameter=self.name, status='missing')
-            else:
-                return self.defaultValue
-        try:
-            mimetype = flask.request.content_type if self.location == 'body' else converter.application.text
-            res = self.service.revert(mimetype, res, cls=self.type, many=self.array,
-                                            encoding=flask.request.content_encoding)
-            if self.enum is not None:
-                if res not in self.enum:
-                    raise errors.BadRequest(parameter=self.name, enum=self.enum, status='unknown')
+        return self.extractor()(flask.request)
+
+    def extractor(self):
+        """
+        :return: a function extracting the value of the parameter from a request, the lookups being done once
+        """
+        get = self.getter()
+        parse = self.parser if type(self).revert is Parameter.revert else self.revert
+        name = self.name
+        required = self.required
+        default = self.defaultValue
+        enum = self.enum
+
+        def extract(req):
+            res = get(req)
+            if res is None:
+                if required:
+                    raise errors.BadRequest(parameter=name, status='missing')
+                return default
+            try:
+                res = parse(res)
+            except errors.PyrolysisException as e:
+                e.put(parameter=name)
+                raise e
+            except Exception:
+                raise errors.BadRequest(parameter=name, status='conflict')
+            if enum is not None and res not in enum:
+                raise errors.BadRequest(parameter=name, enum=enum, status='unknown')
             return res
-        except errors.PyrolysisException as e:
-            e.put(parameter=self.name)
-            raise e
-        except Exception as e:
-            raise errors.BadRequest(parameter=self.name, status='conflict')
+        return extract
 
     def json(self):
         if issubclass(self.type, Enum):
             tp = 'string'
         else:
             tp = swagger.type_convert.get(self.type, 'object')
+        if self.array:
+            return purge({"name": self.name, "in": self.location, "type": "array", "collectionFormat": "csv",
+                          "items": purge({"type": tp, "format": swagger.format_convert.get(self.type, None),
+                                          "enum": self.enum}),
+                          "required": self.required, "description": self.description, "default": self.defaultValue})
         return purge({"name": self.name, "in": self.location, "type": tp,
                       "required": self.required, "description": self.description, "default": self.defaultValue,
                       "format": swagger.format_convert.get(self.type, None), "enum": self.enum})
@@ -107,21 +140,46 @@ class Header(Parameter):
     def get(self):
         return flask.request.headers.get(self.exposed_name or self.name, None)
 
+    def getter(self):
+        key = self.exposed_name or self.name
+        return lambda req: req.headers.get(key, None)
+
 
 class Query(Parameter):
     def get(self):
         return flask.request.args.get(self.exposed_name or self.name, None)
 
+    def getter(self):
+        key = self.exposed_name or self.name
+        return lambda req: req.args.get(key, None)
+
 
 class Cookie(Parameter):
     def get(self):
         return flask.request.cookies.get(self.exposed_name or self.name, None)
 
+    def getter(self):
+        key = self.exposed_name or self.name
+        return lambda req: req.cookies.get(key, None)
+
 
 class Body(Parameter):
+    def resolve_codec(self):
+        self.codec = None
+
     def get(self):
         return flask.request.data
 
+    def getter(self):
+        return lambda req: req.data
+
+    def revert(self, res):
+        res = self.service.decompress(flask.request.headers.get('Content-Encoding'), res)
+        codec, charset = self.service.codecs.lookup(flask.request.content_type)
+        if codec.unsafe and not self.trusted:
+            raise errors.UnsupportedMediaType(mimetype=flask.request.content_type, status='unknown')
+        return codec.decode(self.service, res, cls=self.type, many=self.array, encoding=charset)
+
     def json(self):
         return purge({"name": self.name, "in": "body", "required": self.required, "description": self.description,
                       "schema": {
@@ -130,15 +188,115 @@ class Body(Parameter):
                       }})
 
     def consumes(self):
+        if self.trusted:
+            return self.safe_consumes() + [converter.application.pickle, converter.application.pickle5]
+        return self.safe_consumes()
+
+    def safe_consumes(self):
+        if self.type == common.pandas_df_type:
+            return [converter.application.json, converter.application.msgpack, converter.application.csv,
+                    converter.application.xml] + \
+                   ([converter.application.arrow] if common.has_arrow else [])
         if self.array:
-            if self.type in [list, dict, common.pandas_df_type] or self.type in self.service.schemas:
-                return [converter.application.json, converter.application.msgpack, converter.application.csv, converter.application.xml, converter.application.pickle]
+            if self.type in [list, dict, common.pandas_df_type] or self.service.is_registered(self.type):
+                return [converter.application.json, converter.application.msgpack, converter.application.msgpack_ext,
+                        converter.application.csv, converter.application.xml]
         else:
             if self.type in [str, int, float, date, datetime]:
-                return [converter.application.json, converter.application.msgpack, converter.application.text, converter.application.xml, converter.application.pickle]
-        return [converter.application.json, converter.application.msgpack, converter.application.xml, converter.application.pickle]
+                return [converter.application.json, converter.application.msgpack, converter.application.msgpack_ext,
+                        converter.application.text, converter.application.xml]
+        return [converter.application.json, converter.application.msgpack, converter.application.msgpack_ext,
+                converter.application.xml]
 
 
 class Path(Parameter):
     def get(self):
         return flask.request.view_args[self.name]
+
+    def getter(self):
+        name = self.name
+        return lambda req: req.view_args[name]
+
+
+scalar_types = (int, float, str, bool, date, datetime)
+
+
+def scalar_error(e, name, val, cls):
+    if isinstance(e, errors.PyrolysisException):
+        e.put(parameter=name)
+        return e
+    return errors.BadRequest(val=val, type=cls, parameter=name, status='conflict')
+
+
+def compile_scalar_args(parameters):
+    """
+    Generate the function reading the arguments of an operation whose parameters are all scalars of the path or of
+    the query: the non empty strings of view_args and args are parsed inline, the other values (missing, empty or
+    already converted by the route) going through the extractor of the parameter.
+
+    :return: the function (req) -> arguments, or None if a parameter is not such a scalar
+    """
+    env = {'_error': scalar_error}
+    lines = []
+    for i, p in enumerate(parameters):
+        if type(p) not in (Path, Query) or p.array or p.enum is not None or p.type not in scalar_types:
+            return None
+        env['_p%d' % i] = converter.str_parsers[p.type]
+        env['_t%d' % i] = p.type
+        env['_e%d' % i] = p.extractor()
+        if type(p) is Path:
+            lines.append('    x = v[{0!r}]'.format(p.name))
+        else:
+            lines.append('    x = q.get({0!r})'.format(p.exposed_name or p.name))
+        lines.append('    if x.__class__ is str and x:')
+        if p.type is str:
+            lines.append('        a{0} = x'.format(i))
+        else:
+            lines.append('        try:\n            a{0} = _p{0}(x)\n'
+                         '        except Exception as e:\n            raise _error(e, {1!r}, x, _t{0})'.format(i, p.name))
+        lines.append('    else:\n        a{0} = _e{0}(req)'.format(i))
+    src = 'def args(req):\n    q = req.args\n    v = req.view_args\n' + '\n'.join(lines) + '\n'
+    src += '    return [' + ', '.join('a%d' % i for i in range(len(parameters))) + ']\n'
+    exec(compile(src, '<request plan>', 'exec'), env)
+    return env['args']
+
+
+class RequestPlan:
+    """
+    How an operation reads its arguments, computed when the operation is declared: the extractors of its parameters
+    in the positional order of the function, and whether the other query arguments are forwarded to its **kwargs.
+    When the parameters are all scalars of the path or of the query, args is a function generated for them (see
+    compile_scalar_args).
+
+    :param reserved: names of query arguments read by the service itself, never forwarded
+    """
+
+    def __init__(self, fn, parameters, reserved=()):
+        code = fn.__code__
+        self.extractors = [p.extractor() for p in parameters]
+        self.forward = bool(code.co_flags & inspect.CO_VARKEYWORDS)
+        self.names = frozenset(code.co_varnames) | frozenset(reserved)
+        self.scalar = compile_scalar_args(parameters)
+        if self.scalar is not None:
+            self.args = self.scalar
+
+    def args(self, req):
+        return [f(req) for f in self.extractors]
+
+    def extracted(self, req):
+        """
+        :return: the arguments extracted before the first invalid one, for the logs
+        """
+        res = []
+        for f in self.extractors:
+            try:
+                res.append(f(req))
+            except errors.PyrolysisException:
+                break
+        return res
+
+    def kwargs(self, req):
+        if not self.forward:
+            return {}
+        names = self.names
+        return dict((k, v) for k, v in req.args.items() if k not in names)
@@ -1,9 +1,18 @@
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+from collections.abc import Sized
 from enum import Enum
 from http import HTTPStatus as status
 from datetime import date, datetime
 
+import flask
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header, parse_etags, quote_etag
+
 from pyrolysis import common
-from pyrolysis.common import converter, swagger
+from pyrolysis.common import converter, swagger, compression
 from pyrolysis.common import errors
 from pyrolysis.common.resource import Resource
 from pyrolysis.common.support import purge
@@ -11,26 +20,39 @@ from pyrolysis.common.support import purge
 
 class Result:
     def __init__(self, parent, type, description, enum=None, array=False):
+        type, many = swagger.get_item_type(type)
         self.parent = parent
         self.description = description
         self.enum = enum or issubclass(type, Enum) and list(type)
-        self.array = array or type == common.pandas_df_type
+        self.array = array or many or type == common.pandas_df_type
         self.type = type
+        self.headers = {}
 
     def produces(self):
+        if self.type == common.pandas_df_type:
+            return ([converter.application.arrow] if common.has_arrow else []) + \
+                   [converter.application.json, converter.application.msgpack, converter.application.csv,
+                    converter.text.csv, converter.application.xml, converter.application.ndjson]
         if self.array:
-            if self.type in [list, dict, common.pandas_df_type] or self.type in self.parent.schemas:
-                return [converter.application.json, converter.application.msgpack, converter.application.csv, converter.application.xml]
+            if self.type in [list, dict, common.pandas_df_type] or self.parent.is_registered(self.type):
+                res = [converter.application.json, converter.application.msgpack, converter.application.msgpack_ext,
+                       converter.application.csv, converter.text.csv, converter.application.xml,
+                       converter.application.ndjson]
+                if self.parent.is_registered(self.type):
+                    res += converter.layout_mimetypes
+                return res
         else:
             if self.type in [str, int, float, date, datetime]:
-                return [converter.application.json, converter.application.msgpack, converter.application.text, converter.application.xml]
-        return [converter.application.json, converter.application.msgpack, converter.application.xml]
+                return [converter.application.json, converter.application.msgpack, converter.application.msgpack_ext,
+                        converter.application.text, converter.application.xml]
+        return [converter.application.json, converter.application.msgpack, converter.application.msgpack_ext,
+                converter.application.xml]
 
     def json(self):
         json = {
             'description': self.description
         }
-        if self.type in self.parent.schemas:
+        if self.parent.is_registered(self.type):
             res = {'$ref': '#/definitions/' + str(self.type.__name__)}
         elif self.type == list:
             res = {
@@ -52,6 +74,8 @@ class Result:
             json['schema'] = {'type': 'array', 'items': res}
         else:
             json['schema'] = res
+        if self.headers:
+            json['headers'] = self.headers
         return json
 
     def code(self):
@@ -61,9 +85,10 @@ class Result:
             return status.OK
 
     def set_type(self, v):
+        v, many = swagger.get_item_type(v)
         if self.type is None:
             self.type = v
-            if v == common.pandas_df_type:
+            if many or v == common.pandas_df_type:
                 self.array = True
             if issubclass(v, Enum):
                 self.enum = list(v)
@@ -83,3 +108,129 @@ class Error:
         return {
             'description': self.description
         }
+
+
+def digest(data):
+    """
+    :return: a 128 bits digest of bytes, xxh3 if xxhash is installed, blake2b otherwise
+    """
+    if common.has_xxhash:
+        import xxhash
+        return xxhash.xxh3_128_hexdigest(data)
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def not_modified(if_none_match, tag):
+    """
+    :param if_none_match: the value of the If-None-Match header: '*' or a list of ETags, weak or strong
+    :param tag: the ETag of the response, quoted
+    :return: True if the client has the response, the ETags being compared weakly
+    """
+    if not if_none_match or not tag:
+        return False
+    return parse_etags(if_none_match).contains_weak(tag[2:].strip('"') if tag.startswith('W/') else tag.strip('"'))
+
+
+def encode_chunks(chunks, views=False):
+    """
+    :param views: True to keep the memoryviews (out-of-band buffers), which the compressors read without copy
+    :return: the chunks as bytes, as WSGI requires
+    """
+    for x in chunks:
+        if isinstance(x, str):
+            yield x.encode()
+        elif isinstance(x, memoryview) and not views:
+            yield x.tobytes()
+        else:
+            yield x
+
+
+class ResponsePlan:
+    """
+    How an operation answers, computed when the operation is declared: the codecs of the mimetypes it produces, its
+    static headers and its compression settings. The negotiation of a couple (Accept, Accept-Encoding) is memoized in
+    a bounded LRU, the distinct headers sent by the clients being few.
+    """
+
+    def __init__(self, service, produces, headers, compress=True, compress_threshold=None, compress_level=None,
+                 cache_size=128, etag=False, etag_cache_size=1024):
+        self.service = service
+        self.produces = produces
+        self.codecs = dict((m, service.codec(m)) for m in produces)
+        self.headers = headers
+        self.compress = compress
+        self.compress_threshold = service.compress_threshold if compress_threshold is None else compress_threshold
+        self.compress_level = compress_level
+        self.encodings = list(compression.compressions)
+        headers['Vary'] = 'Accept, Accept-Encoding' if compress else 'Accept'
+        self.negotiate = functools.lru_cache(maxsize=cache_size)(self.resolve)
+        self.weak = etag == 'weak'
+        self.versions = OrderedDict()
+        self.versions_size = etag_cache_size
+        self.lock = threading.Lock()
+
+    def resolve(self, accept, accept_encoding):
+        """
+        :return: the triple (mimetype, codec, compression) of the headers, mimetype and codec being None if no
+        mimetype is acceptable, compression None if the response is not compressed
+        """
+        kind = parse_accept_header(accept, MIMEAccept).best_match(self.produces)
+        comp = None
+        if self.compress and accept_encoding:
+            name = parse_accept_header(accept_encoding).best_match(self.encodings)
+            comp = name and compression.compressions[name]
+        return kind, self.codecs.get(kind), comp
+
+    def known_etag(self, version, kind, comp):
+        """
+        :return: the ETag of a version of a result already encoded in this mimetype and compression, None if unknown
+        """
+        if version is None:
+            return None
+        with self.lock:
+            return self.versions.get((version, kind, comp and comp.name))
+
+    def etag(self, body, version, kind, comp):
+        """
+        :param body: the encoded response
+        :param version: the version of the result, None if it has none
+        :return: the ETag of the response, weak if the operation has etag='weak'
+        """
+        tag = quote_etag(digest(body), self.weak)
+        if version is not None:
+            with self.lock:
+                self.versions[(version, kind, comp and comp.name)] = tag
+                if len(self.versions) > self.versions_size:
+                    self.versions.popitem(last=False)
+        return tag
+
+    def streams(self, res):
+        """
+        :return: True if a result is streamed: a generator or a query, or a list or a dataframe of more than
+        stream_threshold elements, the smaller ones being encoded in one call
+        """
+        if not converter.is_streamable(res):
+            return False
+        return not isinstance(res, Sized) or len(res) > self.service.stream_threshold
+
+    def response(self, res, kind, codec, comp, headers, stream=True):
+        """
+        Encode a result with the negotiated codec and compression.
+
+        :param stream: False to encode the sequences in one go, the response having then a body
+        """
+        if stream and codec.streaming and self.streams(res):
+            if hasattr(res, 'yield_per'):
+                res = res.yield_per(self.service.stream_batch)
+            body = codec.iterencode(self.service, res)
+            if comp:
+                body = comp.stream(encode_chunks(body, views=True), self.compress_level)
+                headers['Content-Encoding'] = comp.name
+            else:
+                body = encode_chunks(body)
+            return flask.Response(flask.stream_with_context(body), mimetype=kind, status=status.OK, headers=headers)
+        body = codec.encode(self.service, res)
+        if comp and len(body) >= self.compress_threshold:
+            body = comp.compress(body.encode() if isinstance(body, str) else body, self.compress_level)
+            headers['Content-Encoding'] = comp.name
+        return flask.Response(body, mimetype=kind, status=status.OK, headers=headers)
@@ -62,6 +62,10 @@ class MultiRole:
         return res
 
     def check_roles(self):
+        """
+        :return: the roles of the caller, a frozenset of couples (security name, role name)
+        :raise Unauthorized: if the caller does not have the roles
+        """
         parents = set([r2.parent for r1 in self.roles for r2 in r1])
         res = dict((p.name, p.get_roles()) for p in parents)
         for r1 in self.roles:
@@ -69,7 +73,7 @@ class MultiRole:
                 if r2.name not in res[r2.parent.name]:
                     break
             else:
-                return
+                return frozenset((k, r) for k, v in res.items() for r in v)
         for p in parents:
             if isinstance(p, JWTHeader):
                 raise errors.Unauthorized(authorizationUrl=p.authorizationUrl)
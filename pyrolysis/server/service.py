@@ -1,5 +1,7 @@
+import asyncio
 import datetime
-import json
+import inspect
+import threading
 import time
 import urllib.parse
 import uuid
@@ -11,42 +13,99 @@ import flask
 import flask_swagger
 import yaml
 from flask import g
+from werkzeug.http import http_date
 from marshmallow_jsonschema import JSONSchema
 
 from pyrolysis import common as common
-from pyrolysis.common import converter, support
+from pyrolysis.common import converter, support, swagger, compression
 from pyrolysis.common import errors, doc
-from pyrolysis.common.converter import JSONEncoder2
+from pyrolysis.common.cache import ResponseCache, SingleFlight
 from pyrolysis.common.resource import Resource
-from pyrolysis.server.parameter import Body, Path, Query
-from pyrolysis.server.response import Result
+from pyrolysis.server.batch import BatchPlan
+from pyrolysis.server.pagination import Pager
+from pyrolysis.server.parameter import Body, Path, Query, RequestPlan
+from pyrolysis.server.response import Result, ResponsePlan, not_modified
 from pyrolysis.server.security import MultiRole
+from pyrolysis.server.versions import VersionRegistry, as_utc, not_modified_since
 
 
 def has_browser():
     return flask.request.user_agent.browser in ['chrome', 'msie', 'firefox', 'opera']
 
 
+def next_url(req, cursor):
+    """
+    :return: the url of a request with another cursor
+    """
+    args = [(k, v) for k, v in req.args.items(multi=True) if k != 'cursor'] + [('cursor', cursor)]
+    return req.base_url + '?' + urllib.parse.urlencode(args)
+
+
+def freeze(response):
+    """
+    :return: the status, the body and the headers of a response, which can be shared between requests
+    """
+    try:
+        body = response.get_data()
+    finally:
+        response.close()
+    return response.status_code, body, [(k, v) for k, v in response.headers.items() if k != 'Content-Length']
+
+
+def iterate_async(loop, it):
+    """
+    Iterate an async generator from synchronous code, each element being awaited on the loop.
+    """
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(it.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        loop.run_until_complete(it.aclose())
+
+
 class ServerService(converter.Converter):
     securities = {}
     cached_spec = None
     log_filter = None
+    stream_threshold = 10000
+    compress_threshold = 1024
+    negotiation_cache_size = 128
+    loops = threading.local()
+    response_cache_bytes = 64 * 1024 * 1024
+    versions_path = None
+    versions_capacity = 1024
+    batch_threads = 0
+    batch_max_calls = 1000
+    coalesce_timeout = 30
+    max_decompressed_size = None
+    default_decompressed_size = 64 * 1024 * 1024
 
     def __init__(self, flask, base='', version='', description='', health=True, statsd=None,
-                 socket_app=None):
+                 socket_app=None, batch=False):
         self.flask = flask
         self.base = base
         self.logger = flask.logger
         self.name = flask.name
         self.statsd = statsd
+        self.response_cache = ResponseCache(self.response_cache_bytes)
+        self.versions = None
+        self.operations = {}
+        self.flights = SingleFlight()
         self.info = {'title': self.name, 'version': version, 'description': description}
 
         if health:
             @flask.route('/health')
             def health():
+                if flask.config.get('PYROLYSIS_DRAINING'):
+                    return "DRAINING " + datetime.datetime.now().isoformat(), status.SERVICE_UNAVAILABLE
                 return "OK " + datetime.datetime.now().isoformat(), 200
 
         self.socket_app = socket_app
+        if batch:
+            self.add_batch_route()
 
         @flask.route(base + "/")
         @flask.route(base + "/swagger.json")
@@ -54,22 +113,22 @@ class ServerService(converter.Converter):
             if self.cached_spec is None:
                 json_schema = JSONSchema()
                 definitions = dict(
-                    (k, list(json_schema.dump(v)['definitions'].values())[0]) for k, v in self.schemas.items())
+                    (k.__name__, list(json_schema.dump(v)['definitions'].values())[0]) for k, v in self.schemas.items())
                 spec = flask_swagger.swagger(flask, template=dict(definitions=definitions,
                                                                   info=self.info,
                                                                   securityDefinitions=self.securities))
-                self.cached_spec = json.dumps(spec, cls=JSONEncoder2, allow_nan=False)
+                self.cached_spec = self.json_dumps(spec, allow_nan=False)
             return self.cached_spec
 
         @flask.errorhandler(errors.PyrolysisException)
         def handle_error_base(e):
-            return json.dumps(e.data, cls=JSONEncoder2, allow_nan=False), e.code
+            return self.json_dumps(e.data, allow_nan=False), e.code
 
         @flask.errorhandler(Exception)
         def handle_error(e):
             flask.logger.exception('Uncaught exception')
-            return json.dumps({'type': type(e), 'message': str(e)}, cls=JSONEncoder2,
-                              allow_nan=False), status.INTERNAL_SERVER_ERROR
+            return self.json_dumps({'type': type(e), 'message': str(e)},
+                                   allow_nan=False), status.INTERNAL_SERVER_ERROR
 
     def get(self, path, **options):
         return self.operation(path, methods=['GET', 'HEAD'], **options)
@@ -84,7 +143,10 @@ class ServerService(converter.Converter):
         return self.operation(path, methods=['DELETE'], **options)
 
     def operation(self, path, tags=None, parameters=None, responses=None, operationId=None, summary=None,
-                  dump=False, cache=None, roles=None, etag=False, **options):
+                  dump=False, cache=None, roles=None, etag=False, compress=True, compress_threshold=None,
+                  compress_level=None, trusted=False, cache_ttl=None, invalidates=None, collection=None,
+                  page_size=None, page_key=None, max_page_size=None, page_sorted=False, coalesce=False,
+                  **options):
         support.check_param(tags, list, False)
         support.check_param(responses, dict, False)
         support.check_param(operationId, str, False)
@@ -106,7 +168,7 @@ class ServerService(converter.Converter):
             for i in range(n):
                 name = v[i]
                 cst = c[i] if c and i < len(c) else None
-                tp = types.get(name, str)
+                tp, array = swagger.get_item_type(types.get(name, str))
                 if i < len(parameters):
                     parameters[i].set_service(self)
                     parameters[i].set_name(name)
@@ -118,13 +180,16 @@ class ServerService(converter.Converter):
                         parameters[i].set_default(c[i])
                 elif '<' + name + '>' in path:
                     parameters.append(
-                        Path(name, tp, service=self, defaultValue=cst, description=desc_params.get(name, '')))
-                elif issubclass(tp, Mapping) or tp.__name__ in self.schemas or tp == common.pandas_df_type:
+                        Path(name, tp, service=self, defaultValue=cst, description=desc_params.get(name, ''),
+                             array=array))
+                elif issubclass(tp, Mapping) or tp in self.schemas or tp == common.pandas_df_type:
                     parameters.append(
-                        Body(name, tp, service=self, defaultValue=cst, description=desc_params.get(name, '')))
+                        Body(name, tp, service=self, defaultValue=cst, description=desc_params.get(name, ''),
+                             array=array))
                 else:
                     parameters.append(
-                        Query(name, tp, service=self, defaultValue=cst, description=desc_params.get(name, '')))
+                        Query(name, tp, service=self, defaultValue=cst, description=desc_params.get(name, ''),
+                              array=array))
             return_type = types.get('return', None)
             toadd = True
             produces = []
@@ -143,83 +208,189 @@ class ServerService(converter.Converter):
                 resp.append(r)
                 produces = r.produces()
 
-            headers = {}
+            if trusted:
+                produces = produces + [converter.application.pickle5]
+            for p in parameters:
+                p.trusted = trusted
+                p.resolve_codec()
+
+            static_headers = {}
             if cache:
-                headers['Cache-Control'] = cache
+                static_headers['Cache-Control'] = cache
+            plan = ResponsePlan(self, produces, static_headers, compress, compress_threshold, compress_level,
+                                self.negotiation_cache_size, etag)
+
+            pager = None
+            page_parameters = []
+            if page_size:
+                pager = Pager(page_size, page_key, max_page_size, self, page_sorted)
+                for p in parameters:
+                    if p.name in ('cursor', 'limit'):
+                        raise errors.InvalidSwaggerDefinition(parameter=p.name, status='conflict')
+                page_parameters = [
+                    Query('cursor', str, required=False, service=self,
+                          description='the position of the page, from the next link of the previous one'),
+                    Query('limit', int, required=False, service=self, defaultValue=page_size,
+                          description='the size of the page, at most {}'.format(pager.max_page_size))]
+                for p in page_parameters:
+                    p.resolve_codec()
+                for v in resp:
+                    if isinstance(v, Result):
+                        v.headers['Link'] = {'type': 'string', 'description': 'the url of the next page, rel="next"'}
+            extraction = RequestPlan(fn, parameters, reserved=[p.name for p in page_parameters])
+            page_extraction = RequestPlan(fn, page_parameters)
+            methods = options.get('methods', [])
+            invalidated = self.invalidated_prefixes(path, methods, invalidates)
+            collections = [collection] if isinstance(collection, str) else list(collection or [])
+            if collections and self.versions is None:
+                self.versions = VersionRegistry(self.versions_path, self.versions_capacity)
+            reads = collections if 'GET' in methods else []
+            writes = collections if set(methods) & {'POST', 'PUT', 'DELETE'} else []
+            is_async = inspect.iscoroutinefunction(fn) or inspect.isasyncgenfunction(fn)
+            coalesce_timeout = self.coalesce_timeout if coalesce is True else coalesce
+
+            def execute(req, ctx, state, cache_key):
+                """
+                Extract the arguments, call the handler and encode its result, the part shared by coalesced requests.
+                """
+                args = extraction.args(req)
+                page = page_extraction.args(req) if pager else None
+                headers = dict(static_headers)
+                if state and state[1]:
+                    headers['Last-Modified'] = http_date(state[1])
+                if dump:
+                    msg = dict(
+                        function=fn.__name__,
+                        url=req.url,
+                        **req.headers)
+                    self.logger.debug(msg)
+                kwargs = extraction.kwargs(req)
+                try:
+                    if 'uuid' not in ctx:
+                        ctx.uuid = uuid.uuid4()
+                    if self.statsd:
+                        time_start = time.perf_counter()
+                        res = fn(*args, **kwargs)
+                        if is_async:
+                            res = self.run_async(res)
+                        self.statsd.timing(op + '.request', time.perf_counter() - time_start)
+                    else:
+                        res = fn(*args, **kwargs)
+                        if is_async:
+                            res = self.run_async(res)
+                except errors.Unauthorized as e:
+                    if has_browser():
+                        if 'authorizationUrl' in e.data:
+                            return flask.redirect(
+                                location=e.data['authorizationUrl'] + '&redirect=' + urllib.parse.quote(req.url),
+                                code=status.TEMPORARY_REDIRECT)
+                    raise e
+                except errors.UnmodifiedResult:
+                    return flask.Response(status=status.NOT_MODIFIED)
+                except errors.PyrolysisException as e:
+                    raise e
+                except NotImplementedError:
+                    return flask.Response(status=status.NOT_IMPLEMENTED)
+                except Exception as e:
+                    raise errors.InternalServerError(e)
+                for name in writes:
+                    self.versions.bump(name)
+                for prefix in invalidated:
+                    self.response_cache.invalidate(prefix)
+
+                if res is None:
+                    return flask.Response(status=status.NO_CONTENT)
+                if isinstance(res, flask.Response):
+                    return res
+                if pager:
+                    res, cursor = pager.page(res, *page)
+                    if cursor:
+                        headers['Link'] = '<{}>; rel="next"'.format(next_url(req, cursor))
+                if req.method == 'POST' and isinstance(res, Resource):
+                    return flask.Response(status=status.CREATED, headers={'Location': res.uri})
+                last_modified = getattr(res, 'last_modified', None)
+                if last_modified:
+                    headers['Last-Modified'] = http_date(as_utc(last_modified))
+                    if not_modified_since(req.headers.get('If-Modified-Since'), last_modified):
+                        return flask.Response(status=status.NOT_MODIFIED, headers=headers)
+                kind, codec, comp = plan.negotiate(req.headers.get('Accept', ''),
+                                                   req.headers.get('Accept-Encoding', ''))
+                headers['x-content-class'] = type(res).__name__
+                if req.method == 'HEAD' and not etag:
+                    return flask.Response(mimetype=kind, status=status.OK, headers=headers)
+                if kind is None:
+                    raise errors.BadRequest(accept=str(req.accept_mimetypes), status='unknown')
+                if etag:
+                    version = getattr(res, 'version', None)
+                    if version is None and state:
+                        version = (state[0], req.full_path)
+                    tag = plan.known_etag(version, kind, comp)
+                    if not_modified(req.headers.get('If-None-Match'), tag):
+                        return flask.Response(status=status.NOT_MODIFIED, headers=dict(headers, ETag=tag))
+                elif cache_key is None:
+                    return plan.response(res, kind, codec, comp, headers)
+                response = plan.response(res, kind, codec, comp, headers, stream=False)
+                body = response.get_data()
+                if etag:
+                    headers['ETag'] = response.headers['ETag'] = tag = plan.etag(body, version, kind, comp)
+                if cache_key is not None:
+                    self.response_cache.put(cache_key, (body, headers), len(body), req.path, cache_ttl)
+                if etag and not_modified(req.headers.get('If-None-Match'), tag):
+                    return flask.Response(status=status.NOT_MODIFIED, headers=headers)
+                return response
 
             @wraps(fn)
             def wrapper(*args, **kwargs):
+                req = flask.request._get_current_object()
                 try:
-                    g.username = ''
-                    g.apikey = ''
-                    if roles:
-                        roles.check_roles()
-                    args = [p.extract() for p in parameters]
-                    req = flask.request
-                    if dump:
-                        msg = dict(
-                            function=fn.__name__,
-                            url=req.url,
-                            **req.headers)
-                        self.logger.debug(msg)
-                    kwargs = dict((k, v) for k, v in req.args.items()
-                                  if k not in fn.__code__.co_varnames) if (fn.__code__.co_flags & 8) else {}
-                    try:
-                        if 'uuid' not in g:
-                            g.uuid = uuid.uuid4()
-                        time_start = time.clock()
-                        res = fn(*args, **kwargs)
+                    ctx = g._get_current_object()
+                    ctx.username = ''
+                    ctx.apikey = ''
+                    role_set = roles.check_roles() if roles else None
+                    state = None
+                    if reads and req.method in ('GET', 'HEAD'):
+                        state = self.collections_state(reads)
+                        if not_modified_since(req.headers.get('If-Modified-Since'), state[1]):
+                            headers = dict(static_headers)
+                            headers['Last-Modified'] = http_date(state[1])
+                            return flask.Response(status=status.NOT_MODIFIED, headers=headers)
+                        if etag and req.headers.get('If-None-Match'):
+                            kind, codec, comp = plan.negotiate(req.headers.get('Accept', ''),
+                                                               req.headers.get('Accept-Encoding', ''))
+                            tag = plan.known_etag((state[0], req.full_path), kind, comp)
+                            if not_modified(req.headers.get('If-None-Match'), tag):
+                                return flask.Response(status=status.NOT_MODIFIED,
+                                                      headers=dict(static_headers, ETag=tag))
+                    cache_key = None
+                    if cache_ttl and req.method == 'GET':
+                        kind, codec, comp = plan.negotiate(req.headers.get('Accept', ''),
+                                                           req.headers.get('Accept-Encoding', ''))
+                        cache_key = (op, req.full_path, kind, comp and comp.name, role_set, state and state[0])
+                        hit = self.response_cache.get(cache_key)
                         if self.statsd:
-                            time_end = time.clock()
-                            self.statsd.timing(op + '.request', time_end - time_start)
-                    except errors.Unauthorized as e:
-                        if has_browser():
-                            if 'authorizationUrl' in e.data:
-                                return flask.redirect(
-                                    location=e.data['authorizationUrl'] + '&redirect=' + urllib.parse.quote(req.url),
-                                    code=status.TEMPORARY_REDIRECT)
-                        raise e
-                    except errors.UnmodifiedResult:
-                        return flask.Response(status=status.NOT_MODIFIED)
-                    except errors.PyrolysisException as e:
-                        raise e
-                    except NotImplementedError:
-                        return flask.Response(status=status.NOT_IMPLEMENTED)
-                    except Exception as e:
-                        raise errors.InternalServerError(e)
-
-                    if res is None:
-                        return flask.Response(status=status.NO_CONTENT)
-                    if isinstance(res, flask.Response):
-                        return res
-                    if req.method == 'POST' and isinstance(res, Resource):
-                        return flask.Response(status=status.CREATED, headers={'Location': res.uri})
-                    last_modified = getattr(res, 'last_modified', None)
-                    if last_modified:
-                        headers['Last-Modified'] = last_modified
-                        modified_since = flask.request.headers.get('If-Modified-Since', None)
-                        if modified_since:
-                            dt_req = datetime.datetime.strptime(modified_since, '%a, %d %b %Y %H:%M:%S %z')
-                            if dt_req >= last_modified:
-                                return flask.Response(status=status.NOT_MODIFIED)
-                    if etag:
-                        headers['ETag'] = etag_value = str(hash(res))
-                        etag_match = flask.request.headers.get('If-None-Match', None)
-                        if etag_match and etag_match == etag_value:
-                            return flask.Response(status=status.NOT_MODIFIED)
-                    kind = req.accept_mimetypes.best_match(produces)
-                    headers['x-content-class'] = type(res).__name__
-                    if req.method == 'HEAD':
-                        return flask.Response(mimetype=kind, status=status.OK, headers=headers)
-                    return flask.Response(self.convert(kind, res), mimetype=kind, status=status.OK, headers=headers)
+                            self.statsd.incr(op + ('.cache.hit' if hit else '.cache.miss'))
+                        if hit is not None:
+                            body, cached_headers = hit
+                            if not_modified(req.headers.get('If-None-Match'), cached_headers.get('ETag')):
+                                return flask.Response(status=status.NOT_MODIFIED, headers=cached_headers)
+                            return flask.Response(body, mimetype=kind, status=status.OK, headers=cached_headers)
+                    if coalesce and req.method == 'GET':
+                        kind, codec, comp = plan.negotiate(req.headers.get('Accept', ''),
+                                                           req.headers.get('Accept-Encoding', ''))
+                        key = (op, req.full_path, kind, comp and comp.name, role_set, state and state[0],
+                               req.headers.get('If-None-Match'), req.headers.get('If-Modified-Since'))
+                        shared = self.flights.do(key, lambda: freeze(execute(req, ctx, state, cache_key)),
+                                                 coalesce_timeout)
+                        return flask.Response(shared[1], status=shared[0], headers=shared[2])
+                    return execute(req, ctx, state, cache_key)
                 except errors.PyrolysisException as e:
-                    msg = support.extract_call_info(fn, args, kwargs)
+                    msg = support.extract_call_info(fn, extraction.extracted(req), extraction.kwargs(req))
                     self.logger.exception(msg)
                     e.put(operationId=op, path=path)
                     raise e
 
             args = dict(operationId=op, tags=tags, produces=produces, description=desc,
-                        parameters=[p.json() for p in parameters if not p.hidden],
+                        parameters=[p.json() for p in parameters + page_parameters if not p.hidden],
                         responses=dict((str(v.code().value), v.json()) for v in resp)
                         )
             if roles:
@@ -227,18 +398,105 @@ class ServerService(converter.Converter):
             for p in parameters:
                 if p.location == 'body':
                     args['consumes'] = p.consumes()
+                    if compress:
+                        args['x-content-encodings'] = list(compression.compressions)
                     break
 
             wrapper.__doc__ = '{0}\n---\n{1}'.format(summary, yaml.dump(args, default_flow_style=False))
-            endpoint = options.pop('endpoint', None)
+            endpoint = options.pop('endpoint', None) or wrapper.__name__
             self.flask.add_url_rule(self.base + path, endpoint, wrapper, **options)
+            self.operations[op] = (endpoint, (methods or ['GET'])[0], parameters)
             return fn
 
         return decorator
 
+    def decompress(self, encoding, data):
+        """
+        :return: the decompressed body of a request, at most max_decompressed_size bytes (MAX_CONTENT_LENGTH of the
+        flask config by default)
+        :raise PayloadTooLarge: if it is larger
+        """
+        max_size = (self.max_decompressed_size or self.flask.config.get('MAX_CONTENT_LENGTH')
+                    or self.default_decompressed_size)
+        return compression.decompress(encoding, data, max_size)
+
+    def add_batch_route(self, path='/batch'):
+        """
+        Add the route calling several operations in one request, see BatchPlan. The calls run on batch_threads
+        threads if it is more than 1, one after the other otherwise.
+        """
+        batch_plan = BatchPlan(self, self.batch_threads, self.batch_max_calls)
+        produces = [converter.application.msgpack, converter.application.json]
+        plan = ResponsePlan(self, produces, {}, cache_size=self.negotiation_cache_size)
+
+        def batch():
+            req = flask.request._get_current_object()
+            kind, codec, comp = plan.negotiate(req.headers.get('Accept') or req.mimetype,
+                                               req.headers.get('Accept-Encoding', ''))
+            if kind is None:
+                raise errors.BadRequest(accept=str(req.accept_mimetypes), status='unknown')
+            res = batch_plan.run(req, kind)
+            if self.statsd:
+                self.statsd.incr('batch.calls', len(res))
+            return plan.response(res, kind, codec, comp, {}, stream=False)
+
+        args = {'operationId': 'batch', 'tags': ['batch'], 'produces': produces,
+                'consumes': [converter.application.msgpack, converter.application.msgpack_ext,
+                             converter.application.json],
+                'parameters': [{'name': 'calls', 'in': 'body', 'required': True,
+                                'description': 'the calls [operationId, arguments, headers]',
+                                'schema': {'type': 'array', 'items': {'type': 'object'}}}],
+                'responses': {'200': {'description': 'the status, the headers and the body of each call',
+                                      'schema': {'type': 'array', 'items': {'type': 'object'}}}}}
+        batch.__doc__ = 'Call several operations\n---\n' + yaml.dump(args, default_flow_style=False)
+        self.flask.add_url_rule(self.base + path, 'pyrolysis_batch', batch, methods=['POST'])
+
+    def invalidated_prefixes(self, path, methods, invalidates=None):
+        """
+        :param invalidates: the path prefixes whose cached responses an operation invalidates, by default the static
+        part of its path if it is a POST, PUT or DELETE
+        :return: the prefixes, with the base of the service
+        """
+        if invalidates is None:
+            if not set(methods) & {'POST', 'PUT', 'DELETE'}:
+                return []
+            invalidates = [path.split('<', 1)[0].rstrip('/')]
+        return [self.base + p for p in invalidates or []]
+
+    def cache_stats(self):
+        """
+        :return: the counters of the response cache (hits, misses, evictions, expirations, invalidations) and its size
+        """
+        return self.response_cache.stats()
+
+    def event_loop(self):
+        """
+        :return: the event loop of the current worker thread, on which the async handlers run
+        """
+        loop = getattr(self.loops, 'loop', None)
+        if loop is None or loop.is_closed():
+            loop = self.loops.loop = asyncio.new_event_loop()
+        return loop
+
+    def run_async(self, res):
+        """
+        :param res: the result of an async handler, a coroutine or an async generator
+        :return: the value of the coroutine, or an iterator on the elements of the async generator
+        """
+        if inspect.isasyncgen(res):
+            return iterate_async(self.event_loop(), res)
+        return self.event_loop().run_until_complete(res)
+
     def check_if_modified_since(self, dt: datetime.datetime):
-        modified_since = flask.request.headers.get('If-Modified-Since', None)
-        if modified_since and dt:
-            dt_req = datetime.datetime.strptime(modified_since, '%a, %d %b %Y %H:%M:%S %z')
-            if dt_req >= dt:
-                raise errors.UnmodifiedResult()
+        if not_modified_since(flask.request.headers.get('If-Modified-Since', None), dt):
+            raise errors.UnmodifiedResult()
+
+    def collections_state(self, names):
+        """
+        :param names: names of collections of the version registry
+        :return: the couple (versions of the collections, datetime of the last modification of one of them or None)
+        """
+        states = [self.versions.read(name) for name in names]
+        micro = max(s[1] for s in states)
+        modified = datetime.datetime.fromtimestamp(micro / 1e6, datetime.timezone.utc) if micro else None
+        return tuple(s[0] for s in states), modified
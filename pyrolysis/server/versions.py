@@ -0,0 +1,150 @@
+import functools
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+
+from werkzeug.http import parse_date
+
+from pyrolysis.common import errors
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+slot = struct.Struct('<48sqq')
+counter = struct.Struct('<q')
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_http_date(value):
+    """
+    :param value: the value of a header like If-Modified-Since
+    :return: the aware datetime of the header, None if it is not a valid date
+    """
+    return parse_date(value)
+
+
+def as_utc(dt):
+    """
+    :return: an aware datetime, naive datetimes being in utc
+    """
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+def not_modified_since(if_modified_since, modified):
+    """
+    :param if_modified_since: the value of the If-Modified-Since header
+    :param modified: the datetime of the last modification of the result, naive datetimes being in utc
+    :return: True if the client has the result, the dates being compared to the second
+    """
+    if not if_modified_since or modified is None:
+        return False
+    since = parse_http_date(if_modified_since)
+    return since is not None and since >= as_utc(modified).replace(microsecond=0)
+
+
+class VersionRegistry:
+    """
+    Versions and modification times of named collections, in a memory mapped file shared by the processes: the workers
+    forked from the process which created the registry, or the processes opening the same path.
+
+    The file is a hash table of 64 bytes slots (name, version, modification time in microseconds). Writers lock the
+    file (fcntl, the registry being only shared by the threads of the process where it is not available). Readers
+    take no lock: the version is a sequence counter, a writer setting it to -(version + 1) while it updates the
+    modification time, and a reader retries until it reads the same positive version before and after the time.
+    """
+
+    def __init__(self, path=None, capacity=1024):
+        self.capacity = capacity
+        size = capacity * slot.size
+        if path is None:
+            self.file = tempfile.TemporaryFile()
+        else:
+            self.file = open(path, 'a+b')
+        if os.fstat(self.file.fileno()).st_size < size:
+            self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+        self.lock = threading.Lock()
+        self.slots = {}
+
+    def find(self, name, create=False):
+        """
+        :return: the offset of the slot of a collection, None if it does not exist and create is False
+        """
+        res = self.slots.get(name)
+        if res is not None:
+            return res
+        key = name.encode()
+        if len(key) > 48:
+            raise errors.ServerError(collection=name, status='conflict')
+        padded = key.ljust(48, b'\0')
+        i = zlib.crc32(key) % self.capacity
+        for _ in range(self.capacity):
+            offset = i * slot.size
+            current = self.map[offset:offset + 48]
+            if current == padded:
+                self.slots[name] = offset
+                return offset
+            if current == b'\0' * 48:
+                if not create:
+                    return None
+                self.map[offset:offset + 48] = padded
+                self.slots[name] = offset
+                return offset
+            i = (i + 1) % self.capacity
+        raise errors.ServerError(collection=name, capacity=self.capacity, status='full')
+
+    def read(self, name):
+        """
+        :return: the couple (version, modification time in microseconds), (0, 0) for an unknown collection
+        """
+        offset = self.find(name)
+        if offset is None:
+            return 0, 0
+        while True:
+            version = counter.unpack_from(self.map, offset + 48)[0]
+            micro = counter.unpack_from(self.map, offset + 56)[0]
+            if version >= 0 and counter.unpack_from(self.map, offset + 48)[0] == version:
+                return version, micro
+            time.sleep(0)
+
+    def version(self, name):
+        return self.read(name)[0]
+
+    def modified(self, name):
+        """
+        :return: the aware datetime of the last modification of the collection, None if it was never modified
+        """
+        micro = self.read(name)[1]
+        return datetime.fromtimestamp(micro / 1e6, timezone.utc) if micro else None
+
+    def bump(self, name):
+        """
+        Record a modification of the collection.
+
+        :return: its new version
+        """
+        with self.lock:
+            if fcntl is not None:
+                fcntl.lockf(self.file.fileno(), fcntl.LOCK_EX)
+            try:
+                offset = self.find(name, create=True)
+                version, micro = slot.unpack_from(self.map, offset)[1:]
+                now = max(int(time.time() * 1e6), micro + 1)
+                counter.pack_into(self.map, offset + 48, -(version + 1))
+                counter.pack_into(self.map, offset + 56, now)
+                counter.pack_into(self.map, offset + 48, version + 1)
+                return version + 1
+            finally:
+                if fcntl is not None:
+                    fcntl.lockf(self.file.fileno(), fcntl.LOCK_UN)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
@@ -1,8 +1,10 @@
+import asyncio
 from enum import Enum, auto
 import flask
 from flask import g
 from pandas import DataFrame
 from dataclasses import dataclass, field
+from typing import AsyncIterator, Iterator, List
 
 from pyrolysis.server.parameter import Header
 from pyrolysis.server.security import BasicHeader, ApiKeyHeader
@@ -136,3 +138,39 @@ def test_dataframe(p: DataFrame) -> DataFrame:
     :return: return data
     """
     return p
+
+
+@app.get('/test10')
+def test_stream(n: int = 3) -> Iterator[TestServerObject]:
+    """
+    Example 10 for a unit test
+    :param n: number of objects
+    :return: return data
+    """
+    for i in range(n):
+        yield TestServerObject(str(i), i)
+
+
+@app.get('/test11')
+async def test_async(n: int = 3) -> List[int]:
+    """
+    Example 11 for a unit test
+    :param n: number of concurrent calls
+    :return: return data
+    """
+    async def call(i):
+        await asyncio.sleep(0.01)
+        return i
+    return list(await asyncio.gather(*[call(i) for i in range(n)]))
+
+
+@app.get('/test12')
+async def test_async_stream(n: int = 3) -> AsyncIterator[TestServerObject]:
+    """
+    Example 12 for a unit test
+    :param n: number of objects
+    :return: return data
+    """
+    for i in range(n):
+        await asyncio.sleep(0)
+        yield TestServerObject(str(i), i)
@@ -1,6 +1,14 @@
 import unittest
 import os.path
+import urllib.parse
+from typing import List
+
+import flask
+import requests
+from requests.structures import CaseInsensitiveDict
+
 from pyrolysis.client import service
+from pyrolysis.server.service import ServerService
 
 
 class TestService(unittest.TestCase):
@@ -10,5 +18,85 @@ class TestService(unittest.TestCase):
         self.assertTrue(petshop.is_compatible_with(petshop))
 
 
+class FlaskAdapter(requests.adapters.BaseAdapter):
+    """
+    Sends the requests of a session to a flask application.
+    """
+
+    def __init__(self, app):
+        super().__init__()
+        self.client = app.test_client()
+        self.sent = 0
+
+    def send(self, request, **kwargs):
+        self.sent += 1
+        url = urllib.parse.urlsplit(request.url)
+        r = self.client.open(url.path, base_url=url.scheme + '://' + url.netloc, query_string=url.query,
+                             method=request.method, headers=dict(request.headers), data=request.body)
+        response = requests.Response()
+        response.status_code = r.status_code
+        response.headers = CaseInsensitiveDict(r.headers)
+        response._content = r.data
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        server = ServerService(flask.Flask('test'), batch=True)
+        items = {1: 'a', 2: 'b'}
+
+        @server.get('/items/<i>')
+        def get_item(i: int) -> str:
+            """
+            An item
+            """
+            return items[i]
+
+        @server.get('/numbers', page_size=3)
+        def get_numbers(n: int) -> List[int]:
+            """
+            The numbers below n
+            """
+            return (i for i in range(n))
+
+        @server.post('/echo')
+        def echo(d: dict) -> dict:
+            """
+            The body
+            """
+            return d
+
+        self.client = service.ClientService(base='http://test', api_key='key')
+        self.adapter = FlaskAdapter(server.flask)
+        self.client.session.mount('http://test', self.adapter)
+        self.client.load(text=server.flask.test_client().get('/swagger.json').data.decode())
+        self.api = self.client.build()
+
+    def test_batch(self):
+        with self.client.batch():
+            futures = [self.api.get_item(1), self.api.echo({'a': [1, 2]}), self.api.get_item(2),
+                       self.api.get_item(3)]
+        self.assertEqual(self.adapter.sent, 1)
+        self.assertEqual([f.result() for f in futures[:3]], ['a', {'a': [1, 2]}, 'b'])
+        self.assertIsNotNone(futures[3].exception())
+        self.assertEqual(self.api.get_item(1), 'a')
+
+    def test_max_calls(self):
+        with self.client.batch(max_calls=2):
+            futures = [self.api.get_item(1 + i % 2) for i in range(5)]
+        self.assertEqual(self.adapter.sent, 3)
+        self.assertEqual([f.result() for f in futures], ['a', 'b', 'a', 'b', 'a'])
+
+    def test_pages(self):
+        self.assertEqual(list(self.api.get_numbers(8)), list(range(8)))
+        self.assertEqual(self.adapter.sent, 3)
+        self.assertEqual(list(self.api.get_numbers(8, limit=5)), list(range(8)))
+        self.assertEqual(self.adapter.sent, 5)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,3 +1,4 @@
+import threading
 import unittest
 import time
 import os
@@ -57,6 +58,85 @@ class TestCache(unittest.TestCase):
         time.sleep(2)
         self.assertEqual(f(2), 5)
 
+    def test_response_cache(self):
+        from pyrolysis.common.cache import ResponseCache
+        c = ResponseCache(max_bytes=10, ttl=60)
+        c.put('a', b'aaaa', 4, '/items/1')
+        c.put('b', b'bbbb', 4, '/items')
+        self.assertEqual(c.get('a'), b'aaaa')
+        # b is the least recently used
+        c.put('c', b'cccc', 4, '/users/1')
+        self.assertIsNone(c.get('b'))
+        self.assertEqual(c.invalidate('/items'), 1)
+        self.assertIsNone(c.get('a'))
+        c.put('d', b'dd', 2, '/users', ttl=0)
+        time.sleep(0.01)
+        self.assertIsNone(c.get('d'))
+        c.put('e', b'e' * 11, 11)
+        self.assertEqual(c.stats(), {'hits': 1, 'misses': 3, 'evictions': 1, 'expirations': 1, 'invalidations': 1,
+                                     'entries': 1, 'bytes': 4})
+
+    def test_invalidate_segments(self):
+        from pyrolysis.common.cache import ResponseCache
+        c = ResponseCache(max_bytes=100, ttl=60)
+        c.put('a', b'a', 1, '/items')
+        c.put('b', b'b', 1, '/items/1')
+        c.put('c', b'c', 1, '/items_archive')
+        c.put('d', b'd', 1, '/items_archive/1')
+        self.assertEqual(c.invalidate('/items/'), 2)
+        self.assertEqual(c.get('c'), b'c')
+        self.assertEqual(c.invalidate('/items_archive'), 2)
+        c.put('e', b'e', 1, '/users')
+        self.assertEqual(c.invalidate(), 1)
+
+    def test_single_flight(self):
+        from pyrolysis.common.cache import SingleFlight
+        flights = SingleFlight(timeout=5)
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            release.wait(5)
+            if len(calls) == 1:
+                raise KeyError('x')
+            return len(calls)
+
+        results = []
+
+        def run():
+            try:
+                results.append(flights.do('k', slow))
+            except KeyError as e:
+                results.append(e)
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for t in threads:
+            t.start()
+        while flights.stats()['followers'] < 3:
+            time.sleep(0.001)
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(isinstance(r, KeyError) for r in results))
+        self.assertEqual(flights.do('k', slow), 2)
+        self.assertEqual(flights.stats(), {'leaders': 2, 'followers': 3, 'timeouts': 0, 'flights': 0})
+
+    def test_coalesced_cache(self):
+        from pyrolysis.common.cache import CacheObject
+        x = Toto()
+        calls = []
+        f = x.f
+        x.f = lambda v: calls.append(v) or time.sleep(0.05) or f(v)
+        cached = CacheObject(x, {}, coalesce=True)
+        threads = [threading.Thread(target=cached.f, args=(3,)) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(calls, [3])
+        self.assertEqual(cached.f(3), 9)
+
 
 if __name__ == '__main__':
     unittest.main()
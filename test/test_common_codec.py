@@ -0,0 +1,44 @@
+import unittest
+from pyrolysis.common import errors
+from pyrolysis.common.codec import CodecRegistry, FunctionCodec
+from pyrolysis.common.converter import Converter, application, text
+
+
+def upper_convert(converter, val, **kw):
+    return str(val).upper()
+
+
+def upper_revert(converter, val, **kw):
+    return val.lower()
+
+
+class TestCodec(unittest.TestCase):
+    def setUp(self):
+        self.converter = Converter()
+
+    def test_lookup(self):
+        codec, charset = self.converter.codecs.lookup('application/json; charset=latin-1')
+        self.assertEqual(codec.name, 'json')
+        self.assertEqual(charset, 'latin-1')
+        codec, charset = self.converter.codecs.lookup(text.csv)
+        self.assertEqual(codec.name, 'csv')
+        self.assertEqual(charset, 'UTF-8')
+        self.assertIs(self.converter.codecs.get(application.xml), self.converter.codecs.get(text.xml))
+
+    def test_unknown(self):
+        self.assertIsNone(self.converter.codecs.get('application/unknown'))
+        self.assertRaises(errors.BadRequest, self.converter.convert, 'application/unknown', 1)
+
+    def test_register(self):
+        registry = CodecRegistry()
+        registry.register(FunctionCodec('upper', upper_convert, upper_revert), 'application/x-upper')
+        self.converter.codecs = registry
+        self.assertEqual(self.converter.convert('application/x-upper', 'abc'), 'ABC')
+        self.assertEqual(self.converter.revert('application/x-upper; charset=utf-8', 'ABC'), 'abc')
+        stats = registry.stats()['upper']
+        self.assertEqual(stats['convert']['count'], 1)
+        self.assertEqual(stats['revert']['count'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
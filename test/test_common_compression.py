@@ -0,0 +1,42 @@
+import gzip
+import unittest
+import zlib
+
+from pyrolysis.common import compression, errors
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.data = b'id,name\n' + b''.join(b'%d,item %d\n' % (i, i) for i in range(1000))
+
+    def test_roundtrip(self):
+        for name, c in compression.compressions.items():
+            packed = c.compress(self.data)
+            self.assertLess(len(packed), len(self.data), name)
+            self.assertEqual(c.decompress(packed), self.data, name)
+            self.assertEqual(c.decompress(b''.join(c.stream([self.data[:100], self.data[100:]]))), self.data, name)
+
+    def test_stream(self):
+        chunks = list(compression.compressions['gzip'].stream([self.data[:100], self.data[100:]], 1))
+        self.assertEqual(gzip.decompress(b''.join(chunks)), self.data)
+        d = zlib.decompressobj(31)
+        self.assertEqual(d.decompress(chunks[0]), self.data[:100])
+
+    def test_get(self):
+        self.assertIsNone(compression.get(None))
+        self.assertIsNone(compression.get('identity'))
+        self.assertIs(compression.get('GZIP'), compression.compressions['gzip'])
+        self.assertRaises(errors.BadRequest, compression.get, 'unknown')
+        self.assertEqual(compression.decompress('deflate', zlib.compress(self.data)), self.data)
+
+    def test_max_size(self):
+        bomb = gzip.compress(bytes(10 * 1024 * 1024))
+        self.assertLess(len(bomb), 20000)
+        self.assertRaises(errors.PayloadTooLarge, compression.decompress, 'gzip', bomb, 1024 * 1024)
+        self.assertRaises(errors.PayloadTooLarge, compression.decompress, 'gzip', bomb, 10 * 1024 * 1024 - 1)
+        self.assertEqual(len(compression.decompress('gzip', bomb, 10 * 1024 * 1024)), 10 * 1024 * 1024)
+        self.assertEqual(compression.decompress('deflate', zlib.compress(self.data), len(self.data)), self.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,11 @@
+import array
+import io
 import unittest
+import requests
 from datetime import date, datetime
-from pyrolysis.common.converter import Converter
+from enum import Enum
+from pyrolysis.common import errors, has_arrow
+from pyrolysis.common.converter import Converter, application
 from dataclasses import dataclass, field
 
 
@@ -10,10 +15,26 @@ class TestObject:
     id: int = field()
 
 
+class Color(Enum):
+    RED = 1
+    BLUE = 2
+
+
+@dataclass
+class Event:
+    name: str = field()
+    day: date = field()
+    time: datetime = field()
+    color: Color = field()
+    owner: TestObject = field()
+
+
 class TestService(unittest.TestCase):
     def setUp(self):
         self.converter = Converter()
         self.converter.register(TestObject)
+        self.converter.register(Event)
+        self.converter.set_json_backend('json')
 
     def test_str_convert(self):
         self.assertEqual(self.converter.str_convert(1), '1')
@@ -30,6 +51,41 @@ class TestService(unittest.TestCase):
         self.assertEqual(self.converter.str_revert('2017-01-01T00:00:00', 'datetime', False), datetime(2017, 1, 1))
         self.assertEqual(self.converter.str_revert('True', 'bool', False), True)
         self.assertEqual(self.converter.str_revert('1,2,3', 'int', True), [1, 2, 3])
+        self.assertEqual(self.converter.str_revert('a,,b', str, True), ['a', None, 'b'])
+
+    def test_str_parser(self):
+        parse = self.converter.str_parser(date)
+        self.assertIs(parse, self.converter.str_parser(date))
+        self.assertEqual(parse('2017-01-01'), date(2017, 1, 1))
+        self.assertRaises(errors.BadRequest, parse, '2017-13-01')
+        self.assertRaises(errors.BadRequest, self.converter.str_parser(dict), 'a')
+        self.converter.numeric_arrays = 'array'
+        self.assertEqual(self.converter.str_parser(float, True)('1,2.5'), array.array('d', [1, 2.5]))
+        self.converter.numeric_arrays = 'numpy'
+        self.assertEqual(list(self.converter.str_parser(int, True)('1,2,3')), [1, 2, 3])
+        for kind in ['list', 'array', 'numpy']:
+            self.converter.numeric_arrays = kind
+            self.assertEqual(self.converter.str_parser(int, True)('1,,3,'), [1, None, 3, None])
+            self.assertRaises(errors.BadRequest, self.converter.str_parser(float, True), '1,x')
+        self.assertRaises(errors.BadRequest, self.converter.str_parser(int, True), '1,x,3')
+
+    def test_schema_convert(self):
+        data = [TestObject(name='a', id=1), TestObject(name='b', id=2)]
+        dumped = [{'name': 'a', 'id': 1}, {'name': 'b', 'id': 2}]
+        self.assertEqual(self.converter.schema_convert(data), dumped)
+        self.assertEqual(self.converter.schema_convert(iter(data)), dumped)
+        self.assertEqual(self.converter.schema_convert([data[0], 1, [data[1]]]), [dumped[0], 1, [dumped[1]]])
+        self.assertEqual(self.converter.schema_revert(dumped, TestObject), data)
+        self.assertEqual(self.converter.schema_revert(dumped, 'TestObject'), data)
+
+        @dataclass
+        class TestObject2:
+            name: str = field()
+        TestObject2.__name__ = 'TestObject'
+        self.assertIs(self.converter.schema_class('TestObject'), TestObject)
+        self.assertFalse(self.converter.is_registered(TestObject2))
+        obj = TestObject2(name='a')
+        self.assertEqual(self.converter.schema_convert([obj]), [obj])
 
     def test_json_convert(self):
         self.assertEqual(self.converter.json_convert(1), '1')
@@ -48,6 +104,36 @@ class TestService(unittest.TestCase):
         self.assertEqual(self.converter.json_revert('{"name": "hello", "id": 1}', 'TestObject'),
                          TestObject(name='hello', id=1))
 
+    def test_xml_stream(self):
+        data = [TestObject(name='a<b', id=i) for i in range(3)]
+        txt = ''.join(self.converter.xml_stream(iter(data)))
+        self.assertTrue(txt.startswith('<list><TestObject><name>a&lt;b</name><id type="int">0</id></TestObject>'))
+        self.assertEqual(self.converter.xml_convert(data), txt)
+        self.assertEqual(self.converter.xml_revert(txt, TestObject), data)
+        self.assertEqual(self.converter.xml_revert('<list><int>1</int><int>2</int></list>', int), [1, 2])
+        for body in ['', b' \n']:
+            self.assertRaises(errors.BadRequest, self.converter.xml_revert, body)
+
+    def test_json_stream(self):
+        gen = (TestObject(name=str(i), id=i) for i in range(3))
+        self.assertEqual(''.join(self.converter.json_stream(gen)),
+                         self.converter.json_convert([TestObject(name=str(i), id=i) for i in range(3)]))
+        self.assertEqual(''.join(self.converter.json_stream([])), '[]')
+        self.assertEqual(''.join(self.converter.json_stream({'a': 1})), '{"a": 1}')
+        data = [TestObject(name=str(i), id=i) for i in range(5)]
+        self.converter.stream_batch = 2
+        chunks = list(self.converter.json_stream(data, chunk_size=1))
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(''.join(chunks), self.converter.json_convert(data))
+
+    def test_ndjson(self):
+        data = [TestObject(name=str(i), id=i) for i in range(3)]
+        txt = self.converter.ndjson_convert(data)
+        self.assertEqual(txt, '{"name": "0", "id": 0}\n{"name": "1", "id": 1}\n{"name": "2", "id": 2}\n')
+        self.assertEqual(self.converter.ndjson_revert(txt, TestObject), data)
+        it = self.converter.ndjson_stream_revert(txt.encode(), 'TestObject')
+        self.assertEqual(next(it), data[0])
+
     def test_xml_convert(self):
         self.assertEqual(self.converter.xml_convert(1), '<int>1</int>')
         self.assertEqual(self.converter.xml_convert('a'), '<str>a</str>')
@@ -71,12 +157,92 @@ class TestService(unittest.TestCase):
         self.assertEqual(self.converter.csv_convert([TestObject(name='a', id=1), TestObject(name='b', id=2)]),
                          'id,name\n1,a\n2,b\n')
 
+    def test_csv_stream(self):
+        gen = (TestObject(name=str(i), id=i) for i in range(3))
+        self.assertEqual(''.join(self.converter.csv_stream(gen)), 'id,name\n0,0\n1,1\n2,2\n')
+        self.assertEqual(''.join(self.converter.csv_stream(iter([]))), '')
+        chunks = list(self.converter.csv_stream([{'a': i} for i in range(1000)], chunk_size=100))
+        self.assertGreater(len(chunks), 10)
+        self.assertEqual(''.join(chunks), self.converter.csv_convert([{'a': i} for i in range(1000)]))
+
     def test_csv_revert(self):
         self.assertEqual(self.converter.csv_revert('a,b\n1,2\n3,4', 'dict'),
                          [{'a': '1', 'b': '2'}, {'a': '3', 'b': '4'}])
         self.assertEqual(self.converter.csv_revert('name,id\na,1\nb,2', 'TestObject'),
                          [TestObject(name='a', id=1), TestObject(name='b', id=2)])
 
+    @unittest.skipUnless(has_arrow, 'pyarrow is not installed')
+    def test_arrow(self):
+        import pandas
+        df = pandas.DataFrame({'a': [1, 2, 3], 'b': [1.5, 2.5, None], 'c': ['x', 'y', 'z'],
+                               'd': pandas.to_datetime(['2020-01-01', '2020-01-02', '2020-01-03'])})
+        data = self.converter.arrow_convert(df)
+        res = self.converter.arrow_revert(data)
+        self.assertTrue(df.equals(res))
+        self.assertEqual(list(df.dtypes), list(res.dtypes))
+        chunks = list(self.converter.arrow_stream(df, chunk_rows=2))
+        batches = list(self.converter.arrow_stream_revert(b''.join(chunks)))
+        self.assertEqual([len(x) for x in batches], [2, 1])
+
+    def test_msgpack_ext(self):
+        data = [Event(name='e%d' % i, day=date(2020, 1, i + 1), time=datetime(2020, 1, 1, 12, 0, i), color=Color.RED,
+                      owner=TestObject(name='a', id=i)) for i in range(10)]
+        packed = self.converter.msgpack_ext_convert(iter(data))
+        self.assertLess(len(packed), len(self.converter.msgpack_convert(data)) * 0.7)
+        self.assertEqual(self.converter.msgpack_ext_revert(packed, Event), data)
+        self.assertEqual(list(self.converter.msgpack_ext_stream_revert(packed, 'Event')), data)
+        other = Converter.msgpack_ext.__class__()
+        res = other.unpackb(packed)
+        self.assertEqual(res[1], {'name': 'e1', 'day': date(2020, 1, 2), 'time': datetime(2020, 1, 1, 12, 0, 1),
+                                  'color': 'RED', 'owner': {'name': 'a', 'id': 1}})
+        self.assertEqual(self.converter.schema_revert(res, Event), data)
+
+    def test_layout(self):
+        data = [TestObject(name='a', id=1), TestObject(name='b', id=2)]
+        self.assertEqual(self.converter.layout_convert(data, 'rows'),
+                         {'fields': ['name', 'id'], 'rows': [['a', 1], ['b', 2]]})
+        self.assertEqual(self.converter.layout_convert(data, 'columns'), {'name': ['a', 'b'], 'id': [1, 2]})
+        for m in [application.json, application.msgpack]:
+            for layout in ['rows', 'columns']:
+                ct = m + '; layout=' + layout
+                self.assertEqual(self.converter.codec(ct).layout, layout)
+                self.assertEqual(self.converter.revert(ct, self.converter.convert(ct, data), cls=TestObject), data)
+                self.assertEqual(self.converter.revert(ct, self.converter.convert(ct, []), cls=TestObject), [])
+        self.assertEqual(self.converter.codec(application.json + '; charset=utf-8').name, 'json')
+        self.assertRaises(errors.BadRequest, self.converter.codec, application.json + '; layout=diagonal')
+
+    def test_pickle5(self):
+        import numpy
+        import pandas
+        df = pandas.DataFrame({'a': numpy.arange(100000), 'b': numpy.linspace(0, 1, 100000)})
+        data = self.converter.pickle5_convert(df)
+        self.assertEqual(data[:4], b'PYR5')
+        res = self.converter.pickle5_revert(data)
+        self.assertTrue(df.equals(res))
+        arr = self.converter.pickle5_revert(self.converter.pickle5_convert(numpy.arange(1000)))
+        self.assertFalse(arr.flags.owndata)
+        self.assertFalse(arr.flags.writeable)
+        self.assertEqual(arr.sum(), 499500)
+        source = numpy.arange(1000)
+        chunks = list(self.converter.pickle5_stream(source))
+        self.assertIsInstance(chunks[-1], memoryview)
+        self.assertTrue(numpy.shares_memory(numpy.frombuffer(chunks[-1], dtype=source.dtype), source))
+        obj = [TestObject(name='a', id=1)]
+        self.assertEqual(self.converter.pickle5_revert(self.converter.pickle5_convert(obj), TestObject), obj)
+        self.assertRaises(errors.BadRequest, self.converter.pickle5_revert, data[:100] + b'0' * 100)
+        self.assertTrue(self.converter.codec(application.pickle5).unsafe)
+
+    def test_stream_revert(self):
+        data = [TestObject(name='a,\nb', id=1), TestObject(name='c', id=2)]
+        for mimetype in [application.csv, application.msgpack, application.ndjson, application.json, application.xml]:
+            codec = self.converter.codec(mimetype)
+            encoded = codec.convert(self.converter, data)
+            response = requests.Response()
+            response.raw = io.BytesIO(encoded if isinstance(encoded, bytes) else encoded.encode())
+            it = codec.stream_revert(self.converter, response, cls=TestObject)
+            self.assertEqual(next(it), data[0])
+            self.assertEqual(list(it), data[1:])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,70 @@
+import json
+import unittest
+from datetime import date, datetime
+from enum import Enum, IntEnum
+
+from pyrolysis.common import errors  # noqa: F401, import order of pyrolysis.common
+from pyrolysis.common.converter import Converter
+from pyrolysis.common.json_backend import get_backend, enum_names, StdlibBackend
+
+
+class Color(Enum):
+    RED = 1
+    BLUE = 2
+
+
+class Size(IntEnum):
+    S = 1
+    L = 3
+
+
+class Shape(str, Enum):
+    ROUND = 'round'
+    SQUARE = 'square'
+
+
+class TestJSONBackend(unittest.TestCase):
+    def setUp(self):
+        self.reference = StdlibBackend()
+        self.backends = []
+        for name in ['orjson', 'ujson']:
+            try:
+                self.backends.append(get_backend(name))
+            except ImportError:
+                pass
+
+    def test_auto(self):
+        self.assertEqual(get_backend().name, self.backends[0].name if self.backends else 'json')
+
+    def test_dumps(self):
+        val = {'d': date(2020, 1, 2), 't': datetime(2020, 1, 2, 3, 4, 5, 6), 's': {1}, 'type': int,
+               'e': [Color.BLUE], 'n': None, 'f': 0.1, 'u': 'été/1', 1: 2}
+        for backend in self.backends:
+            res = backend.dumps(enum_names(val) if backend.needs_names else val)
+            self.assertEqual(json.loads(res), json.loads(self.reference.dumps(val)))
+
+    def test_enums(self):
+        val = {'c': Color.RED, 's': [Size.L], 'h': (Shape.ROUND,), 'set': {Color.BLUE}}
+        expected = {'c': 'RED', 's': [3], 'h': ['round'], 'set': ['BLUE']}
+        self.assertEqual(json.loads(self.reference.dumps(val)), expected)
+        self.assertEqual(enum_names(val), {'c': 'RED', 's': [Size.L], 'h': [Shape.ROUND], 'set': ['BLUE']})
+        converter = Converter()
+        for backend in [self.reference] + self.backends:
+            converter.set_json_backend(backend.name)
+            self.assertEqual(json.loads(converter.json_dumps(val)), expected, backend.name)
+
+    def test_options(self):
+        for backend in [self.reference] + self.backends:
+            self.assertRaises(ValueError, backend.dumps, [float('nan')], allow_nan=False)
+            self.assertEqual(json.loads(backend.dumps({'a': [1]}, indent=2)), {'a': [1]})
+            self.assertIn('\n', backend.dumps({'a': [1]}, indent=2))
+
+    def test_fallback(self):
+        for backend in self.backends:
+            self.assertEqual(backend.dumps([2 ** 70]), '[1180591620717411303424]')
+            self.assertEqual(backend.loads('[1180591620717411303424]'), [2 ** 70])
+            self.assertRaises(TypeError, backend.dumps, object())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from enum import Enum
+from typing import List, Optional
+
+import marshmallow
+import marshmallow_dataclass
+
+from pyrolysis.common import errors
+from pyrolysis.common.converter import Converter
+from pyrolysis.common.serializer import Serializer, compile_serializer, dump_errors, load_errors
+
+
+class Color(Enum):
+    RED = 1
+    BLUE = 2
+
+
+@dataclass
+class Owner:
+    id: int = field()
+    roles: List[str] = field()
+
+
+@dataclass
+class Thing:
+    name: str = field()
+    created: date = field()
+    updated: datetime = field()
+    color: Color = field()
+    owner: Owner = field()
+    weight: float = field()
+    comment: Optional[str] = None
+
+
+class Unsupported:
+    pass
+
+
+@dataclass
+class Other:
+    value: Unsupported = field()
+
+
+@dataclass
+class Positive:
+    n: int = field(metadata={'validate': marshmallow.validate.Range(min=0)})
+
+
+class TestSerializer(unittest.TestCase):
+    def setUp(self):
+        self.thing = Thing(name='a', created=date(2020, 1, 2), updated=datetime(2020, 1, 2, 3, 4, 5), color=Color.BLUE,
+                           owner=Owner(id=1, roles=['admin']), weight=1.5)
+        self.schema = marshmallow_dataclass.class_schema(Thing)()
+        self.serializer = compile_serializer(Thing)
+
+    def test_dump(self):
+        self.assertEqual(self.serializer.dump(self.thing), self.schema.dump(self.thing))
+
+    def test_load(self):
+        self.assertEqual(self.serializer.load(self.schema.dump(self.thing)), self.thing)
+        data = {'name': 'a', 'created': '2020-01-02', 'updated': '2020-01-02T03:04:05', 'color': 'BLUE',
+                'owner': {'id': '1', 'roles': ['admin']}, 'weight': '1.5'}
+        self.assertEqual(self.serializer.load(data), self.thing)
+
+    def test_invalid(self):
+        data = self.schema.dump(self.thing)
+        data['unknown'] = 1
+        self.assertRaises(load_errors, self.serializer.load, data)
+        data = self.schema.dump(self.thing)
+        del data['name']
+        self.assertRaises(load_errors, self.serializer.load, data)
+
+    def test_dump_errors(self):
+        self.thing.color = 2
+        self.assertRaises(dump_errors, self.serializer.dump, self.thing)
+        conv = Converter()
+        conv.register(Thing)
+
+        def broken(o):
+            raise RuntimeError('bug')
+        conv.serializers = dict(conv.serializers)
+        conv.serializers[Thing] = Serializer(Thing, broken, None)
+        self.assertRaises(RuntimeError, conv.schema_dump, self.thing, Thing)
+
+    def test_unsupported(self):
+        self.assertIsNone(compile_serializer(Other))
+
+    def test_validate(self):
+        self.assertIsNone(compile_serializer(Positive))
+        conv = Converter()
+        conv.register(Positive)
+        self.assertEqual(conv.schema_load({'n': 5}, Positive), Positive(n=5))
+        self.assertRaises(errors.BadRequest, conv.schema_load, {'n': -5}, Positive)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -74,6 +74,15 @@ class TestService(unittest.TestCase):
         res = self.serv.test_dataframe(a, _return=DataFrame)
         self.assertTrue(a.equals(res))
 
+    def test_stream(self):
+        res = self.serv.test_stream(3, _return=tst.TestServerObject)
+        self.assertEqual(res, [tst.TestServerObject(str(i), i) for i in range(3)])
+
+    def test_stream_iterator(self):
+        res = self.serv.test_stream(3, _return=tst.TestServerObject, _stream=True)
+        self.assertEqual(next(res), tst.TestServerObject('0', 0))
+        self.assertEqual(list(res), [tst.TestServerObject(str(i), i) for i in range(1, 3)])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,40 @@
+import threading
+import unittest
+
+import flask
+import requests
+
+from pyrolysis.common import errors  # noqa: F401, import order of pyrolysis.common
+from pyrolysis.server.command import PooledWSGIServer, is_ready, listen, load_app
+from pyrolysis.server.service import ServerService
+
+
+class TestLauncher(unittest.TestCase):
+    def setUp(self):
+        self.service = ServerService(flask.Flask('test'))
+
+    def test_pooled_server(self):
+        sock = listen('127.0.0.1', 0, reuse_port=True)
+        port = sock.getsockname()[1]
+        server = PooledWSGIServer('127.0.0.1', port, self.service.flask, threads=2, fd=sock.fileno())
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            with requests.Session() as session:
+                for _ in range(3):
+                    self.assertTrue(session.get('http://127.0.0.1:%d/health' % port).text.startswith('OK'))
+        finally:
+            server.drain()
+            thread.join(5)
+            sock.close()
+        self.assertFalse(thread.is_alive())
+
+    def test_ready(self):
+        self.assertIs(load_app(self.service), self.service.flask)
+        self.assertTrue(is_ready(self.service.flask))
+        self.service.flask.config['PYROLYSIS_DRAINING'] = True
+        self.assertFalse(is_ready(self.service.flask))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+from datetime import date
+from enum import Enum
+
+import flask
+
+from pyrolysis.common import errors
+from pyrolysis.server.parameter import Header, Path, Query, RequestPlan
+from pyrolysis.server.service import ServerService
+
+
+class Level(Enum):
+    LOW = 1
+    HIGH = 2
+
+
+def handler(p: int, q: str = 'a', h: float = None, **kwargs):
+    return p
+
+
+class TestRequestPlan(unittest.TestCase):
+    def setUp(self):
+        self.service = ServerService(flask.Flask('test'))
+        self.parameters = [Path('p', int, service=self.service), Query('q', str, service=self.service, defaultValue='a'),
+                           Header('h', float, service=self.service, exposed_name='X-H', required=False)]
+        for p in self.parameters:
+            p.resolve_codec()
+        self.plan = RequestPlan(handler, self.parameters)
+
+    def test_extract(self):
+        with self.service.flask.test_request_context('/1?q=b&z=3', headers={'X-H': '1.5'}) as ctx:
+            ctx.request.view_args = {'p': '1'}
+            self.assertEqual(self.plan.args(ctx.request), [1, 'b', 1.5])
+            self.assertEqual(self.plan.kwargs(ctx.request), {'z': '3'})
+            self.assertEqual(self.parameters[0].extract(), 1)
+        with self.service.flask.test_request_context('/x') as ctx:
+            ctx.request.view_args = {'p': 'x'}
+            with self.assertRaises(errors.BadRequest) as e:
+                self.plan.args(ctx.request)
+            self.assertEqual(e.exception.data['parameter'], 'p')
+            self.assertEqual(self.plan.extracted(ctx.request), [])
+            ctx.request.view_args = {'p': '2'}
+            self.assertEqual(self.plan.args(ctx.request), [2, 'a', None])
+        with self.service.flask.test_request_context('/1?q=b', headers={'X-H': 'x'}) as ctx:
+            ctx.request.view_args = {'p': '1'}
+            self.assertEqual(self.plan.extracted(ctx.request), [1, 'b'])
+
+    def test_scalar(self):
+        self.assertIsNone(self.plan.scalar)
+        parameters = [Path('p', int, service=self.service), Query('q', str, service=self.service, defaultValue='a'),
+                      Query('d', date, service=self.service, required=False)]
+        for p in parameters:
+            p.resolve_codec()
+        plan = RequestPlan(handler, parameters)
+        self.assertIsNotNone(plan.scalar)
+        with self.service.flask.test_request_context('/1?q=b&d=2020-01-02') as ctx:
+            ctx.request.view_args = {'p': '1'}
+            self.assertEqual(plan.args(ctx.request), [1, 'b', date(2020, 1, 2)])
+            ctx.request.view_args = {'p': 2}
+            self.assertEqual(plan.args(ctx.request), [2, 'b', date(2020, 1, 2)])
+        with self.service.flask.test_request_context('/x?q=&d=x') as ctx:
+            ctx.request.view_args = {'p': '3'}
+            with self.assertRaises(errors.BadRequest) as e:
+                plan.args(ctx.request)
+            self.assertEqual(e.exception.data['parameter'], 'd')
+            ctx.request.view_args = {'p': 'x'}
+            with self.assertRaises(errors.BadRequest) as e:
+                plan.args(ctx.request)
+            self.assertEqual(e.exception.data['parameter'], 'p')
+        with self.service.flask.test_request_context('/x') as ctx:
+            ctx.request.view_args = {'p': '3'}
+            self.assertEqual(plan.args(ctx.request), [3, 'a', None])
+
+    def test_enum(self):
+        p = Query('level', Level, service=self.service)
+        p.resolve_codec()
+        extract = p.extractor()
+        with self.service.flask.test_request_context('/?level=HIGH') as ctx:
+            self.assertEqual(extract(ctx.request), Level.HIGH)
+        with self.service.flask.test_request_context('/') as ctx:
+            self.assertRaises(errors.BadRequest, extract, ctx.request)
+        self.assertFalse(RequestPlan(lambda level: level, [p]).forward)
+
+
+if __name__ == '__main__':
+    unittest.main()
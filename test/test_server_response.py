@@ -0,0 +1,58 @@
+import gzip
+import unittest
+
+import flask
+
+from pyrolysis.common import errors  # noqa: F401, import order of pyrolysis.common
+from pyrolysis.common.converter import application, layout_mimetypes
+from pyrolysis.server.response import ResponsePlan
+from pyrolysis.server.service import ServerService
+
+
+class TestResponsePlan(unittest.TestCase):
+    def setUp(self):
+        self.service = ServerService(flask.Flask('test'))
+        self.service.set_json_backend('json')
+        self.plan = ResponsePlan(self.service, [application.json, application.xml], {'Cache-Control': 'no-cache'})
+
+    def test_negotiate(self):
+        kind, codec, comp = self.plan.negotiate('application/xml;q=0.9, application/json', 'gzip')
+        self.assertEqual(kind, application.json)
+        self.assertEqual(codec.name, 'json')
+        self.assertEqual(comp.name, 'gzip')
+        self.plan.negotiate('application/xml;q=0.9, application/json', 'gzip')
+        self.assertEqual(self.plan.negotiate.cache_info().hits, 1)
+        self.assertEqual(self.plan.negotiate('text/html', ''), (None, None, None))
+        self.assertEqual(self.plan.headers, {'Cache-Control': 'no-cache', 'Vary': 'Accept, Accept-Encoding'})
+
+    def test_layout(self):
+        plan = ResponsePlan(self.service, [application.json] + layout_mimetypes, {})
+        kind, codec, comp = plan.negotiate(application.json + '; layout=rows, */*;q=0.5', '')
+        self.assertEqual(kind, application.json + '; layout=rows')
+        self.assertEqual(codec.layout, 'rows')
+        self.assertEqual(plan.negotiate('*/*', '')[0], application.json)
+
+    def test_response(self):
+        with self.service.flask.test_request_context():
+            kind, codec, comp = self.plan.negotiate('*/*', 'gzip')
+            headers = dict(self.plan.headers)
+            self.assertEqual(self.plan.response({'a': 1}, kind, codec, comp, headers).get_data(), b'{"a": 1}')
+            self.assertNotIn('Content-Encoding', headers)
+            response = self.plan.response(iter([1, 2]), kind, codec, comp, headers)
+            self.assertEqual(gzip.decompress(response.get_data()), b'[1, 2]')
+            self.assertEqual(headers['Content-Encoding'], 'gzip')
+
+    def test_stream_threshold(self):
+        with self.service.flask.test_request_context():
+            kind, codec, comp = self.plan.negotiate('application/json', '')
+            response = self.plan.response([1, 2], kind, codec, comp, {})
+            self.assertFalse(response.is_streamed)
+            self.assertTrue(self.plan.response(iter([1, 2]), kind, codec, comp, {}).is_streamed)
+            self.service.stream_threshold = 1
+            response = self.plan.response([1, 2], kind, codec, comp, {})
+            self.assertTrue(response.is_streamed)
+            self.assertEqual(response.get_data(), b'[1, 2]')
+
+
+if __name__ == '__main__':
+    unittest.main()
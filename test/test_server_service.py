@@ -0,0 +1,358 @@
+import gzip
+import json
+import pickle
+import threading
+import time
+import unittest
+from datetime import date
+
+import flask
+import msgpack
+
+from pyrolysis.common import errors  # noqa: F401, import order of pyrolysis.common
+from pyrolysis.server.pagination import Pager
+from pyrolysis.server.service import ServerService
+from fixture import test_service
+
+
+class TestAsync(unittest.TestCase):
+    def setUp(self):
+        self.client = test_service.flsk.test_client()
+
+    def test_coroutine(self):
+        r = self.client.get('/test11?n=4', headers={'Accept': 'application/json'})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(test_service.app.json.loads(r.data), [0, 1, 2, 3])
+        r = self.client.get('/test11?n=x', headers={'Accept': 'application/json'})
+        self.assertEqual(r.status_code, 400)
+
+    def test_async_generator(self):
+        r = self.client.get('/test12?n=2', headers={'Accept': 'application/x-ndjson'})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(test_service.app.ndjson_revert(r.data, 'TestServerObject'),
+                         [test_service.TestServerObject('0', 0), test_service.TestServerObject('1', 1)])
+        self.assertTrue(test_service.app.event_loop() is test_service.app.event_loop())
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.service = ServerService(flask.Flask('test'))
+        self.calls = calls = []
+        items = {1: 'a'}
+
+        @self.service.get('/items/<i>', cache_ttl=60)
+        def get_item(i: int) -> str:
+            calls.append(i)
+            return items[i]
+
+        @self.service.put('/items/<i>')
+        def put_item(i: int, v: str) -> None:
+            items[i] = v
+
+        self.client = self.service.flask.test_client()
+
+    def test_cache(self):
+        for _ in range(2):
+            r = self.client.get('/items/1', headers={'Accept': 'application/json'})
+            self.assertEqual(r.data, b'"a"')
+        self.assertEqual(self.client.get('/items/1', headers={'Accept': 'application/xml'}).status_code, 200)
+        self.assertEqual(self.calls, [1, 1])
+        self.client.put('/items/1?v=b')
+        r = self.client.get('/items/1', headers={'Accept': 'application/json'})
+        self.assertEqual(r.data, b'"b"')
+        stats = self.service.cache_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['invalidations']), (1, 3, 2))
+
+
+class Versioned(list):
+    version = 1
+
+
+class TestETag(unittest.TestCase):
+    def setUp(self):
+        self.service = ServerService(flask.Flask('test'))
+
+        @self.service.get('/values', etag=True)
+        def get_values() -> list:
+            return Versioned([1, 2])
+
+        @self.service.get('/weak', etag='weak')
+        def get_weak() -> dict:
+            return {'a': 1}
+
+        self.client = self.service.flask.test_client()
+
+    def test_etag(self):
+        r = self.client.get('/values', headers={'Accept': 'application/json'})
+        tag = r.headers['ETag']
+        self.assertEqual(len(tag), 34)
+        encoded = self.service.codec('application/json').counters['convert'][0]
+        r = self.client.get('/values', headers={'Accept': 'application/json', 'If-None-Match': '"x", ' + tag})
+        self.assertEqual(r.status_code, 304)
+        # known version, not encoded again
+        self.assertEqual(self.service.codec('application/json').counters['convert'][0], encoded)
+        self.assertEqual(r.headers['ETag'], tag)
+        r = self.client.get('/values', headers={'Accept': 'application/xml', 'If-None-Match': tag})
+        self.assertEqual(r.status_code, 200)
+        self.assertNotEqual(r.headers['ETag'], tag)
+
+    def test_weak(self):
+        tag = self.client.get('/weak', headers={'Accept': 'application/json'}).headers['ETag']
+        self.assertTrue(tag.startswith('W/"'))
+        r = self.client.get('/weak', headers={'Accept': 'application/json', 'If-None-Match': tag[2:]})
+        self.assertEqual(r.status_code, 304)
+        r = self.client.get('/weak', headers={'Accept': 'application/json', 'If-None-Match': '*'})
+        self.assertEqual(r.status_code, 304)
+
+
+class TestCollections(unittest.TestCase):
+    def setUp(self):
+        self.service = ServerService(flask.Flask('test'))
+        self.calls = calls = []
+
+        @self.service.get('/notes', collection='notes', etag=True)
+        def get_notes() -> list:
+            calls.append(1)
+            return ['a'] * len(calls)
+
+        @self.service.post('/notes', collection='notes')
+        def add_note(v: str) -> None:
+            pass
+
+        self.client = self.service.flask.test_client()
+
+    def test_registry(self):
+        versions = self.service.versions
+        self.assertEqual(versions.read('other'), (0, 0))
+        self.assertEqual(versions.bump('other'), 1)
+        self.assertEqual(versions.bump('other'), 2)
+        self.assertIsNotNone(versions.modified('other'))
+        self.assertIsNone(ServerService(flask.Flask('other')).versions)
+
+    def test_concurrent_reads(self):
+        versions = self.service.versions
+        writer = threading.Thread(target=lambda: [versions.bump('busy') for _ in range(2000)])
+        writer.start()
+        last = (0, 0)
+        while writer.is_alive():
+            state = versions.read('busy')
+            self.assertGreaterEqual(state[0], 0)
+            self.assertGreaterEqual(state, last)
+            last = state
+        writer.join()
+        self.assertEqual(versions.version('busy'), 2000)
+
+    def test_not_modified(self):
+        accept = {'Accept': 'application/json'}
+        r = self.client.get('/notes', headers=accept)
+        self.assertNotIn('Last-Modified', r.headers)
+        self.client.post('/notes?v=a')
+        r = self.client.get('/notes', headers=accept)
+        modified, tag = r.headers['Last-Modified'], r.headers['ETag']
+        r = self.client.get('/notes', headers=dict(accept, **{'If-Modified-Since': modified}))
+        self.assertEqual(r.status_code, 304)
+        r = self.client.get('/notes', headers=dict(accept, **{'If-None-Match': tag}))
+        self.assertEqual(r.status_code, 304)
+        self.assertEqual(len(self.calls), 2)
+        self.client.post('/notes?v=b')
+        r = self.client.get('/notes', headers=dict(accept, **{'If-None-Match': tag}))
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(self.calls), 3)
+
+
+class TestLogs(unittest.TestCase):
+    def test_call_info(self):
+        service = ServerService(flask.Flask('test'))
+
+        @service.get('/items/<i>')
+        def get_item(i: int, q: str = 'a') -> str:
+            raise errors.NotFound(item=i)
+
+        with self.assertLogs(service.logger, 'ERROR') as logs:
+            r = service.flask.test_client().get('/items/3?q=b', headers={'Accept': 'application/json'})
+        self.assertEqual(r.status_code, 404)
+        self.assertEqual(logs.records[0].msg['args'], {'i': '3', 'q': "'b'"})
+
+
+class TestTrusted(unittest.TestCase):
+    def setUp(self):
+        self.service = ServerService(flask.Flask('test'))
+
+        @self.service.post('/echo')
+        def echo(d: dict) -> dict:
+            return d
+
+        @self.service.post('/trusted', trusted=True)
+        def trusted(d: dict) -> dict:
+            return d
+
+        self.client = self.service.flask.test_client()
+
+    def test_pickle(self):
+        body = pickle.dumps({'a': 1})
+        r = self.client.post('/echo', data=body, content_type='application/pickle')
+        self.assertEqual(r.status_code, 415)
+        r = self.client.post('/trusted', data=body, content_type='application/pickle',
+                             headers={'Accept': 'application/json'})
+        self.assertEqual(json.loads(r.data), {'a': 1})
+
+
+class ParallelService(ServerService):
+    batch_threads = 4
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.service = ParallelService(flask.Flask('test'), batch=True)
+        self.items = items = {1: 'a', 2: 'b'}
+
+        @self.service.get('/items/<i>')
+        def get_item(i: int) -> str:
+            return items[i]
+
+        @self.service.put('/items/<i>')
+        def put_item(i: int, v: str) -> None:
+            items[i] = v
+
+        @self.service.post('/echo')
+        def echo(d: dict) -> dict:
+            return d
+
+        self.client = self.service.flask.test_client()
+
+    def test_json(self):
+        calls = [['get_item', {'i': 1}], ['echo', {'d': {'a': [1, 2]}}], ['get_item', {'i': 'x'}], ['unknown', {}]]
+        r = self.client.post('/batch', data=json.dumps(calls), content_type='application/json')
+        self.assertEqual(r.status_code, 200)
+        res = json.loads(r.data)
+        self.assertEqual([x['status'] for x in res], [200, 200, 400, 404])
+        self.assertEqual(json.loads(res[0]['body']), 'a')
+        self.assertEqual(json.loads(res[1]['body']), {'a': [1, 2]})
+
+    def test_msgpack(self):
+        self.client.post('/batch', data=msgpack.packb([['put_item', {'i': 2, 'v': 'c'}]]),
+                         content_type='application/msgpack')
+        calls = [['get_item', {'i': i % 2 + 1}] for i in range(20)]
+        r = self.client.post('/batch', data=msgpack.packb(calls), content_type='application/msgpack',
+                             headers={'Accept': 'application/msgpack'})
+        res = msgpack.unpackb(r.data, raw=False)
+        bodies = [self.service.revert(x['headers']['Content-Type'], x['body'], cls=str) for x in res]
+        self.assertEqual(bodies, ['c' if i % 2 else 'a' for i in range(20)])
+
+    def test_limit(self):
+        r = self.client.post('/batch', data=json.dumps([['get_item', {'i': 1}]] * 1001),
+                             content_type='application/json')
+        self.assertEqual(r.status_code, 400)
+
+    def test_decompressed_size(self):
+        self.service.flask.config['MAX_CONTENT_LENGTH'] = 1024 * 1024
+        body = gzip.compress(json.dumps({'a': 'x' * 2 * 1024 * 1024}).encode())
+        r = self.client.post('/echo', data=body, content_type='application/json', headers={'Content-Encoding': 'gzip'})
+        self.assertEqual(r.status_code, 413)
+        r = self.client.post('/batch', data=body, content_type='application/json', headers={'Content-Encoding': 'gzip'})
+        self.assertEqual(r.status_code, 413)
+        body = gzip.compress(json.dumps({'a': 'x'}).encode())
+        r = self.client.post('/echo', data=body, content_type='application/json',
+                             headers={'Content-Encoding': 'gzip', 'Accept': 'application/json'})
+        self.assertEqual(json.loads(r.data), {'a': 'x'})
+
+
+class TestPagination(unittest.TestCase):
+    def setUp(self):
+        self.service = ServerService(flask.Flask('test'))
+        self.calls = calls = []
+
+        @self.service.get('/numbers', page_size=3)
+        def get_numbers(n: int) -> list:
+            return (i for i in range(n))
+
+        @self.service.get('/keyed', page_size=2, page_key='id')
+        def get_keyed() -> list:
+            return [{'id': i * 10} for i in range(5)]
+
+        @self.service.get('/unsorted', page_size=2, page_key='id')
+        def get_unsorted() -> list:
+            return iter([{'id': i} for i in [3, 1, 4, 0, 2]])
+
+        @self.service.get('/sorted', page_size=2, page_key='id', page_sorted=True)
+        def get_sorted() -> list:
+            for i in range(5):
+                calls.append(i)
+                yield {'id': i}
+
+        @self.service.get('/dated', page_size=2, page_key='day')
+        def get_dated() -> list:
+            return [{'day': date(2020, 1, i)} for i in [3, 1, 2]]
+
+        self.client = self.service.flask.test_client()
+
+    def pages(self, url):
+        res = []
+        while url:
+            r = self.client.get(url, headers={'Accept': 'application/json'})
+            self.assertEqual(r.status_code, 200)
+            res.append(json.loads(r.data))
+            link = r.headers.get('Link')
+            url = link and link[1:link.index('>')]
+        return res
+
+    def test_offset(self):
+        self.assertEqual(self.pages('/numbers?n=8'), [[0, 1, 2], [3, 4, 5], [6, 7]])
+        self.assertEqual(self.pages('/numbers?n=8&limit=4'), [[0, 1, 2, 3], [4, 5, 6, 7]])
+        r = self.client.get('/numbers?n=8&cursor=abc', headers={'Accept': 'application/json'})
+        self.assertEqual(r.status_code, 400)
+
+    def test_keyset(self):
+        self.assertEqual(self.pages('/keyed?limit=3'), [[{'id': 0}, {'id': 10}, {'id': 20}], [{'id': 30}, {'id': 40}]])
+
+    def test_keyset_unsorted(self):
+        self.assertEqual(self.pages('/unsorted'), [[{'id': 0}, {'id': 1}], [{'id': 2}, {'id': 3}], [{'id': 4}]])
+
+    def test_keyset_sorted(self):
+        self.assertEqual(self.pages('/sorted'), [[{'id': 0}, {'id': 1}], [{'id': 2}, {'id': 3}], [{'id': 4}]])
+        self.assertEqual(self.calls, [0, 1, 2, 0, 1, 2, 3, 4, 0, 1, 2, 3, 4])
+
+    def test_keyset_types(self):
+        self.assertEqual(self.pages('/dated'), [[{'day': '2020-01-01'}, {'day': '2020-01-02'}], [{'day': '2020-01-03'}]])
+        import pandas
+        pager = Pager(2, 'name')
+        items, cursor = pager.page(pandas.DataFrame({'name': ['c', 'a', 'b']}))
+        self.assertEqual(list(items['name']), ['a', 'b'])
+        items, cursor = pager.page(pandas.DataFrame({'name': ['c', 'a', 'b']}), cursor)
+        self.assertEqual((list(items['name']), cursor), (['c'], None))
+
+
+class TestCoalesce(unittest.TestCase):
+    def setUp(self):
+        self.service = ServerService(flask.Flask('test'))
+        self.release = release = threading.Event()
+        self.calls = calls = []
+
+        @self.service.get('/slow', coalesce=True)
+        def get_slow(n: int) -> list:
+            calls.append(n)
+            release.wait(5)
+            return list(range(n))
+
+        self.client = self.service.flask.test_client()
+
+    def test_coalesce(self):
+        results = []
+        get = lambda: results.append(self.client.get('/slow?n=3', headers={'Accept': 'application/json'}))
+        threads = [threading.Thread(target=get) for _ in range(4)]
+        for t in threads:
+            t.start()
+        while self.service.flights.stats()['followers'] < 3:
+            time.sleep(0.001)
+        self.release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(self.calls, [3])
+        self.assertEqual([(r.status_code, json.loads(r.data)) for r in results], [(200, [0, 1, 2])] * 4)
+        self.assertEqual(results[0].headers['Content-Type'], 'application/json')
+        self.client.get('/slow?n=3', headers={'Accept': 'application/json'})
+        self.assertEqual(self.calls, [3, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()